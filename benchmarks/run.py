@@ -0,0 +1,331 @@
+"""
+Benchmark the ingest and query paths against a local gunicorn instance.
+
+Usage: python -m benchmarks.run [--minute-rows N] [--output FILE] [--compare FILE]
+
+The benchmark creates a throwaway database in a temporary directory, fills it
+with synthetic records shaped by the columns file, starts gunicorn with
+`gunicorn_conf.py` (so the `GUNICORN_*` environment variables select the
+server profile), and measures the throughput and latency of every scenario.
+The results are written to a JSON file, which a later run can compare against.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from http.client import HTTPConnection
+from pathlib import Path
+from statistics import mean
+from typing import Callable, Dict, List
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+MINUTE_START = datetime(2020, 1, 1)
+DAILY_START = date(2020, 1, 1)
+RANGE_SPANS = {
+    "1h": timedelta(hours=1),
+    "1d": timedelta(days=1),
+    "7d": timedelta(days=7),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--minute-rows", type=int, default=1_000_000)
+    parser.add_argument("--daily-rows", type=int, default=3650)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--compare", help="a previous output file to compare with")
+    return parser.parse_args()
+
+
+def set_up_environment(work_dir: Path):
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ["DB_PATH"] = str(work_dir / "db.sqlite3")
+    os.environ["CACHE_DIR"] = str(work_dir / "cache")
+    os.environ["DJANGO_SETTINGS_MODULE"] = "my_api.settings"
+
+
+def set_up_database(minute_rows: int, daily_rows: int) -> str:
+    """Create the schema, load the synthetic records, and return an API token."""
+
+    for command in (["makemigrations", "solax_registers"], ["migrate"]):
+        subprocess.run(
+            [sys.executable, "manage.py", *command, "-v", "0"], cwd=BASE_DIR, check=True
+        )
+
+    import django
+
+    django.setup()
+
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from rest_framework.authtoken.models import Token
+
+    from solax_registers.bulk import bulk_insert, relaxed_durability
+    from solax_registers.models import STATS_TABLES, columns_config
+    from solax_registers.synthetic import generate_rows, get_column_names
+
+    datasets = [
+        ("minute_stats", MINUTE_START, minute_rows, timedelta(minutes=1)),
+        ("daily_stats", DAILY_START, daily_rows, timedelta(days=1)),
+    ]
+    with relaxed_durability():
+        for table_name, start, count, step in datasets:
+            table = STATS_TABLES[table_name]
+            column_info = columns_config[table_name]
+            started = time.perf_counter()
+            bulk_insert(
+                table.model,
+                get_column_names(column_info, table.date_column),
+                generate_rows(column_info, start, count, step),
+            )
+            print(
+                f"Loaded {count} {table_name} rows in "
+                f"{time.perf_counter() - started:.1f}s"
+            )
+
+    user = get_user_model().objects.create_superuser("benchmark", password=None)
+    token = Token.objects.create(user=user)
+    connection.close()
+    return token.key
+
+
+class Client:
+    """A keep-alive HTTP client, one per thread."""
+
+    def __init__(self, port: int, token: str):
+        self.connection = HTTPConnection("127.0.0.1", port)
+        self.headers = {
+            "Authorization": "Token " + token,
+            "Content-Type": "application/json",
+        }
+
+    def request(self, method: str, url: str, body=None) -> int:
+        payload = None if body is None else json.dumps(body)
+        self.connection.request(method, url, payload, self.headers)
+        response = self.connection.getresponse()
+        response.read()
+        return response.status
+
+
+def wait_for_server(port: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/healthz")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not start")
+
+
+def run_scenario(
+    port: int,
+    token: str,
+    requests: List[tuple],
+    concurrency: int,
+    expected_status: int,
+) -> Dict[str, float]:
+    """Send `(method, url, body)` requests from `concurrency` threads."""
+
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    pending = iter(requests)
+
+    def worker():
+        nonlocal errors
+        client = Client(port, token)
+        while True:
+            with lock:
+                request = next(pending, None)
+            if request is None:
+                return
+            started = time.perf_counter()
+            status = client.request(*request)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                errors += status != expected_status
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(latencies) / duration, 2),
+        "latency_ms": {
+            "mean": round(mean(latencies) * 1000, 3),
+            "p50": round(_percentile(latencies, 0.5) * 1000, 3),
+            "p90": round(_percentile(latencies, 0.9) * 1000, 3),
+            "p99": round(_percentile(latencies, 0.99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3),
+        },
+    }
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def get_scenarios(args) -> Dict[str, Callable[[], tuple]]:
+    """Return the scenarios as `name -> (requests, concurrency, expected status)`."""
+
+    from solax_registers.models import columns_config
+    from solax_registers.synthetic import generate_rows, get_column_names
+
+    minute_columns = columns_config["minute_stats"]
+    column_names = get_column_names(minute_columns, "upload_time")
+    data_end = MINUTE_START + timedelta(minutes=args.minute_rows)
+
+    def post_requests(start: datetime, count: int) -> List[tuple]:
+        rows = generate_rows(minute_columns, start, count, timedelta(minutes=1), seed=1)
+        return [
+            ("POST", "/minute-stats/", dict(zip(column_names, row))) for row in rows
+        ]
+
+    def range_requests(span: timedelta) -> List[tuple]:
+        requests = []
+        for index in range(args.requests):
+            since = MINUTE_START + (index * timedelta(hours=7)) % max(
+                data_end - MINUTE_START - span, timedelta(hours=1)
+            )
+            query = f"since={since.isoformat()}&before={(since + span).isoformat()}"
+            requests.append(("GET", "/minute-stats/?" + query, None))
+        return requests
+
+    def delete_requests() -> List[tuple]:
+        days = max(1, min(10, args.minute_rows // 1440 // 2))
+        return [
+            (
+                "DELETE",
+                "/minute-stats/?action=delete_older_than&args="
+                + (MINUTE_START + timedelta(days=index + 1)).isoformat(),
+                None,
+            )
+            for index in range(days)
+        ]
+
+    scenarios = {
+        "single_post": lambda: (post_requests(data_end, args.requests), 1, 201),
+        "bulk_post": lambda: (
+            post_requests(data_end + timedelta(days=365), args.requests * 5),
+            args.concurrency,
+            201,
+        ),
+        "last_record_get": lambda: (
+            [("GET", "/minute-stats/", None)] * args.requests,
+            args.concurrency,
+            200,
+        ),
+    }
+    for name, span in RANGE_SPANS.items():
+        scenarios[f"range_get_{name}"] = lambda span=span: (
+            range_requests(span),
+            args.concurrency,
+            200,
+        )
+    scenarios["retention_delete"] = lambda: (delete_requests(), 1, 200)
+    return scenarios
+
+
+def compare(results: dict, previous_path: str):
+    previous = json.loads(Path(previous_path).read_text(encoding="utf-8"))["results"]
+
+    print(f"\n{'scenario':<20}{'req/s':>12}{'change':>10}{'p50 ms':>12}{'change':>10}")
+    for name, result in results.items():
+        if name not in previous:
+            continue
+        old = previous[name]
+        throughput, old_throughput = result["throughput_rps"], old["throughput_rps"]
+        p50, old_p50 = result["latency_ms"]["p50"], old["latency_ms"]["p50"]
+        print(
+            f"{name:<20}{throughput:>12.1f}{_change(throughput, old_throughput):>10}"
+            f"{p50:>12.2f}{_change(p50, old_p50):>10}"
+        )
+
+
+def _change(value: float, old_value: float) -> str:
+    if old_value == 0:
+        return "n/a"
+    return f"{(value - old_value) / old_value * 100:+.1f}%"
+
+
+def main():
+    args = parse_args()
+    sys.path.insert(0, str(BASE_DIR))
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        set_up_environment(Path(work_dir))
+        token = set_up_database(args.minute_rows, args.daily_rows)
+
+        environment = {**os.environ, "REST_API_ADDRESS": f"127.0.0.1:{args.port}"}
+        server = subprocess.Popen(
+            ["gunicorn", "-c", "gunicorn_conf.py"],
+            cwd=BASE_DIR,
+            env=environment,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_for_server(args.port)
+            results = {}
+            for name, get_scenario in get_scenarios(args).items():
+                requests, concurrency, expected_status = get_scenario()
+                results[name] = run_scenario(
+                    args.port, token, requests, concurrency, expected_status
+                )
+                print(
+                    f"{name}: {results[name]['throughput_rps']} req/s, "
+                    f"p50 {results[name]['latency_ms']['p50']} ms, "
+                    f"errors {results[name]['errors']}"
+                )
+        finally:
+            server.terminate()
+            server.wait()
+
+    output = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "minute_rows": args.minute_rows,
+            "daily_rows": args.daily_rows,
+            "concurrency": args.concurrency,
+            "server": {
+                key: value
+                for key, value in os.environ.items()
+                if key.startswith("GUNICORN_")
+            },
+        },
+        "results": results,
+    }
+    Path(args.output).write_text(json.dumps(output, indent=2), encoding="utf-8")
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
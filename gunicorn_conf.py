@@ -1,9 +1,125 @@
+from multiprocessing import cpu_count
 from os import environ
+from pathlib import Path
+from shutil import rmtree
 
-wsgi_app = "my_api.wsgi:application"
-workers = 3
+WORKER_CLASSES = {
+    "sync": "sync",
+    "gthread": "gthread",
+    "uvicorn": "uvicorn.workers.UvicornWorker",
+}
+BASE_DIR = Path(__file__).resolve().parent
+APPS = {
+    "sync": "my_api.wsgi:application",
+    "gthread": "my_api.wsgi:application",
+    "uvicorn": "my_api.asgi:application",
+}
+
+
+def _get_bool(name: str, default: bool) -> bool:
+    value = environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+def _get_int(name: str, default: int) -> int:
+    value = environ.get(name)
+    if value is None or value == "":
+        return default
+    return int(value)
+
+
+def _get_worker_profile() -> str:
+    profile = environ.get("GUNICORN_WORKER_CLASS", "sync")
+    if profile not in WORKER_CLASSES:
+        error_msg = f"Invalid worker class; must be {' or '.join(WORKER_CLASSES)}"
+        raise ValueError(error_msg)
+    return profile
+
+
+def _get_workers(profile: str) -> int:
+    """
+    Return the number of worker processes.
+
+    `GUNICORN_WORKERS=auto` sizes the pool from the number of CPUs: the usual
+    `2 * CPUs + 1` for blocking sync workers, and one process per CPU for the
+    thread and event loop based workers, which already overlap I/O.
+    """
+
+    value = environ.get("GUNICORN_WORKERS", "3")
+    if value != "auto":
+        return int(value)
+    if profile == "sync":
+        return cpu_count() * 2 + 1
+    return cpu_count()
+
+
+worker_profile = _get_worker_profile()
+
+wsgi_app = APPS[worker_profile]
+worker_class = WORKER_CLASSES[worker_profile]
+workers = _get_workers(worker_profile)
+threads = _get_int("GUNICORN_THREADS", 4 if worker_profile == "gthread" else 1)
+preload_app = _get_bool("GUNICORN_PRELOAD", False)
+max_requests = _get_int("GUNICORN_MAX_REQUESTS", 0)
+max_requests_jitter = _get_int("GUNICORN_MAX_REQUESTS_JITTER", 0)
+keepalive = _get_int("GUNICORN_KEEPALIVE", 2)
+backlog = _get_int("GUNICORN_BACKLOG", 2048)
+timeout = _get_int("GUNICORN_TIMEOUT", 30)
 bind = environ.get("REST_API_ADDRESS", "127.0.0.1:8000")
 
 accesslog = "-"
-access_log_format = '"%(r)s" %(s)s %(b)s'
+access_log_format = '"%(r)s" %(s)s %(b)s %(M)sms'
 errorlog = "-"
+
+
+def on_starting(server):
+    """
+    Migrate the database if its schema changed, and forget the metrics, the
+    recent windows, the range cache, the query flights and the snapshots left
+    by the workers of a previous run.
+    """
+
+    from solax_registers.schema import migrate_if_changed
+
+    migrate_if_changed()
+
+    cache_dir = Path(environ.get("CACHE_DIR", BASE_DIR / "cache"))
+    rmtree(environ.get("METRICS_DIR", cache_dir / "metrics"), ignore_errors=True)
+    rmtree(cache_dir / "recent", ignore_errors=True)
+    rmtree(cache_dir / "range-cache", ignore_errors=True)
+    rmtree(cache_dir / "flights", ignore_errors=True)
+    rmtree(cache_dir / "snapshots", ignore_errors=True)
+
+
+def worker_exit(server, worker):
+    """Write the last metrics of a worker before it exits."""
+
+    from django.conf import settings
+
+    from solax_registers.metrics import flush
+
+    # A worker which never loaded the application has no metrics.
+    if settings.configured:
+        flush(force=True)
+
+
+def child_exit(server, worker):
+    """Merge the metrics of a worker which exited into the ones of the others."""
+
+    from solax_registers.metrics import merge_exited
+
+    cache_dir = Path(environ.get("CACHE_DIR", BASE_DIR / "cache"))
+    merge_exited(environ.get("METRICS_DIR", cache_dir / "metrics"), worker.pid)
+
+
+def post_worker_init(worker):
+    """Fill the recent windows before the first worker serves requests."""
+
+    from django.db import connection
+
+    from solax_registers.recent import fill_windows
+
+    fill_windows()
+    connection.close()
@@ -39,18 +39,20 @@ INSTALLED_APPS = [
     "django.contrib.staticfiles",
     # third-party
     "rest_framework",
+    "rest_framework.authtoken",
     "drf_spectacular",
     "drf_spectacular_sidecar",
 ]
 
 MIDDLEWARE = [
+    "solax_registers.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
-    "django.contrib.sessions.middleware.SessionMiddleware",
+    "solax_registers.middleware.SessionMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
-    "django.contrib.auth.middleware.AuthenticationMiddleware",
-    "django.contrib.messages.middleware.MessageMiddleware",
+    "solax_registers.middleware.AuthenticationMiddleware",
+    "solax_registers.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
@@ -93,9 +95,20 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": environ.get("DB_PATH", BASE_DIR / "db.sqlite3"),
+        "CONN_MAX_AGE": int(environ.get("DB_CONN_MAX_AGE", 600)),
         "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "cached_statements": 256,
+        },
     }
 }
+# Set once per connection, which persistent connections keep, by a
+# `connection_created` receiver: `init_command` needs Django 5.1.
+SQLITE_PRAGMAS = {
+    "cache_size": "-16384",
+    "temp_store": "MEMORY",
+    "mmap_size": "268435456",
+}
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -113,7 +126,43 @@ USE_TZ = True
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "auth": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "auth",
+    },
+}
+AUTH_CACHE_TTL = int(environ.get("AUTH_CACHE_TTL", 300))
+CACHE_DIR = Path(environ.get("CACHE_DIR", BASE_DIR / "cache"))
+METRICS_DIR = Path(environ.get("METRICS_DIR", CACHE_DIR / "metrics"))
+METRICS_FLUSH_INTERVAL = float(environ.get("METRICS_FLUSH_INTERVAL", 1))
+PROFILE_DIR = environ.get("PROFILE_DIR")
+RECENT_WINDOW_HOURS = int(environ.get("RECENT_WINDOW_HOURS", 0))
+RANGE_CACHE_MB = int(environ.get("RANGE_CACHE_MB", 0))
+COALESCING_TIMEOUT = float(environ.get("COALESCING_TIMEOUT", 10))
+IMPORT_SLOTS = int(environ.get("IMPORT_SLOTS", 1))
+READ_SLOTS = int(environ.get("READ_SLOTS", 0))
+READ_SLOT_TIMEOUT = float(environ.get("READ_SLOT_TIMEOUT", 2))
+ROW_BUDGET = int(environ.get("ROW_BUDGET", 0))
+# The row budgets of some users, as `username=rows,...`.
+USER_ROW_BUDGETS = {
+    username: int(rows)
+    for username, rows in (
+        budget.split("=")
+        for budget in environ.get("USER_ROW_BUDGETS", "").split(",")
+        if budget
+    )
+}
+
 REST_FRAMEWORK = {
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "rest_framework.authentication.SessionAuthentication",
+        "rest_framework.authentication.BasicAuthentication",
+        "solax_registers.authentication.CachedTokenAuthentication",
+    ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
         "solax_registers.permissions.HasModelPermission",
@@ -181,7 +230,7 @@ LOGGING = {
     },
 }
 
-DATABASES["default"]["MAX_CONN_AGE"] = SESSION_COOKIE_AGE = CSRF_COOKIE_AGE = 3600 * 24
+SESSION_COOKIE_AGE = CSRF_COOKIE_AGE = 3600 * 24
 KB = 1024
 MB = 1024 * KB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 1 * MB
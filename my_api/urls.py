@@ -19,7 +19,7 @@ from django.contrib import admin
 from django.urls import include, path
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
-from solax_registers.views import Healthz, index
+from solax_registers.views import Healthz, Metrics, Snapshot, index
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -32,5 +32,7 @@ urlpatterns = [
     path("schema/", SpectacularAPIView.as_view(), name="schema"),
     path("", include("solax_registers.urls")),
     path("healthz", Healthz.as_view(), name="healthz"),
+    path("metrics", Metrics.as_view(), name="metrics"),
+    path("snapshot", Snapshot.as_view(), name="snapshot"),
     path("", index, name="home"),
 ]
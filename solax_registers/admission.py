@@ -0,0 +1,86 @@
+"""
+Admission control between the live writes, the bulk writes and the reads.
+
+SQLite has a single write lock, and its busy handler is not fair: a bulk
+write committing a batch takes the lock again right away, while a live `POST`
+waiting for it sleeps and retries, until it fails with "database is locked".
+So every `POST` marks itself with a shared `flock` on a file in
+`CACHE_DIR/admission` while it writes, and the bulk writes wait until no `POST`
+holds it before each of their batches.
+
+The imports through the API and the range queries read from the database
+also each take one of a bounded number of slots shared by the workers, so that
+they cannot take every worker. A request that gets no slot is answered with
+`429 Too Many Requests` and a `Retry-After` header.
+"""
+
+import fcntl
+from contextlib import contextmanager
+from pathlib import Path
+from time import monotonic, sleep
+
+from django.conf import settings
+
+from . import metrics
+from .constants import response_templates
+from .locks import WAIT_PAUSE, open_lock_file, try_lock, wait_lock
+from .utils import ResponseException
+
+# The longest time a batch of a bulk write waits for the live writes.
+MAX_YIELD = 5
+RETRY_AFTER = {"import": 30, "read": 1}
+
+
+@contextmanager
+def live_write():
+    """Mark a live write, which the bulk writes let go first, while it runs."""
+
+    with open_lock_file(_get_directory() / "live.lock") as lock:
+        fcntl.flock(lock, fcntl.LOCK_SH)
+        yield
+
+
+def yield_to_live_writes():
+    """Wait until no live write runs, for at most `MAX_YIELD` seconds."""
+
+    with open_lock_file(_get_directory() / "live.lock") as lock:
+        wait_lock(lock, fcntl.LOCK_EX, MAX_YIELD)
+
+
+@contextmanager
+def slot(pool: str, size: int, timeout: float = 0):
+    """
+    Hold one of the `size` slots of a pool shared by the workers, waiting at
+    most `timeout` seconds for one. A size of 0 does not limit the pool.
+
+    Raises
+    ------
+    ResponseException
+        with a `429` response if no slot was free in time.
+    """
+
+    if size <= 0:
+        yield
+        return
+
+    deadline = monotonic() + timeout
+    paths = [_get_directory() / f"{pool}-{index}.lock" for index in range(size)]
+    while True:
+        for path in paths:
+            with open_lock_file(path) as lock:
+                if try_lock(lock, fcntl.LOCK_EX):
+                    yield
+                    return
+
+        if monotonic() >= deadline:
+            metrics.inc("solax_throttled_requests_total", pool=pool)
+            raise ResponseException(
+                response_templates.too_many_requests(pool, RETRY_AFTER[pool])
+            )
+        sleep(WAIT_PAUSE)
+
+
+def _get_directory() -> Path:
+    directory = Path(settings.CACHE_DIR) / "admission"
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SolaxRegistersConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "solax_registers"
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,61 @@
+"""The custom authentication file."""
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+
+from .generations import bump_generation, get_generation
+
+AUTH_CACHE = "auth"
+AUTH_GENERATION = "auth"
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that caches the resolved user for a short time.
+
+    Collectors and pollers send the same token with every request, so the
+    token and user lookup is only made once per `AUTH_CACHE_TTL` seconds.
+    """
+
+    def authenticate_credentials(self, key: str):
+        cache = caches[AUTH_CACHE]
+        cache_key = f"token:{get_generation(AUTH_GENERATION)}:{key}"
+
+        credentials = cache.get(cache_key)
+        if credentials is None:
+            credentials = super().authenticate_credentials(key)
+            cache.set(cache_key, credentials, settings.AUTH_CACHE_TTL)
+
+        return credentials
+
+
+def get_cached_permissions(user, token=None) -> frozenset:
+    """Return the permissions of a user, caching them per user and token."""
+
+    cache = caches[AUTH_CACHE]
+    token_key = "session" if token is None else token.key
+    generation = get_generation(AUTH_GENERATION)
+    cache_key = f"permissions:{generation}:{user.pk}:{token_key}"
+
+    permissions = cache.get(cache_key)
+    if permissions is None:
+        permissions = frozenset(user.get_all_permissions())
+        cache.set(cache_key, permissions, settings.AUTH_CACHE_TTL)
+
+    return permissions
+
+
+def invalidate_auth_cache(sender, update_fields=None, **kwargs):
+    """
+    Invalidate the cached tokens and permissions of all the workers, once the
+    change is committed: a worker reading the new generation earlier could
+    cache the permissions from before the change for `AUTH_CACHE_TTL` seconds.
+
+    The `last_login` updates of the logins change nothing that is cached.
+    """
+
+    if update_fields is not None and set(update_fields) == {"last_login"}:
+        return
+    transaction.on_commit(lambda: bump_generation(AUTH_GENERATION))
@@ -0,0 +1,163 @@
+"""
+Batches of stats queries, answered from one consistent snapshot of the database.
+
+A sub-query has the same semantics as a GET request on the endpoint of its
+table, and may aggregate the records it selects instead of returning them.
+"""
+
+from datetime import datetime
+from typing import Callable, List, Type, Union
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Min, Model, Sum
+from django.utils import timezone
+from rest_framework.request import Request
+
+from . import admission, metrics
+from .constants import response_templates
+from .filters import parse_filters
+from .models import STATS_TABLES
+from .permissions import has_model_permissions
+from .utils import ResponseException, get_row_budget
+
+AGGREGATES = {"avg": Avg, "min": Min, "max": Max, "sum": Sum, "count": Count}
+MAX_QUERIES = 20
+QUERY_KEYS = {"table", "since", "before", "fields", "filter", "aggregate"}
+
+
+def run_batch(request: Request, queries: list) -> List[Union[list, dict]]:
+    """
+    Validate and run a batch of sub-queries, in one read transaction.
+
+    Raises
+    ------
+    ResponseException
+        if the batch or one of its sub-queries is invalid, the user lacks the
+        permission to view one of the tables, or too many reads are running.
+    """
+
+    if not isinstance(queries, list) or not queries:
+        raise ResponseException(response_templates.invalid_batch("a list of queries"))
+    if len(queries) > MAX_QUERIES:
+        raise ResponseException(
+            response_templates.invalid_batch(f"at most {MAX_QUERIES} queries")
+        )
+
+    evaluators = [
+        _build_query(request, index, query) for index, query in enumerate(queries)
+    ]
+
+    with admission.slot("read", settings.READ_SLOTS, settings.READ_SLOT_TIMEOUT):
+        with transaction.atomic():
+            results = [evaluate() for evaluate in evaluators]
+
+    for query, result in zip(queries, results):
+        if isinstance(result, list):
+            model_name = STATS_TABLES[query["table"]].model._meta.model_name
+            metrics.observe("solax_rows_returned", len(result), model=model_name)
+    return results
+
+
+def _build_query(
+    request: Request, index: int, query: dict
+) -> Callable[[], Union[list, dict]]:
+    """Validate a sub-query, and return a function evaluating it."""
+
+    def invalid(reason: str) -> ResponseException:
+        return ResponseException(response_templates.invalid_batch_query(index, reason))
+
+    if not isinstance(query, dict):
+        raise invalid("a query must be an object")
+    unknown_keys = set(query) - QUERY_KEYS
+    if unknown_keys:
+        raise invalid(f"unknown keys {', '.join(sorted(unknown_keys))}")
+
+    table = STATS_TABLES.get(query.get("table"))
+    if table is None:
+        raise invalid(f"'table' must be one of {', '.join(STATS_TABLES)}")
+    if not has_model_permissions(
+        request, (table.model, table.last_record_model), "view"
+    ):
+        raise ResponseException(response_templates.BATCH_FORBIDDEN)
+
+    fields = query.get("fields") or [field.name for field in table.model._meta.fields]
+    _validate_names(fields, table.model, invalid)
+
+    since, before = query.get("since"), query.get("before")
+    has_range = (since, before) != (None, None)
+    value_filters = parse_filters(
+        _get_list(query, "filter", invalid), table.model, has_range
+    )
+    aggregate = query.get("aggregate")
+
+    if not has_range and not value_filters:
+        if aggregate:
+            raise invalid("aggregating needs 'since', 'before', or 'filter'")
+        queryset = table.last_record_model.objects.values(*fields)
+        return lambda: queryset.first() or {}
+
+    queryset = table.model.objects.filter(value_filters)
+    date_field = table.model._meta.get_field(table.date_column)
+    for lookup, value in (("gte", since), ("lte", before)):
+        if value is not None:
+            try:
+                value = date_field.to_python(value)
+            except ValidationError as exc:
+                raise invalid(" ".join(exc.messages))
+            if isinstance(value, datetime) and timezone.is_naive(value):
+                value = timezone.make_aware(value)
+            queryset = queryset.filter(**{f"{table.date_column}__{lookup}": value})
+
+    if aggregate:
+        return _aggregate(queryset, aggregate, table.model, invalid)
+    queryset = queryset.values(*fields)
+    budget = get_row_budget(request.user)
+
+    def evaluate() -> list:
+        # Like a GET range query, counting at most one record more than the budget.
+        if budget > 0 and queryset[: budget + 1].count() > budget:
+            model_name = table.model._meta.model_name
+            metrics.inc("solax_over_budget_queries_total", model=model_name)
+            raise invalid(
+                f"it selects more than {budget} records, the most that one of "
+                "your responses may hold"
+            )
+        return list(queryset)
+
+    return evaluate
+
+
+def _aggregate(queryset, aggregate, model: Type[Model], invalid) -> Callable[[], dict]:
+    if not isinstance(aggregate, dict):
+        raise invalid("'aggregate' must map functions to lists of fields")
+
+    expressions = {}
+    for function, fields in aggregate.items():
+        if function not in AGGREGATES:
+            raise invalid(f"the aggregate functions are {', '.join(AGGREGATES)}")
+        if not isinstance(fields, list):
+            raise invalid(f"'{function}' must be a list of fields")
+        _validate_names(fields, model, invalid)
+        for field in fields:
+            expressions[f"{field}__{function}"] = AGGREGATES[function](field)
+
+    return lambda: queryset.aggregate(**expressions)
+
+
+def _validate_names(fields, model: Type[Model], invalid):
+    if not isinstance(fields, list):
+        raise invalid("'fields' must be a list")
+    for field in fields:
+        try:
+            model._meta.get_field(field)
+        except (FieldDoesNotExist, TypeError):
+            raise invalid(f"unknown field {field}")
+
+
+def _get_list(query: dict, key: str, invalid) -> list:
+    value = query.get(key, [])
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise invalid(f"'{key}' must be a list of strings")
+    return value
@@ -0,0 +1,110 @@
+"""The fastest write path into the stats tables, for bulk loads."""
+
+from contextlib import contextmanager
+from itertools import islice
+from typing import Callable, Iterable, List, Type, Union
+
+from django.db import connection, models, transaction
+
+from . import admission
+
+RELAXED_PRAGMAS = {
+    "synchronous": "OFF",
+    "temp_store": "MEMORY",
+    "cache_size": "-262144",
+}
+
+
+@contextmanager
+def relaxed_durability():
+    """
+    Relax the SQLite durability guarantees for the duration of a bulk load.
+
+    A crash during the load may lose the last committed batches, but never
+    corrupts the database. The previous settings are restored afterwards.
+    Inside a transaction, which SQLite only syncs on commit anyway, the
+    settings are left as they are.
+    """
+
+    if connection.in_atomic_block:
+        yield
+        return
+
+    with connection.cursor() as cursor:
+        previous = {}
+        for pragma, value in RELAXED_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma}")
+            previous[pragma] = cursor.fetchone()[0]
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+        try:
+            yield
+        finally:
+            for pragma, value in previous.items():
+                cursor.execute(f"PRAGMA {pragma} = {value}")
+
+
+def bulk_insert(
+    model: Type[models.Model],
+    column_names: List[str],
+    rows: Iterable[tuple],
+    batch_size: int = 100000,
+    overwrite: bool = False,
+    on_batch: Union[Callable[[int], None], None] = None,
+) -> int:
+    """
+    Insert rows of database values in batched transactions, each started
+    once no live write runs.
+
+    Parameters
+    ----------
+    model : django.db.models.Model
+        the model of the table.
+    column_names : list
+        the database columns of the values in each row.
+    rows : iterable
+        the rows, in a format the database accepts as is.
+    batch_size : int
+        the number of rows inserted in one transaction.
+    overwrite : bool
+        whether to replace the existing rows with the same timestamp, rather
+        than keeping them.
+    on_batch : callable, optional
+        called with the number of inserted rows after every batch.
+
+    Returns
+    -------
+    int
+        the number of inserted rows.
+    """
+
+    quote_name = connection.ops.quote_name
+    conflict_action = "REPLACE" if overwrite else "IGNORE"
+    sql = "INSERT OR {} INTO {} ({}) VALUES ({})".format(
+        conflict_action,
+        quote_name(model._meta.db_table),
+        ", ".join(map(quote_name, column_names)),
+        ", ".join(["%s"] * len(column_names)),
+    )
+
+    inserted = 0
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return inserted
+
+        admission.yield_to_live_writes()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, batch)
+            inserted += cursor.rowcount
+
+        if on_batch is not None:
+            on_batch(inserted)
+
+
+def update_last_record(table) -> None:
+    """Copy the newest record of a `models.StatsTable` to its last record table."""
+
+    newest = table.model.objects.order_by("-pk").values().first()
+    if newest is not None:
+        table.last_record_model.objects.update_or_create(defaults=newest, id=1)
@@ -0,0 +1,139 @@
+"""
+Single-flight execution of identical concurrent range queries.
+
+Identical queries that arrive while one of them is running wait for it and
+share its rendered body, instead of each querying the database and rendering
+the records again. The threads of a worker wait for the flight of the worker.
+The workers wait for each other with `flock`s on files in `CACHE_DIR/flights`:
+the leader holds an exclusive lock on `<key>.lock` while it runs, followers
+hold a shared lock on `<key>.wait` while they wait, and the leader only writes
+the body to `<key>.body` when somebody waits for it.
+
+A follower that waits longer than `COALESCING_TIMEOUT` seconds, or finds no
+body because the leader failed, runs the query itself. A timeout of 0 turns
+the coalescing off.
+"""
+
+import fcntl
+import os
+import struct
+from hashlib import sha1
+from pathlib import Path
+from threading import Event, Lock
+from time import time, time_ns
+from typing import Callable, Dict, Union
+
+from django.conf import settings
+
+from . import metrics
+from .locks import open_lock_file, try_lock, wait_lock
+
+# A body starts with the time its flight ended, in nanoseconds.
+HEADER = struct.Struct("<q")
+# The bodies and the locks of the flights older than this are removed.
+MAX_FLIGHT_AGE = 300
+
+
+class _Flight:
+    def __init__(self):
+        self.done = Event()
+        self.body: Union[bytes, None] = None
+
+
+_flights: Dict[str, _Flight] = {}
+_flights_lock = Lock()
+_last_cleanup = 0.0
+
+
+def run(key: str, compute: Callable[[], bytes]) -> bytes:
+    """Return the body of a query, shared with the identical queries running."""
+
+    if settings.COALESCING_TIMEOUT <= 0:
+        return compute()
+
+    with _flights_lock:
+        flight = _flights.get(key)
+        is_leader = flight is None
+        if is_leader:
+            flight = _flights[key] = _Flight()
+
+    if not is_leader:
+        if flight.done.wait(settings.COALESCING_TIMEOUT) and flight.body is not None:
+            metrics.inc("solax_coalesced_queries_total", scope="thread")
+            return flight.body
+        return compute()
+
+    try:
+        flight.body = _run_across_workers(key, compute)
+        return flight.body
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+def _run_across_workers(key: str, compute: Callable[[], bytes]) -> bytes:
+    directory = Path(settings.CACHE_DIR) / "flights"
+    directory.mkdir(parents=True, exist_ok=True)
+    name = sha1(key.encode()).hexdigest()
+    body_path = directory / f"{name}.body"
+    arrival = time_ns()
+
+    with open_lock_file(directory / f"{name}.lock") as lock:
+        if try_lock(lock, fcntl.LOCK_EX):
+            body = compute()
+            with open_lock_file(directory / f"{name}.wait") as waiters:
+                if not try_lock(waiters, fcntl.LOCK_EX):
+                    _write_body(body_path, body)
+            _remove_old_flights(directory)
+            return body
+
+        with open_lock_file(directory / f"{name}.wait") as waiters:
+            fcntl.flock(waiters, fcntl.LOCK_SH)
+            if wait_lock(lock, fcntl.LOCK_SH, settings.COALESCING_TIMEOUT):
+                body = _read_body(body_path, arrival)
+                if body is not None:
+                    metrics.inc("solax_coalesced_queries_total", scope="worker")
+                    return body
+
+    return compute()
+
+
+def _write_body(path: Path, body: bytes):
+    partial_path = path.with_name(f"{path.name}.{os.getpid()}")
+    with open(partial_path, "wb") as file:
+        file.write(HEADER.pack(time_ns()))
+        file.write(body)
+    os.replace(partial_path, path)
+
+
+def _read_body(path: Path, arrival: int) -> Union[bytes, None]:
+    """Return the body of a flight which ended after a follower arrived."""
+
+    try:
+        with open(path, "rb") as file:
+            header = file.read(HEADER.size)
+            if len(header) < HEADER.size or HEADER.unpack(header)[0] < arrival:
+                return None
+            return file.read()
+    except FileNotFoundError:
+        return None
+
+
+def _remove_old_flights(directory: Path):
+    global _last_cleanup
+
+    now = time()
+    if now - _last_cleanup < MAX_FLIGHT_AGE:
+        return
+    _last_cleanup = now
+
+    # A lock removed under a running flight only lets the next identical query
+    # run on its own.
+    oldest = now - MAX_FLIGHT_AGE
+    for path in directory.iterdir():
+        try:
+            if path.stat().st_mtime < oldest:
+                path.unlink()
+        except FileNotFoundError:
+            pass
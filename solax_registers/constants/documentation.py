@@ -159,16 +159,130 @@ OVERWRITE_PARAM = OpenApiParameter(
     default="false",
 )
 
+FILTER_PARAM = OpenApiParameter(
+    name="filter",
+    location="query",
+    required=False,
+    description="A filter on the value of a column, as `COLUMN__OPERATOR:VALUE`, or "
+    "`COLUMN:VALUE` for `eq`. The operators are `eq`, `ne`, `gt`, `gte`, `lt`, "
+    "`lte`, `in` (comma-separated values), and `isnull` (`true` or `false`). "
+    "Columns without an index can only be filtered on together with `since` or "
+    "`before`. If given, the matching history records are queried.",
+    style="form",
+    explode=True,
+    examples=[
+        OpenApiExample(
+            name="Using an equality filter",
+            summary="Using an equality filter",
+            value=["inverter_status:2"],
+            description="Query the records whose `inverter_status` is 2.",
+        ),
+        OpenApiExample(
+            name="Using a comparison",
+            summary="Using a comparison",
+            value=["grid_voltage_r__gt:250"],
+            description="Query the records whose `grid_voltage_r` is above 250.",
+        ),
+    ],
+    many=True,
+)
+
+LAST_PARAM = OpenApiParameter(
+    name="last",
+    type=OpenApiTypes.INT,
+    location="query",
+    required=False,
+    description="The number of newest history records to query, from 1 to 10000. "
+    "Can be combined with `since` and `before`, but not with `filter`. The records "
+    "are returned oldest first.",
+    style="form",
+    explode=True,
+    examples=[
+        OpenApiExample(
+            name="Querying the last hour",
+            summary="Querying the last hour",
+            value=60,
+            description="Query the 60 newest minute records.",
+        ),
+    ],
+)
 
-GET_PARAMETERS = [STATS_PARAM, SINCE_PARAM, BEFORE_PARAM]
+STREAM_PARAM = OpenApiParameter(
+    name="stream",
+    enum=["true", "false"],
+    location="query",
+    required=False,
+    description="Controls whether to stream the history records in chronological "
+    "order, which is not limited by the row budget. Cannot be combined with `last`.",
+    style="form",
+    explode=True,
+    default="false",
+)
+
+GET_PARAMETERS = [
+    STATS_PARAM,
+    SINCE_PARAM,
+    BEFORE_PARAM,
+    FILTER_PARAM,
+    LAST_PARAM,
+    STREAM_PARAM,
+]
 
 GET_PARAMETERS_WITHOUT_DATETIME = [
     STATS_PARAM,
     SINCE_PARAM_WITHOUT_DATETIME,
     BEFORE_PARAM_WITHOUT_DATETIME,
+    FILTER_PARAM,
+    LAST_PARAM,
+    STREAM_PARAM,
 ]
 POST_PARAMETERS = [OVERWRITE_PARAM]
 
+COVERAGE_PARAMETERS = [
+    OpenApiParameter(
+        name="since",
+        type=OpenApiTypes.DATETIME,
+        location="query",
+        required=False,
+        description="The first minute of the checked range. Default: the minute of "
+        "the first record.",
+        examples=[
+            OpenApiExample(
+                name="Using a datetime value",
+                summary="Using a datetime value",
+                value="2023-01-01 00:00",
+            ),
+        ],
+    ),
+    OpenApiParameter(
+        name="before",
+        type=OpenApiTypes.DATETIME,
+        location="query",
+        required=False,
+        description="The last minute of the checked range. Default: the minute of "
+        "the last record.",
+        examples=[
+            OpenApiExample(
+                name="Using a datetime value",
+                summary="Using a datetime value",
+                value="2023-01-31 23:59",
+            ),
+        ],
+    ),
+]
+
+AS_OF_EXAMPLE = OpenApiExample(
+    name="Power at the start of each hour",
+    request_only=True,
+    value={
+        "timestamps": ["2024-06-08T10:00Z", "2024-06-08T11:00Z", "2024-06-08T12:00Z"],
+        "tolerance": 300,
+        "fields": ["upload_time", "dc_solar_power"],
+    },
+    description="Find the newest minute record at or before each timestamp, at "
+    "most 5 minutes older than it.",
+)
+
 ACTION_PARAM = OpenApiParameter(
     name="action",
     enum=["delete_older_than", "truncate"],
@@ -204,3 +318,16 @@ ARGS_PARAM = OpenApiParameter(
 )
 
 DELETE_PARAMS = [ACTION_PARAM, ARGS_PARAM]
+
+COMPRESS_PARAM = OpenApiParameter(
+    name="compress",
+    enum=["true", "false"],
+    location="query",
+    required=False,
+    description="Controls whether to gzip compress the copy of the database.",
+    style="form",
+    explode=True,
+    default="true",
+)
+
+SNAPSHOT_PARAMETERS = [COMPRESS_PARAM]
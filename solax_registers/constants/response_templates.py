@@ -30,3 +30,95 @@ MISSING_DATE_ARG = Response(
     {"detail": "Argument 'date' in 'args' (position 0) is mandatory."},
     status.HTTP_400_BAD_REQUEST,
 )
+INVALID_COMPRESS_PARAM = Response(
+    {"detail": "'compress' parameter must be either 'true' or 'false'"},
+    status.HTTP_400_BAD_REQUEST,
+)
+UNSUPPORTED_IMPORT_FORMAT = Response(
+    {
+        "detail": "The content type must be 'text/csv', 'application/x-ndjson', "
+        "or 'application/jsonl'."
+    },
+    status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+)
+
+invalid_import = lambda e: Response(
+    {"detail": f"The file cannot be imported: {e}."},
+    status.HTTP_400_BAD_REQUEST,
+)
+
+invalid_last_param = lambda maximum: Response(
+    {"detail": f"'last' parameter must be an integer from 1 to {maximum}"},
+    status.HTTP_400_BAD_REQUEST,
+)
+
+LAST_WITH_FILTER = Response(
+    {"detail": "'last' parameter cannot be combined with 'filter'"},
+    status.HTTP_400_BAD_REQUEST,
+)
+
+INVALID_STREAM_PARAM = Response(
+    {"detail": "'stream' parameter must be either 'true' or 'false'"},
+    status.HTTP_400_BAD_REQUEST,
+)
+
+LAST_WITH_STREAM = Response(
+    {"detail": "'last' parameter cannot be combined with 'stream'"},
+    status.HTTP_400_BAD_REQUEST,
+)
+
+too_many_requests = lambda pool, retry_after: Response(
+    {
+        "detail": f"Too many {pool} requests are running. Retry in {retry_after} seconds."
+    },
+    status.HTTP_429_TOO_MANY_REQUESTS,
+    headers={"Retry-After": str(retry_after)},
+)
+
+SNAPSHOT_BUSY = Response(
+    {
+        "detail": "The database was written to during every attempt to copy it. "
+        "Retry later."
+    },
+    status.HTTP_503_SERVICE_UNAVAILABLE,
+    headers={"Retry-After": "60"},
+)
+
+row_budget_exceeded = lambda budget: Response(
+    {
+        "detail": f"The query selects more than {budget} records, the most that "
+        "one of your responses may hold. Narrow it with 'since', 'before' or "
+        "'filter', or pass 'stream=true' to stream the records."
+    },
+    status.HTTP_400_BAD_REQUEST,
+)
+
+invalid_filter = lambda expression, reason: Response(
+    {"detail": f"Invalid filter '{expression}': {reason}."},
+    status.HTTP_400_BAD_REQUEST,
+)
+
+BATCH_FORBIDDEN = Response(
+    {"detail": "You do not have permission to perform this action."},
+    status.HTTP_403_FORBIDDEN,
+)
+
+invalid_as_of = lambda reason: Response(
+    {"detail": f"Invalid as-of query: {reason}."},
+    status.HTTP_400_BAD_REQUEST,
+)
+
+invalid_timestamp_param = lambda name: Response(
+    {"detail": f"'{name}' parameter must be a timestamp."},
+    status.HTTP_400_BAD_REQUEST,
+)
+
+invalid_batch = lambda reason: Response(
+    {"detail": f"'queries' must be {reason}."},
+    status.HTTP_400_BAD_REQUEST,
+)
+
+invalid_batch_query = lambda index, reason: Response(
+    {"detail": f"Invalid query at position {index}: {reason}."},
+    status.HTTP_400_BAD_REQUEST,
+)
@@ -0,0 +1,259 @@
+"""
+The coverage index of the minute stats: the runs of consecutive minutes which
+all have at least one record.
+
+The runs are kept up to date by the writes of the API, the imports and the
+management commands, in the transaction of the write, so that the gaps of a
+range are found in time proportional to their number instead of the number
+of records. Records changed behind the back of the application, for example
+through the admin site, need a `rebuild_coverage`.
+"""
+
+from datetime import datetime, timedelta
+from heapq import merge
+from itertools import islice
+from typing import Dict, Iterable, Iterator, Tuple, Type, Union
+
+from django.core.exceptions import ValidationError
+from django.db import connection, models
+from django.utils.timezone import is_naive, make_aware
+
+from . import admission
+from .models import STATS_TABLES, MinuteStatsRun
+
+COVERAGE_TABLE = "minute_stats"
+MINUTE = timedelta(minutes=1)
+BATCH_SIZE = 500
+PAGE_SIZE = 20000
+
+Run = Tuple[datetime, datetime]
+
+
+def is_covered(model: Type[models.Model]) -> bool:
+    """Return whether a model has a coverage index."""
+
+    return STATS_TABLES[COVERAGE_TABLE].model is model
+
+
+def notify_added(model: Type[models.Model], moment: Union[datetime, str]):
+    """Add the minute of a new record to the index."""
+
+    if is_covered(model):
+        minute = to_minute(moment)
+        _refresh(minute, minute, [minute])
+
+
+def notify_changed(
+    model: Type[models.Model],
+    first: Union[datetime, str, None] = None,
+    last: Union[datetime, str, None] = None,
+):
+    """
+    Update the index after the records between two moments were changed, in
+    time proportional to the number of records between them.
+    """
+
+    if is_covered(model):
+        _refresh(
+            None if first is None else to_minute(first),
+            None if last is None else to_minute(last),
+        )
+
+
+def rebuild():
+    """Rebuild the whole index from the records."""
+
+    MinuteStatsRun.objects.all().delete()
+    _refresh(None, None)
+
+
+def ensure_built():
+    """Build the index of the records which were added before it existed."""
+
+    if MinuteStatsRun._meta.db_table not in connection.introspection.table_names():
+        return
+    if (
+        not MinuteStatsRun.objects.exists()
+        and STATS_TABLES[COVERAGE_TABLE].model.objects.exists()
+    ):
+        rebuild()
+
+
+def get_coverage(
+    since: Union[datetime, str, None], before: Union[datetime, str, None]
+) -> dict:
+    """
+    Return the gaps between two moments, which default to the first and the
+    last record, and the share of their minutes that have a record.
+
+    Raises
+    ------
+    django.core.exceptions.ValidationError
+        if a moment is not a valid timestamp.
+    """
+
+    first = None if since is None else _ceil_minute(_parse(since))
+    last = None if before is None else to_minute(before)
+
+    runs = MinuteStatsRun.objects.order_by("first_minute")
+    if first is not None:
+        runs = runs.filter(last_minute__gte=first)
+    if last is not None:
+        runs = runs.filter(first_minute__lte=last)
+    runs = list(runs.values_list("first_minute", "last_minute"))
+
+    if first is None and runs:
+        first = runs[0][0]
+    if last is None and runs:
+        last = runs[-1][1]
+
+    gaps = []
+    covered = 0
+    if first is not None and last is not None and first <= last:
+        cursor = first
+        for run_first, run_last in runs:
+            run_first, run_last = max(run_first, first), min(run_last, last)
+            if run_first > cursor:
+                gaps.append(_get_gap(cursor, run_first - MINUTE))
+            covered += _count_minutes(run_first, run_last)
+            cursor = run_last + MINUTE
+        if cursor <= last:
+            gaps.append(_get_gap(cursor, last))
+        expected = _count_minutes(first, last)
+    else:
+        expected = 0
+
+    return {
+        "since": first,
+        "before": last,
+        "expected_minutes": expected,
+        "covered_minutes": covered,
+        "missing_minutes": expected - covered,
+        "completeness": round(covered * 100 / expected, 2) if expected else None,
+        "gaps": gaps,
+    }
+
+
+def to_minute(moment: Union[datetime, str]) -> datetime:
+    """Return the minute of a moment."""
+
+    return _parse(moment).replace(second=0, microsecond=0)
+
+
+def _refresh(
+    first: Union[datetime, None],
+    last: Union[datetime, None],
+    minutes: Union[Iterable[datetime], None] = None,
+):
+    """
+    Recompute the runs between the `first` and the `last` minute, from the
+    given minutes with a record or else from the records, and merge them with
+    the runs around them.
+    """
+
+    overlapping = MinuteStatsRun.objects.all()
+    if first is not None:
+        overlapping = overlapping.filter(last_minute__gte=first - MINUTE)
+    if last is not None:
+        overlapping = overlapping.filter(first_minute__lte=last + MINUTE)
+    old_runs = dict(overlapping.values_list("first_minute", "last_minute"))
+
+    # The parts of the old runs outside the range stay as they are.
+    outside = []
+    for run_first, run_last in old_runs.items():
+        if first is not None and run_first < first:
+            outside.append((run_first, min(run_last, first - MINUTE)))
+        if last is not None and run_last > last:
+            outside.append((max(run_first, last + MINUTE), run_last))
+
+    if minutes is None:
+        minutes = _get_minutes(first, last)
+    runs = _merge_runs(merge(sorted(outside), ((minute, minute) for minute in minutes)))
+    new_runs = dict(runs)
+
+    removed = [run_first for run_first in old_runs if run_first not in new_runs]
+    for start in range(0, len(removed), BATCH_SIZE):
+        MinuteStatsRun.objects.filter(
+            first_minute__in=removed[start : start + BATCH_SIZE]
+        ).delete()
+
+    changed = [
+        MinuteStatsRun(first_minute=run_first, last_minute=run_last)
+        for run_first, run_last in new_runs.items()
+        if old_runs.get(run_first) != run_last
+    ]
+    if changed:
+        MinuteStatsRun.objects.bulk_create(
+            changed,
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["first_minute"],
+            update_fields=["last_minute"],
+        )
+
+
+def _get_minutes(
+    first: Union[datetime, None], last: Union[datetime, None]
+) -> Iterator[datetime]:
+    """
+    Return the minutes with a record between two minutes, in order.
+
+    The records are read a page at a time. Outside of a transaction, a scan of
+    the whole table then lets the live writes in between its pages, instead
+    of locking them out of the database until it ends.
+    """
+
+    table = STATS_TABLES[COVERAGE_TABLE]
+    records = table.model.objects.order_by(table.date_column)
+    if last is not None:
+        records = records.filter(**{f"{table.date_column}__lt": last + MINUTE})
+
+    lookup, bound = f"{table.date_column}__gte", first
+    while True:
+        page = records if bound is None else records.filter(**{lookup: bound})
+        moments = list(page.values_list(table.date_column, flat=True)[:PAGE_SIZE])
+        for moment in moments:
+            yield moment.replace(second=0, microsecond=0)
+        if len(moments) < PAGE_SIZE:
+            return
+
+        lookup, bound = f"{table.date_column}__gt", moments[-1]
+        if not connection.in_atomic_block:
+            admission.yield_to_live_writes()
+
+
+def _merge_runs(runs: Iterable[Run]) -> Iterator[Run]:
+    """Merge sorted runs which overlap or touch."""
+
+    runs = iter(runs)
+    for current_first, current_last in islice(runs, 1):
+        for run_first, run_last in runs:
+            if run_first <= current_last + MINUTE:
+                current_last = max(current_last, run_last)
+            else:
+                yield current_first, current_last
+                current_first, current_last = run_first, run_last
+        yield current_first, current_last
+
+
+def _get_gap(first: datetime, last: datetime) -> Dict[str, Union[datetime, int]]:
+    return {"since": first, "before": last, "minutes": _count_minutes(first, last)}
+
+
+def _count_minutes(first: datetime, last: datetime) -> int:
+    return (last - first) // MINUTE + 1
+
+
+def _ceil_minute(moment: datetime) -> datetime:
+    minute = moment.replace(second=0, microsecond=0)
+    return minute if minute == moment else minute + MINUTE
+
+
+def _parse(moment: Union[datetime, str]) -> datetime:
+    table = STATS_TABLES[COVERAGE_TABLE]
+    moment = table.model._meta.get_field(table.date_column).to_python(moment)
+    if moment is None:
+        raise ValidationError("missing timestamp")
+    if is_naive(moment):
+        moment = make_aware(moment)
+    return moment
@@ -1,18 +1,51 @@
-from operator import attrgetter
+from datetime import datetime, timedelta
+from io import BytesIO
+from operator import attrgetter, itemgetter
 from typing import Dict, List, Tuple, Type, Union
 
-from django.db.models import Model
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Model, Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import OpenApiResponse, extend_schema
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.serializers import ModelSerializer
 from rest_framework.views import APIView
 
+from . import (
+    admission,
+    coalescing,
+    coverage,
+    imports,
+    metrics,
+    profiling,
+    range_cache,
+    recent,
+    statements,
+)
 from .constants import documentation, response_templates
-from .utils import ResponseException, catch400, set_subtract
+from .filters import parse_filters
+from .models import STATS_TABLES
+from .utils import (
+    RenderedResponse,
+    ResponseException,
+    accepts_plain_json,
+    catch400,
+    get_row_budget,
+    render_json,
+    set_subtract,
+)
+
+MAX_LAST_RECORDS = 10000
+MAX_AS_OF_TIMESTAMPS = 1000
+STREAM_CHUNK_SIZE = 2000
 
 
 def create_views(
@@ -49,7 +82,7 @@ def create_views(
     else:
         get_parameters = documentation.GET_PARAMETERS_WITHOUT_DATETIME
 
-    class StatsManager(APIView):
+    class StatsManager(profiling.ProfiledViewMixin, APIView):
         model: Type[Model] = model_serializer.Meta.model
         last_record_model: Type[Model] = last_record_model_serializer.Meta.model
 
@@ -58,6 +91,7 @@ def create_views(
             responses={
                 200: model_serializer,
                 400: OpenApiTypes.OBJECT,
+                429: OpenApiTypes.OBJECT,
                 (500, "text/html"): OpenApiResponse(response=OpenApiTypes.ANY),
             },
             summary=docs["get"],
@@ -68,18 +102,204 @@ def create_views(
             filter_range = (query_params.get("since"), query_params.get("before"))
             fields = query_params.getlist("fields") or self._get_model_fields()
             self._validate_for_extra_fields(fields)
+            count = self._get_last_count(query_params.get("last"))
+            if count is not None and query_params.getlist("filter"):
+                raise ResponseException(response_templates.LAST_WITH_FILTER)
+            stream = self._get_stream(query_params.get("stream") or "false")
+            if count is not None and stream:
+                raise ResponseException(response_templates.LAST_WITH_STREAM)
+            value_filters = parse_filters(
+                query_params.getlist("filter"),
+                self.model,
+                has_range=filter_range != (None, None),
+            )
 
-            if filter_range != (None, None):
+            if count is not None or filter_range != (None, None) or value_filters:
                 return self._get_history_stats(
-                    {"range": filter_range, "fields": fields}
+                    {
+                        "range": filter_range,
+                        "fields": fields,
+                        "filters": value_filters,
+                        "last": count,
+                        "stream": stream,
+                    }
                 )
             return self._get_last_record_stats({"fields": fields})
 
+        def _get_last_count(self, last: Union[str, None]) -> Union[int, None]:
+            if last is None:
+                return None
+            if not (last.isascii() and last.isdigit()) or not (
+                1 <= int(last) <= MAX_LAST_RECORDS
+            ):
+                error_response = response_templates.invalid_last_param(MAX_LAST_RECORDS)
+                raise ResponseException(error_response)
+            return int(last)
+
+        def _get_stream(self, stream: str) -> bool:
+            if stream not in ("true", "false"):
+                raise ResponseException(response_templates.INVALID_STREAM_PARAM)
+            return stream == "true"
+
         def _get_history_stats(self, config: dict) -> Response:
-            filter_range, fields = config["range"], config["fields"]
+            if config["stream"]:
+                return self._stream_history_records(config)
+
+            cache_entry = range_cache.lookup(self, upload_date_column, config)
+            if cache_entry is not None and cache_entry.body is not None:
+                return RenderedResponse(cache_entry.body, status.HTTP_200_OK)
+            self._check_row_budget(config)
+            if not accepts_plain_json(self.request):
+                return Response(self._get_history_records(config), status.HTTP_200_OK)
+
+            def render() -> bytes:
+                records = self._get_history_records(config)
+                with profiling.phase(self.request, "render"):
+                    if cache_entry is not None:
+                        return range_cache.store(cache_entry, self, records)
+                    return render_json(self, records)
+
+            # Identical queries running at the same time share one execution.
+            key = repr(
+                (
+                    self.model._meta.label_lower,
+                    config["range"],
+                    tuple(config["fields"]),
+                    tuple(self.request.query_params.getlist("filter")),
+                    config["last"],
+                )
+            )
+            body = coalescing.run(key, render)
+            return RenderedResponse(body, status.HTTP_200_OK)
+
+        def _get_history_records(self, config: dict) -> List[dict]:
+            filter_range, fields, count = (
+                config["range"],
+                config["fields"],
+                config["last"],
+            )
+
+            content_response = None
+            if not config["filters"]:
+                content_response = self._get_recent_records(filter_range, fields, count)
+            if content_response is None:
+                with self._read_slot(), profiling.phase(self.request, "serialize"):
+                    content_response = self._get_filtered_history_data(
+                        fields, filter_range, config["filters"], count
+                    )
+                    if config["filters"] and upload_date_column in fields:
+                        # An index on a filtered column returns the records ordered
+                        # by value first, so restore the chronological order.
+                        content_response.sort(key=itemgetter(upload_date_column))
+            self._observe_rows_returned(len(content_response))
+            return content_response
+
+        def _check_row_budget(self, config: dict):
+            """
+            Refuse a query that selects more records than the row budget of the
+            user, counting at most one record more than the budget.
+            """
+
+            budget = get_row_budget(self.request.user)
+            count = config["last"]
+            if budget <= 0 or (count is not None and count <= budget):
+                return
+
+            since, before = config["range"]
+            with profiling.phase(self.request, "estimate"):
+                if config["filters"]:
+                    queryset = self.model.objects.filter(
+                        config["filters"],
+                        **self._construct_filter_params(since, before),
+                    )
+                    no_rows = queryset[: budget + 1].count()
+                else:
+                    no_rows = statements.count_range(
+                        self.model, upload_date_column, since, before, budget + 1
+                    )
+
+            if no_rows > budget:
+                model_name = self.model._meta.model_name
+                metrics.inc("solax_over_budget_queries_total", model=model_name)
+                raise ResponseException(response_templates.row_budget_exceeded(budget))
+
+        def _stream_history_records(self, config: dict) -> StreamingHttpResponse:
+            """
+            Stream the records of a range query in chronological order, reading
+            and rendering them `STREAM_CHUNK_SIZE` records at a time.
+
+            Each chunk is read by a query of its own, which seeks past the last
+            record of the previous chunk, and is read whole before it is sent.
+            So no read lock or read slot is held while the client reads, which
+            would keep every writer out of the database for that long.
+            """
+
+            since, before = config["range"]
+            queryset = self.model.objects.filter(
+                config["filters"], **self._construct_filter_params(since, before)
+            ).order_by(upload_date_column)
+            fields = config["fields"]
+            # The chunks are sought by the upload date, which is the primary key.
+            selected = list(dict.fromkeys([*fields, upload_date_column]))
+
+            def read_chunk(last_seen, read_slot) -> List[dict]:
+                chunk_queryset = queryset
+                if last_seen is not None:
+                    chunk_queryset = queryset.filter(
+                        **{f"{upload_date_column}__gt": last_seen}
+                    )
+                with read_slot:
+                    return list(chunk_queryset.values(*selected)[:STREAM_CHUNK_SIZE])
+
+            # The first chunk is read before the response starts, so that it can
+            # still be refused. A started stream then waits for its slots.
+            chunk = read_chunk(None, self._read_slot())
+
+            def render():
+                nonlocal chunk
+
+                renderer = JSONRenderer()
+                no_rows = 0
+                yield b"["
+                while chunk:
+                    last_seen = chunk[-1][upload_date_column]
+                    if upload_date_column not in fields:
+                        for record in chunk:
+                            del record[upload_date_column]
+                    # Each chunk is rendered as a list, without its brackets.
+                    body = renderer.render(chunk)[1:-1]
+                    yield body if no_rows == 0 else b"," + body
+                    no_rows += len(chunk)
+                    if len(chunk) < STREAM_CHUNK_SIZE:
+                        break
+                    chunk = read_chunk(last_seen, self._read_slot(float("inf")))
+                yield b"]"
+                self._observe_rows_returned(no_rows)
+
+            return StreamingHttpResponse(render(), content_type=JSONRenderer.media_type)
+
+        def _read_slot(self, timeout: Union[float, None] = None):
+            if timeout is None:
+                timeout = settings.READ_SLOT_TIMEOUT
+            return admission.slot("read", settings.READ_SLOTS, timeout)
+
+        def _get_recent_records(
+            self, filter_range: tuple, fields: list, count: Union[int, None]
+        ) -> Union[List[dict], None]:
+            since, before = filter_range
+            window = recent.get_window(self.model)
+            if window is None or (since is None and count is None):
+                return None
+
+            with profiling.phase(self.request, "recent"):
+                records = window.get_records(since, before, fields, count)
+            result = "miss" if records is None else "hit"
+            metrics.inc("solax_recent_window_queries_total", result=result)
+            return records
 
-            serialized_data = self._get_filtered_history_data(fields, filter_range)
-            return Response(list(serialized_data.instance), status.HTTP_200_OK)
+        def _observe_rows_returned(self, no_rows: int):
+            model_name = self.model._meta.model_name
+            metrics.observe("solax_rows_returned", no_rows, model=model_name)
 
         def _validate_for_extra_fields(self, fields: list) -> list:
             model_fields = self._get_model_fields()
@@ -92,19 +312,30 @@ def create_views(
             return list(map(attrgetter("name"), self.model._meta.get_fields()))
 
         def _get_filtered_history_data(
-            self, stats: list, filter_range: list
-        ) -> Type[ModelSerializer]:
+            self,
+            stats: list,
+            filter_range: list,
+            value_filters: Q,
+            count: Union[int, None] = None,
+        ) -> List[dict]:
             since, before = filter_range
+            if count is not None:
+                return statements.select_last(
+                    self.model, upload_date_column, stats, count, since, before
+                )
+            if not value_filters:
+                return statements.select_range(
+                    self.model, upload_date_column, stats, since, before
+                )
 
             if self._is_no_timerange_specified(since, before):
-                queryset = self.model.objects.all().values(*stats)
+                queryset = self.model.objects.all()
             else:
                 queryset = self.model.objects.filter(
                     **self._construct_filter_params(since, before),
-                ).values(*stats)
+                )
 
-            serializer = model_serializer(queryset, many=True)
-            return serializer
+            return list(queryset.filter(value_filters).values(*stats))
 
         def _construct_filter_params(
             self,
@@ -128,19 +359,25 @@ def create_views(
 
         def _get_last_record_stats(self, config: dict) -> Response:
             fields = config["fields"]
-            serializer = self._get_filtered_last_record_data(fields)
-            serializer_content = list(serializer.instance)
+            window = recent.get_window(self.model)
+            if window is not None:
+                with profiling.phase(self.request, "recent"):
+                    content_response = window.get_latest(fields)
+                if content_response is not None:
+                    self._observe_rows_returned(int(content_response != {}))
+                    return Response(content_response, status.HTTP_200_OK)
+
+            with profiling.phase(self.request, "serialize"):
+                serializer_content = statements.select_all(
+                    self.last_record_model, fields
+                )
+            self._observe_rows_returned(len(serializer_content))
             content_response = (
                 {} if len(serializer_content) == 0 else serializer_content[0]
             )
 
             return Response(content_response, status.HTTP_200_OK)
 
-        def _get_filtered_last_record_data(self, stats) -> Type[ModelSerializer]:
-            queryset = self.last_record_model.objects.values(*stats)
-            serializer = last_record_model_serializer(queryset, many=True)
-            return serializer
-
         @extend_schema(
             summary=docs["post"],
             request=model_serializer,
@@ -159,8 +396,9 @@ def create_views(
 
             payload = request.data
             self._validate_for_extra_fields_in_data(payload)
-            self._post_last_record_stats(payload)
-            return self._post_history_stats(payload, overwrite)
+            with admission.live_write(), transaction.atomic():
+                self._post_last_record_stats(payload)
+                return self._post_history_stats(payload, overwrite)
 
         def _validate_overwrite(self, overwrite: str) -> bool:
             if overwrite not in ("true", "false"):
@@ -174,21 +412,30 @@ def create_views(
             if overwrite:
                 try:
                     primary_key_value = data[upload_date_column]
-                    params_for_filter = {upload_date_column: primary_key_value}
-                    self.model.objects.filter(**params_for_filter).delete()
+                    statements.delete(self.model, upload_date_column, primary_key_value)
                 except KeyError:
                     pass
 
             serializer = model_serializer(data=data)
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            serializer.instance = self.model(**serializer.validated_data)
+            statements.insert(serializer.instance)
+            upload_date = getattr(serializer.instance, upload_date_column)
+            coverage.notify_added(self.model, upload_date)
+            range_cache.notify_changed(self.model, upload_date, upload_date)
+            if overwrite:
+                recent.notify_reset(self.model)
+            else:
+                recent.notify_append(self.model)
+            model_name = self.model._meta.model_name
+            metrics.inc("solax_ingested_records_total", model=model_name)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         def _post_last_record_stats(self, data: dict) -> Response:
             serializer = last_record_model_serializer(data=data)
             serializer.is_valid(raise_exception=True)
             data = serializer.validated_data
-            self.last_record_model.objects.update_or_create(defaults=data, id=1)
+            statements.upsert(self.last_record_model(id=1, **data), update_fields=data)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         @extend_schema(
@@ -221,11 +468,19 @@ def create_views(
             filter_params = {f"{upload_date_column}__lte": date}
             queryset = self.model.objects.filter(**filter_params)
 
-            no_deleted, _ = queryset.delete()
+            with transaction.atomic():
+                no_deleted, _ = queryset.delete()
+                coverage.notify_changed(self.model, last=date)
+                range_cache.notify_changed(self.model, last=date)
+            recent.notify_reset(self.model)
             return response_templates.deleted(no_deleted)
 
         def _truncate(self, args: list) -> Response:
-            no_deleted, _ = self.model.objects.all().delete()
+            with transaction.atomic():
+                no_deleted, _ = self.model.objects.all().delete()
+                coverage.notify_changed(self.model)
+                range_cache.notify_changed(self.model)
+            recent.notify_reset(self.model)
             return response_templates.deleted(no_deleted)
 
         def _validate_action(self, action: str, valid_actions):
@@ -236,3 +491,216 @@ def create_views(
                 raise ResponseException(response_templates.INVALID_ACTION_PARAM)
 
     return StatsManager
+
+
+def create_import_view(table_name: str, summary: str) -> Type[APIView]:
+    """
+    A function that returns a view importing a CSV or NDJSON file.
+
+    Parameters
+    ----------
+    table_name : str
+        the key of the table in the columns file.
+    summary : str
+        the summary of the view in the documentation.
+    """
+
+    table = STATS_TABLES[table_name]
+
+    class StatsImport(APIView):
+        model: Type[Model] = table.model
+        last_record_model: Type[Model] = table.last_record_model
+
+        @extend_schema(
+            summary=summary,
+            request={
+                content_type: OpenApiTypes.BINARY
+                for content_type in imports.CONTENT_TYPES
+            },
+            responses={
+                200: OpenApiTypes.OBJECT,
+                400: OpenApiTypes.OBJECT,
+                415: OpenApiTypes.OBJECT,
+                429: OpenApiTypes.OBJECT,
+                (500, "text/html"): OpenApiResponse(response=OpenApiTypes.ANY),
+            },
+            parameters=documentation.POST_PARAMETERS,
+        )
+        @catch400
+        def post(self, request: Request) -> Response:
+            overwrite = request.query_params.get("overwrite") or "false"
+            if overwrite not in ("true", "false"):
+                raise ResponseException(response_templates.INVALID_FORCE_PARAM)
+
+            content_type = request.content_type.split(";")[0].strip()
+            if content_type not in imports.CONTENT_TYPES:
+                raise ResponseException(response_templates.UNSUPPORTED_IMPORT_FORMAT)
+
+            compressed = request.headers.get("Content-Encoding") == "gzip"
+            stream = imports.open_file(request.stream or BytesIO(), compressed)
+            importer = imports.StatsImporter(table_name, overwrite=overwrite == "true")
+            try:
+                with admission.slot("import", settings.IMPORT_SLOTS):
+                    report = importer.run(stream, imports.CONTENT_TYPES[content_type])
+            except imports.ImportFormatError as exc:
+                raise ResponseException(response_templates.invalid_import(exc))
+
+            return Response(report.as_dict(), status.HTTP_200_OK)
+
+    return StatsImport
+
+
+def create_as_of_view(table_name: str, summary: str) -> Type[APIView]:
+    """
+    A function that returns a view finding the newest record at or before each
+    of a list of timestamps.
+
+    Parameters
+    ----------
+    table_name : str
+        the key of the table in the columns file.
+    summary : str
+        the summary of the view in the documentation.
+    """
+
+    table = STATS_TABLES[table_name]
+
+    class StatsAsOf(profiling.ProfiledViewMixin, APIView):
+        model: Type[Model] = table.model
+        last_record_model: Type[Model] = table.last_record_model
+        # Looking records up only reads them, even though the body needs a POST.
+        method_actions = {"POST": "view"}
+
+        @extend_schema(
+            summary=summary,
+            request=OpenApiTypes.OBJECT,
+            responses={
+                200: OpenApiTypes.OBJECT,
+                400: OpenApiTypes.OBJECT,
+                (500, "text/html"): OpenApiResponse(response=OpenApiTypes.ANY),
+            },
+            examples=[documentation.AS_OF_EXAMPLE],
+        )
+        @catch400
+        def post(self, request: Request) -> Response:
+            data = request.data if isinstance(request.data, dict) else {}
+            timestamps = self._get_timestamps(data.get("timestamps"))
+            tolerance = self._get_tolerance(data.get("tolerance"))
+            fields = self._get_fields(data.get("fields"))
+
+            points = [
+                (timestamp, None if tolerance is None else timestamp - tolerance)
+                for timestamp in timestamps
+            ]
+            with profiling.phase(request, "query"):
+                results = statements.select_as_of(
+                    self.model, table.date_column, fields, points
+                )
+
+            found = sum(result is not None for result in results)
+            metrics.observe(
+                "solax_rows_returned", found, model=self.model._meta.model_name
+            )
+            return Response({"results": results}, status.HTTP_200_OK)
+
+        def _get_timestamps(self, timestamps) -> List[datetime]:
+            if not isinstance(timestamps, list) or not timestamps:
+                raise self._invalid("'timestamps' must be a non-empty list")
+            if len(timestamps) > MAX_AS_OF_TIMESTAMPS:
+                raise self._invalid(
+                    f"at most {MAX_AS_OF_TIMESTAMPS} timestamps are allowed"
+                )
+
+            date_field = self.model._meta.get_field(table.date_column)
+            parsed = []
+            for timestamp in timestamps:
+                if not isinstance(timestamp, str):
+                    raise self._invalid("'timestamps' must be a list of strings")
+                try:
+                    value = date_field.to_python(timestamp)
+                except ValidationError:
+                    raise self._invalid(f"invalid timestamp {timestamp}")
+                if timezone.is_naive(value):
+                    value = timezone.make_aware(value)
+                parsed.append(value)
+            return parsed
+
+        def _get_tolerance(self, tolerance) -> Union[timedelta, None]:
+            if tolerance is None:
+                return None
+            if isinstance(tolerance, bool) or not isinstance(tolerance, int):
+                raise self._invalid("'tolerance' must be a number of seconds")
+            if tolerance < 0:
+                raise self._invalid("'tolerance' must not be negative")
+            return timedelta(seconds=tolerance)
+
+        def _get_fields(self, fields) -> List[str]:
+            if fields is None:
+                return [field.name for field in self.model._meta.fields]
+            if not isinstance(fields, list) or not all(
+                isinstance(field, str) for field in fields
+            ):
+                raise self._invalid("'fields' must be a list of strings")
+
+            extra_fields = set_subtract(
+                fields, [field.name for field in self.model._meta.fields]
+            )
+            if extra_fields:
+                raise ResponseException(
+                    response_templates.extra_fields_passed(extra_fields)
+                )
+            return fields
+
+        def _invalid(self, reason: str) -> ResponseException:
+            return ResponseException(response_templates.invalid_as_of(reason))
+
+    return StatsAsOf
+
+
+def create_coverage_view(table_name: str, summary: str) -> Type[APIView]:
+    """
+    A function that returns a view reporting the gaps of a table, from its
+    coverage index.
+
+    Parameters
+    ----------
+    table_name : str
+        the key of the table in the columns file.
+    summary : str
+        the summary of the view in the documentation.
+    """
+
+    table = STATS_TABLES[table_name]
+
+    class StatsCoverage(profiling.ProfiledViewMixin, APIView):
+        model: Type[Model] = table.model
+        last_record_model: Type[Model] = table.last_record_model
+
+        @extend_schema(
+            summary=summary,
+            parameters=documentation.COVERAGE_PARAMETERS,
+            responses={
+                200: OpenApiTypes.OBJECT,
+                400: OpenApiTypes.OBJECT,
+                (500, "text/html"): OpenApiResponse(response=OpenApiTypes.ANY),
+            },
+        )
+        @catch400
+        def get(self, request: Request) -> Response:
+            bounds = {}
+            for name in ("since", "before"):
+                value = request.query_params.get(name) or None
+                if value is not None:
+                    try:
+                        coverage.to_minute(value)
+                    except ValidationError:
+                        raise ResponseException(
+                            response_templates.invalid_timestamp_param(name)
+                        )
+                bounds[name] = value
+
+            with profiling.phase(request, "query"):
+                report = coverage.get_coverage(**bounds)
+            return Response(report, status.HTTP_200_OK)
+
+    return StatsCoverage
@@ -0,0 +1,34 @@
+"""Database helpers shared by the views and the middleware."""
+
+from time import perf_counter
+
+from django.db import OperationalError
+
+from . import metrics
+
+
+class QueryCollector:
+    """
+    An execute wrapper that counts and times the SQL queries of a request,
+    and the queries that failed because another process held the SQLite
+    write lock, with the time they waited for it.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as exc:
+            if "database is locked" in str(exc):
+                metrics.inc("solax_sqlite_busy_errors_total")
+                metrics.inc(
+                    "solax_sqlite_lock_wait_seconds_total", perf_counter() - start
+                )
+            raise
+        finally:
+            self.count += 1
+            self.duration += perf_counter() - start
@@ -0,0 +1,119 @@
+"""The custom model fields of the stats tables."""
+
+import math
+
+from django.core.exceptions import EmptyResultSet
+from django.db import models
+
+
+class ScaledFloatField(models.FloatField):
+    """
+    A float stored as an integer number of `10 ** -scale` units, for example
+    tenths of a volt for a scale of 1. SQLite stores such an integer in 1 to 4
+    bytes instead of the 8 bytes of a REAL with decimals.
+
+    The values are rounded to the scale when they are written, and the field
+    behaves as a `FloatField` everywhere else.
+    """
+
+    def __init__(self, *args, scale: int = 1, **kwargs):
+        self.scale = scale
+        self.factor = 10**scale
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs["scale"] = self.scale
+        return name, path, args, kwargs
+
+    def db_type(self, connection) -> str:
+        return connection.data_types["IntegerField"]
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None:
+            return None
+        return round(value * self.factor)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return value / self.factor
+
+
+class _ScaledRounding:
+    """
+    Round a float bound of a comparison to a whole number of units, in the
+    direction that keeps the comparison exact.
+    """
+
+    rounding = None
+
+    def get_prep_lookup(self):
+        if isinstance(self.rhs, float):
+            factor = self.lhs.output_field.factor
+            self.rhs = self.rounding(_get_units(self.rhs, factor)) / factor
+        return super().get_prep_lookup()
+
+
+@ScaledFloatField.register_lookup
+class ScaledGreaterThan(_ScaledRounding, models.lookups.GreaterThan):
+    rounding = staticmethod(math.floor)
+
+
+@ScaledFloatField.register_lookup
+class ScaledGreaterThanOrEqual(_ScaledRounding, models.lookups.GreaterThanOrEqual):
+    rounding = staticmethod(math.ceil)
+
+
+@ScaledFloatField.register_lookup
+class ScaledLessThan(_ScaledRounding, models.lookups.LessThan):
+    rounding = staticmethod(math.ceil)
+
+
+@ScaledFloatField.register_lookup
+class ScaledLessThanOrEqual(_ScaledRounding, models.lookups.LessThanOrEqual):
+    rounding = staticmethod(math.floor)
+
+
+@ScaledFloatField.register_lookup
+class ScaledExact(models.lookups.Exact):
+    """
+    Match nothing for a value between two units, which `get_prep_value` would
+    round to a unit that the stored values do hold.
+    """
+
+    def get_prep_lookup(self):
+        self.between_units = isinstance(self.rhs, float) and not _is_whole(
+            self.rhs, self.lhs.output_field.factor
+        )
+        return super().get_prep_lookup()
+
+    def as_sql(self, compiler, connection):
+        if self.between_units:
+            raise EmptyResultSet()
+        return super().as_sql(compiler, connection)
+
+
+@ScaledFloatField.register_lookup
+class ScaledIn(models.lookups.In):
+    """Leave out the values between two units, which no stored value equals."""
+
+    def get_prep_lookup(self):
+        if isinstance(self.rhs, (list, tuple, set)):
+            factor = self.lhs.output_field.factor
+            self.rhs = [
+                value
+                for value in self.rhs
+                if not isinstance(value, float) or _is_whole(value, factor)
+            ]
+        return super().get_prep_lookup()
+
+
+def _get_units(value: float, factor: int) -> float:
+    # Round away the representation errors of the float first.
+    return round(value * factor, 6)
+
+
+def _is_whole(value: float, factor: int) -> bool:
+    return _get_units(value, factor).is_integer()
@@ -0,0 +1,164 @@
+"""
+Value filters of the GET endpoints.
+
+A filter is given as `COLUMN__OPERATOR:VALUE` (or `COLUMN:VALUE` for `eq`) in
+the `filter` query parameter. The values are type-checked against the column
+types of the columns file, and the filters are compiled to ORM lookups, so
+only the matching records are read. A column that is not indexed through the
+columns file can only be filtered on within a time range, so that a filtered
+query never scans the whole table.
+"""
+
+import re
+from functools import lru_cache
+from math import isfinite
+from typing import Callable, Dict, List, Tuple, Type
+
+from django.db.models import Model, Q
+
+from .constants import response_templates
+from .models import STATS_TABLES, columns_config
+from .utils import ResponseException
+
+OPERATORS = ("eq", "ne", "gt", "gte", "lt", "lte", "in", "isnull")
+MAX_IN_VALUES = 100
+INTEGER_PATTERN = re.compile(r"[+-]?\d+")
+
+
+@lru_cache(maxsize=None)
+def get_indexed_columns(model: Type[Model]) -> Tuple[str, ...]:
+    """Return the columns of a model which lead an index, except the primary key."""
+
+    columns = {
+        field.name
+        for field in model._meta.concrete_fields
+        if field.db_index and not field.primary_key
+    }
+    columns.update(index.fields[0] for index in model._meta.indexes)
+    return tuple(sorted(columns))
+
+
+@lru_cache(maxsize=None)
+def get_column_info(model: Type[Model]) -> Dict[str, dict]:
+    """Return the information of the columns of a model, by column name."""
+
+    for table_name, table in STATS_TABLES.items():
+        if table.model is model:
+            return {
+                column["column_name"]: column for column in columns_config[table_name]
+            }
+    return {}
+
+
+def parse_filters(filters: List[str], model: Type[Model], has_range: bool) -> Q:
+    """
+    Compile filters to a query on a model.
+
+    `ne` is compiled to a pair of ranges rather than a negation, so that
+    SQLite can still use the index of the column. Like `!=` in SQL, it never
+    matches null values.
+
+    Parameters
+    ----------
+    filters : list
+        the filters, as given in the query parameters.
+    model : django.db.models.Model
+        the model of the records.
+    has_range : bool
+        whether the records are also filtered by a time range.
+
+    Raises
+    ------
+    ResponseException
+        if a filter is malformed, has a value of the wrong type, or is on a
+        column that is not indexed without a time range.
+    """
+
+    query = Q()
+    for expression in filters:
+        column, operator, value = _parse_filter(expression, model, has_range)
+        if operator == "eq":
+            query &= Q(**{column: value})
+        elif operator == "ne":
+            query &= Q(**{f"{column}__lt": value}) | Q(**{f"{column}__gt": value})
+        else:
+            query &= Q(**{f"{column}__{operator}": value})
+    return query
+
+
+def _parse_filter(
+    expression: str, model: Type[Model], has_range: bool
+) -> Tuple[str, str, object]:
+    def invalid(reason: str) -> ResponseException:
+        return ResponseException(response_templates.invalid_filter(expression, reason))
+
+    lookup, separator, raw_value = expression.partition(":")
+    if not separator:
+        raise invalid("expected COLUMN__OPERATOR:VALUE")
+    column, _, operator = lookup.partition("__")
+    operator = operator or "eq"
+
+    column_info = get_column_info(model)
+    if column not in column_info:
+        raise invalid(f"unknown column {column}")
+    if operator not in OPERATORS:
+        raise invalid(f"the operators are {', '.join(OPERATORS)}")
+    if not has_range and column not in get_indexed_columns(model):
+        raise invalid(
+            "filtering on a column without an index needs 'since' or 'before'"
+        )
+
+    try:
+        if operator == "isnull":
+            value = _parse_isnull(raw_value, column_info[column])
+        elif operator == "in":
+            value = _parse_in(raw_value, column_info[column])
+        else:
+            value = _get_value_parser(column_info[column])(raw_value)
+    except ValueError as exc:
+        raise invalid(str(exc))
+    return column, operator, value
+
+
+def _get_value_parser(column: dict) -> Callable[[str], object]:
+    if column["column_type"] == "float":
+        return _parse_float
+    return _parse_integer
+
+
+def _parse_integer(raw_value: str) -> int:
+    if not INTEGER_PATTERN.fullmatch(raw_value):
+        raise ValueError("the value must be an integer")
+
+    value = int(raw_value)
+    if not -(2**63) <= value < 2**63:
+        raise ValueError("the value is out of range")
+    return value
+
+
+def _parse_float(raw_value: str) -> float:
+    try:
+        value = float(raw_value)
+    except ValueError:
+        raise ValueError("the value must be a number") from None
+
+    if not isfinite(value):
+        raise ValueError("the value must be finite")
+    return value
+
+
+def _parse_in(raw_value: str, column: dict) -> List[object]:
+    raw_values = raw_value.split(",")
+    if len(raw_values) > MAX_IN_VALUES:
+        raise ValueError(f"at most {MAX_IN_VALUES} values are allowed")
+
+    parse = _get_value_parser(column)
+    return [parse(value) for value in raw_values]
+
+
+def _parse_isnull(raw_value: str, column: dict) -> bool:
+    if raw_value not in ("true", "false"):
+        raise ValueError("the value must be 'true' or 'false'")
+    if column["nullable"] is not True:
+        raise ValueError(f"column {column['column_name']} is not nullable")
+    return raw_value == "true"
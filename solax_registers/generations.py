@@ -0,0 +1,40 @@
+"""
+Generation counters shared by all the worker processes.
+
+A generation is the modification time of a stamp file in `CACHE_DIR`. Reading
+it is a single `stat` call, so every request can check whether a cache built
+by any worker is still current; bumping it invalidates those caches in all the
+workers at once.
+"""
+
+from os import stat, utime
+from pathlib import Path
+from time import time_ns
+
+from django.conf import settings
+
+
+def _get_stamp_path(name: str) -> Path:
+    return Path(settings.CACHE_DIR) / "generations" / name
+
+
+def get_generation(name: str) -> int:
+    """Return the current generation of `name`, or 0 if it was never bumped."""
+
+    try:
+        return stat(_get_stamp_path(name)).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def bump_generation(name: str) -> int:
+    """Advance the generation of `name` and return the new value."""
+
+    previous = get_generation(name)
+    path = _get_stamp_path(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+
+    generation = max(time_ns(), previous + 1)
+    utime(path, ns=(generation, generation))
+    return generation
@@ -0,0 +1,336 @@
+"""Streaming imports of stats records from CSV and NDJSON files."""
+
+import codecs
+import csv
+import gzip
+import json
+from itertools import islice
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Tuple, Union
+
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from . import coverage, metrics, range_cache, recent
+from .bulk import bulk_insert, update_last_record
+from .fields import ScaledFloatField
+from .models import STATS_TABLES, columns_config
+from .synthetic import get_column_names
+
+FORMATS = ("csv", "ndjson")
+CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+MAX_REPORTED_REJECTIONS = 100
+MISSING = object()
+
+
+class ImportFormatError(ValueError):
+    """The file cannot be imported, e.g. because it has an unknown column."""
+
+
+class ImportReport:
+    """The outcome of an import, updated as the chunks are imported."""
+
+    def __init__(self):
+        self.lines = 0
+        self.inserted = 0
+        self.skipped = 0
+        self.rejected = 0
+        self.rejections = []
+
+    def reject(self, line: int, errors: Dict[str, List[str]]):
+        self.rejected += 1
+        if len(self.rejections) < MAX_REPORTED_REJECTIONS:
+            self.rejections.append({"line": line, "errors": errors})
+
+    def as_dict(self) -> dict:
+        return {
+            "lines": self.lines,
+            "inserted": self.inserted,
+            "skipped": self.skipped,
+            "rejected": self.rejected,
+            "rejections": self.rejections,
+        }
+
+
+class StatsImporter:
+    """
+    Import the records of a file into a stats table, a chunk at a time.
+
+    Parameters
+    ----------
+    table_name : str
+        the key of the table in the columns file.
+    overwrite : bool
+        whether to replace the existing records with the same timestamp. They
+        are kept and counted as skipped otherwise.
+    chunk_size : int
+        the number of lines validated and inserted at once.
+    column_map : dict, optional
+        the column of each header of the file which is not named after its
+        column. The other headers are matched to the columns by name,
+        ignoring the case.
+    """
+
+    def __init__(
+        self,
+        table_name: str,
+        overwrite: bool = False,
+        chunk_size: int = 10000,
+        column_map: Union[Dict[str, str], None] = None,
+    ):
+        self.table = STATS_TABLES[table_name]
+        self.overwrite = overwrite
+        self.chunk_size = chunk_size
+
+        self.column_names = get_column_names(
+            columns_config[table_name], self.table.date_column
+        )
+        self.date_index = self.column_names.index(self.table.date_column)
+        self.column_indexes = {
+            name.lower(): index for index, name in enumerate(self.column_names)
+        }
+        for header, column in (column_map or {}).items():
+            if column not in self.column_names:
+                raise ImportFormatError(f"Unknown column in the column map: {column}")
+            self.column_indexes[header.strip().lower()] = self.column_names.index(
+                column
+            )
+
+        model_meta = self.table.model._meta
+        self.converters = [
+            _get_converter(model_meta.get_field(name)) for name in self.column_names
+        ]
+        self._indexes_by_keys = {}
+
+    def run(
+        self,
+        stream: BinaryIO,
+        file_format: str,
+        on_chunk: Union[Callable[[ImportReport], None], None] = None,
+        on_reject: Union[Callable[[int, Dict[str, List[str]]], None], None] = None,
+    ) -> ImportReport:
+        """
+        Import a UTF-8 encoded file, read from a binary stream.
+
+        The chunks are inserted in separate transactions, so an import that
+        fails half way keeps the chunks inserted before the failure.
+
+        Raises
+        ------
+        ImportFormatError
+            if the file cannot be read, or a CSV header or the key of a JSON
+            object is not a column.
+        """
+
+        report = ImportReport()
+        lines = codecs.getreader("utf-8-sig")(stream)
+        if file_format == "csv":
+            records = self._read_csv(lines)
+        else:
+            records = self._read_ndjson(lines)
+
+        try:
+            while True:
+                chunk = list(islice(records, self.chunk_size))
+                if not chunk:
+                    break
+                self._import_chunk(chunk, report, on_reject)
+                if on_chunk is not None:
+                    on_chunk(report)
+        except (UnicodeDecodeError, gzip.BadGzipFile, EOFError, csv.Error) as exc:
+            raise ImportFormatError(f"Unreadable file: {exc}") from exc
+        finally:
+            if report.inserted:
+                update_last_record(self.table)
+                recent.notify_reset(self.table.model)
+                model_name = self.table.model._meta.model_name
+                metrics.inc(
+                    "solax_ingested_records_total", report.inserted, model=model_name
+                )
+
+        return report
+
+    def _import_chunk(self, chunk: list, report: ImportReport, on_reject):
+        rows = []
+        for line, values, errors in chunk:
+            if not errors:
+                try:
+                    rows.append(self._convert(values))
+                    continue
+                except ValidationError as exc:
+                    errors = exc.message_dict
+
+            report.reject(line, errors)
+            if on_reject is not None:
+                on_reject(line, errors)
+
+        with transaction.atomic():
+            inserted = bulk_insert(
+                self.table.model,
+                self.column_names,
+                rows,
+                batch_size=max(1, len(rows)),
+                overwrite=self.overwrite,
+            )
+            if inserted:
+                moments = [row[self.date_index] for row in rows]
+                first, last = min(moments), max(moments)
+                coverage.notify_changed(self.table.model, first, last)
+                range_cache.notify_changed(self.table.model, first, last)
+        report.lines = chunk[-1][0]
+        report.inserted += inserted
+        report.skipped += len(rows) - inserted
+
+    def _read_csv(self, lines: Iterable[str]) -> Iterator[tuple]:
+        reader = csv.reader(lines)
+        header = next(reader, None)
+        if header is None:
+            return
+
+        indexes = self._get_indexes(tuple(header))
+        for row in reader:
+            if not row:
+                continue
+            if len(row) != len(header):
+                message = f"Expected {len(header)} values, got {len(row)}."
+                yield reader.line_num, None, {"line": [message]}
+                continue
+            yield reader.line_num, self._get_values(indexes, row), None
+
+    def _read_ndjson(self, lines: Iterable[str]) -> Iterator[tuple]:
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("not an object")
+            except ValueError as exc:
+                yield line_number, None, {"line": [f"Invalid record: {exc}."]}
+                continue
+
+            # An unknown key fails the file, as an unknown CSV header does.
+            try:
+                indexes = self._get_indexes(tuple(record))
+            except ImportFormatError as exc:
+                raise ImportFormatError(f"line {line_number}: {exc}") from None
+            yield line_number, self._get_values(indexes, record.values()), None
+
+    def _get_indexes(self, keys: Tuple[str, ...]) -> Tuple[int, ...]:
+        """Return the column index of each key of a record."""
+
+        if keys not in self._indexes_by_keys:
+            normalized_keys = [key.strip().lower() for key in keys]
+            unknown = [
+                key
+                for key, normalized in zip(keys, normalized_keys)
+                if normalized not in self.column_indexes
+            ]
+            if unknown:
+                raise ImportFormatError(f"unknown columns {', '.join(unknown)}")
+
+            self._indexes_by_keys[keys] = tuple(
+                self.column_indexes[key] for key in normalized_keys
+            )
+
+        return self._indexes_by_keys[keys]
+
+    def _get_values(self, indexes: Tuple[int, ...], values: Iterable) -> list:
+        result = [MISSING] * len(self.column_names)
+        for index, value in zip(indexes, values):
+            result[index] = value
+        return result
+
+    def _convert(self, values: list) -> tuple:
+        """
+        Convert the raw values of a record to database values.
+
+        Raises
+        ------
+        django.core.exceptions.ValidationError
+            with the errors of every invalid column.
+        """
+
+        row = []
+        errors = {}
+        for name, convert, value in zip(self.column_names, self.converters, values):
+            try:
+                row.append(convert(value))
+            except ValidationError as exc:
+                errors[name] = exc.messages
+
+        if errors:
+            raise ValidationError(errors)
+        return tuple(row)
+
+
+def _get_converter(field: models.Field) -> Callable:
+    """Return a function converting a raw value of a column to a database value."""
+
+    is_temporal = isinstance(field, (models.DateField, models.DateTimeField))
+    is_datetime = isinstance(field, models.DateTimeField)
+    is_scaled = isinstance(field, ScaledFloatField)
+    is_integer = isinstance(field, models.IntegerField)
+    default_timezone = timezone.get_default_timezone()
+    low, high, has_other_validators = _get_bounds(field)
+
+    def convert(value):
+        if value is MISSING or value is None or value == "":
+            if field.null:
+                return None
+            if field.has_default():
+                default = field.get_default()
+                return field.get_prep_value(default) if is_scaled else default
+            raise ValidationError("This field is required.")
+
+        if is_integer and isinstance(value, float) and not value.is_integer():
+            # `to_python` would truncate it.
+            raise ValidationError(
+                field.error_messages["invalid"], code="invalid", params={"value": value}
+            )
+        value = field.to_python(value)
+        if is_temporal:
+            if is_datetime and timezone.is_naive(value):
+                value = timezone.make_aware(value, default_timezone)
+            return field.get_db_prep_save(value, connection)
+
+        if has_other_validators or not low <= value <= high:
+            field.run_validators(value)
+        if is_scaled:
+            return field.get_prep_value(value)
+        return value
+
+    return convert
+
+
+def _get_bounds(field: models.Field) -> Tuple[float, float, bool]:
+    """
+    Return the bounds set by the min and max validators of a field, so that the
+    validators only have to run for the values out of bounds.
+    """
+
+    low, high = float("-inf"), float("inf")
+    has_other_validators = False
+    for validator in field.validators:
+        limit = validator.limit_value if hasattr(validator, "limit_value") else None
+        if isinstance(validator, MinValueValidator) and not callable(limit):
+            low = max(low, limit)
+        elif isinstance(validator, MaxValueValidator) and not callable(limit):
+            high = min(high, limit)
+        else:
+            has_other_validators = True
+    return low, high, has_other_validators
+
+
+def open_file(stream: BinaryIO, compressed: bool) -> BinaryIO:
+    """Return a stream of the decompressed content of a gzip compressed stream."""
+
+    if compressed:
+        return gzip.GzipFile(fileobj=stream, mode="rb")
+    return stream
@@ -0,0 +1,41 @@
+"""File locks shared by the worker processes."""
+
+import fcntl
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from time import monotonic, sleep
+
+WAIT_PAUSE = 0.005
+
+
+@contextmanager
+def open_lock_file(path: Path):
+    """Open a lock file, whose locks are released when it is closed."""
+
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        yield fd
+    finally:
+        os.close(fd)
+
+
+def try_lock(fd: int, operation: int) -> bool:
+    """Take a `flock` without waiting, and return whether it was taken."""
+
+    try:
+        fcntl.flock(fd, operation | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def wait_lock(fd: int, operation: int, timeout: float) -> bool:
+    """Take a `flock` within `timeout` seconds, and return whether it was taken."""
+
+    deadline = monotonic() + timeout
+    while not try_lock(fd, operation):
+        if monotonic() >= deadline:
+            return False
+        sleep(WAIT_PAUSE)
+    return True
@@ -0,0 +1,101 @@
+from datetime import date, datetime, time, timedelta, timezone
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from solax_registers import coverage, range_cache, recent
+from solax_registers.bulk import bulk_insert, relaxed_durability, update_last_record
+from solax_registers.models import STATS_TABLES, columns_config
+from solax_registers.synthetic import generate_realistic_rows, get_column_names
+
+STEPS = {"minute_stats": timedelta(minutes=1), "daily_stats": timedelta(days=1)}
+
+
+class Command(BaseCommand):
+    help = "Generates realistic minute and daily stats for capacity testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument("days", type=int, help="The number of days to generate.")
+        parser.add_argument(
+            "--end",
+            type=date.fromisoformat,
+            default=date.today(),
+            help="The day after the last generated day. Default: today.",
+        )
+        parser.add_argument(
+            "--tables",
+            nargs="+",
+            choices=list(STATS_TABLES),
+            default=list(STATS_TABLES),
+            help="The tables to fill. Default: all of them.",
+        )
+        parser.add_argument(
+            "--null-rate",
+            type=float,
+            default=0.001,
+            help="The probability of a null value in a nullable column.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100000,
+            help="The number of records inserted in one transaction.",
+        )
+        parser.add_argument(
+            "--overwrite",
+            action="store_true",
+            help="Replace the existing records with the same timestamp.",
+        )
+
+    def handle(self, *args, **kwargs):
+        start_date = kwargs["end"] - timedelta(days=kwargs["days"])
+
+        with relaxed_durability():
+            for table_name in kwargs["tables"]:
+                table = STATS_TABLES[table_name]
+                step = STEPS[table_name]
+                start = start_date
+                if table_name == "minute_stats":
+                    start = datetime.combine(start_date, time(), timezone.utc)
+
+                count = int(timedelta(days=kwargs["days"]) / step)
+                rows = generate_realistic_rows(
+                    columns_config[table_name],
+                    start,
+                    count,
+                    step,
+                    seed=kwargs["seed"],
+                    null_rate=kwargs["null_rate"],
+                )
+                self._load(table_name, table, rows, **kwargs)
+
+    def _load(self, table_name, table, rows, **kwargs):
+        started = perf_counter()
+
+        def report_progress(inserted: int):
+            rate = inserted / (perf_counter() - started) * 60
+            self.stdout.write(
+                f"{table_name}: {inserted} records inserted ({rate:,.0f}/min)"
+            )
+
+        column_names = get_column_names(columns_config[table_name], table.date_column)
+        inserted = bulk_insert(
+            table.model,
+            column_names,
+            rows,
+            batch_size=kwargs["batch_size"],
+            overwrite=kwargs["overwrite"],
+            on_batch=report_progress,
+        )
+        update_last_record(table)
+        coverage.notify_changed(table.model)
+        range_cache.notify_changed(table.model)
+        recent.notify_reset(table.model)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{table_name}: {inserted} records inserted in "
+                f"{perf_counter() - started:.1f}s"
+            )
+        )
@@ -0,0 +1,111 @@
+import sys
+from pathlib import Path
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from solax_registers.bulk import relaxed_durability
+from solax_registers.imports import (
+    FORMATS,
+    ImportFormatError,
+    ImportReport,
+    StatsImporter,
+    open_file,
+)
+from solax_registers.models import STATS_TABLES
+
+SUFFIXES = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+
+
+def parse_mapping(mapping: str) -> tuple:
+    header, separator, column = mapping.partition("=")
+    if not separator:
+        raise ValueError(mapping)
+    return header, column
+
+
+class Command(BaseCommand):
+    help = "Imports stats records from a CSV or NDJSON file, optionally gzipped."
+
+    def add_arguments(self, parser):
+        parser.add_argument("table", choices=list(STATS_TABLES))
+        parser.add_argument("file", help="The file to import, or - for stdin.")
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="The format of the file. Default: guessed from its extension.",
+        )
+        parser.add_argument(
+            "--overwrite",
+            action="store_true",
+            help="Replace the existing records with the same timestamp.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=10000,
+            help="The number of lines validated and inserted at once.",
+        )
+        parser.add_argument(
+            "--map",
+            type=parse_mapping,
+            nargs="+",
+            default=[],
+            metavar="HEADER=COLUMN",
+            help="The column of a header which is not named after its column.",
+        )
+
+    def handle(self, *args, **kwargs):
+        path = Path(kwargs["file"])
+        file_format = kwargs["format"] or self._guess_format(path)
+        compressed = path.suffix == ".gz"
+
+        try:
+            importer = StatsImporter(
+                kwargs["table"],
+                overwrite=kwargs["overwrite"],
+                chunk_size=kwargs["chunk_size"],
+                column_map=dict(kwargs["map"]),
+            )
+            with self._open(path) as stream, relaxed_durability():
+                report = self._import(
+                    importer, open_file(stream, compressed), file_format
+                )
+        except ImportFormatError as exc:
+            raise CommandError(exc) from exc
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{report.lines} lines read: {report.inserted} records inserted, "
+                f"{report.skipped} skipped, {report.rejected} rejected"
+            )
+        )
+
+    def _import(self, importer, stream, file_format) -> ImportReport:
+        started = perf_counter()
+
+        def report_progress(report: ImportReport):
+            rate = report.lines / (perf_counter() - started) * 60
+            self.stdout.write(f"{report.lines} lines read ({rate:,.0f}/min)")
+
+        def report_rejection(line: int, errors: dict):
+            for column, messages in errors.items():
+                self.stderr.write(f"line {line}: {column}: {' '.join(messages)}")
+
+        return importer.run(
+            stream, file_format, on_chunk=report_progress, on_reject=report_rejection
+        )
+
+    def _open(self, path: Path):
+        if str(path) == "-":
+            return open(sys.stdin.fileno(), "rb", closefd=False)
+        try:
+            return open(path, "rb")
+        except OSError as exc:
+            raise CommandError(exc) from exc
+
+    def _guess_format(self, path: Path) -> str:
+        suffixes = [suffix for suffix in path.suffixes if suffix != ".gz"]
+        if suffixes and suffixes[-1] in SUFFIXES:
+            return SUFFIXES[suffixes[-1]]
+        raise CommandError("Cannot guess the format of the file; use --format.")
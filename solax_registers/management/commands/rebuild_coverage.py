@@ -0,0 +1,23 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from solax_registers import coverage
+from solax_registers.models import MinuteStatsRun
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the coverage index of the minute stats from the records."
+
+    def handle(self, *args, **kwargs):
+        started = perf_counter()
+        with transaction.atomic():
+            coverage.rebuild()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{MinuteStatsRun.objects.count()} runs of minutes indexed in "
+                f"{perf_counter() - started:.1f}s"
+            )
+        )
@@ -0,0 +1,49 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.functions import Round
+
+from solax_registers import range_cache, recent
+from solax_registers.fields import ScaledFloatField
+from solax_registers.models import STATS_TABLES
+
+
+class Command(BaseCommand):
+    help = (
+        "Converts the stored values of a float column to the scale it has in the "
+        "columns file, after its scale was changed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("table", choices=list(STATS_TABLES))
+        parser.add_argument("column")
+        parser.add_argument(
+            "--from-scale",
+            type=int,
+            help="The scale the values were stored with. Default: none, the "
+            "values were stored as floats.",
+        )
+
+    def handle(self, *args, **kwargs):
+        table = STATS_TABLES[kwargs["table"]]
+        column = kwargs["column"]
+        try:
+            field = table.model._meta.get_field(column)
+        except FieldDoesNotExist:
+            raise CommandError(f"Unknown column: {column}") from None
+        if not isinstance(field, models.FloatField):
+            raise CommandError(f"Not a float column: {column}")
+
+        scale = field.scale if isinstance(field, ScaledFloatField) else 0
+        value = F(column) * 10.0 ** (scale - (kwargs["from_scale"] or 0))
+        if isinstance(field, ScaledFloatField):
+            value = Round(value)
+
+        with transaction.atomic():
+            rescaled = table.model.objects.update(**{column: value})
+            table.last_record_model.objects.update(**{column: value})
+            range_cache.notify_changed(table.model)
+        recent.notify_reset(table.model)
+
+        self.stdout.write(self.style.SUCCESS(f"{rescaled} records rescaled"))
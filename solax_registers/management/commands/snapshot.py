@@ -0,0 +1,76 @@
+from pathlib import Path
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from solax_registers.snapshots import (
+    DEFAULT_PAGES,
+    DEFAULT_PAUSE,
+    SnapshotBusy,
+    backup,
+    create_temporary_snapshot,
+    read_snapshot,
+)
+
+
+class Command(BaseCommand):
+    help = "Copies the database to a file, without stopping the application."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "output", help="The file of the copy. A .gz file is gzip compressed."
+        )
+        parser.add_argument(
+            "--pages",
+            type=int,
+            default=DEFAULT_PAGES,
+            help="The number of pages copied in one step.",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=DEFAULT_PAUSE,
+            help="The seconds to wait between two steps, for the writers.",
+        )
+
+    def handle(self, *args, **kwargs):
+        output = Path(kwargs["output"])
+        partial_output = output.with_name(output.name + ".partial")
+        started = perf_counter()
+        last_percent = -1
+
+        def report_progress(copied: int, total: int):
+            nonlocal last_percent
+            percent = copied * 100 // max(1, total)
+            if percent // 10 > last_percent // 10:
+                self.stdout.write(f"{copied} of {total} pages copied ({percent}%)")
+            last_percent = percent
+
+        options = {
+            "pages": kwargs["pages"],
+            "pause": kwargs["pause"],
+            "on_progress": report_progress,
+        }
+        try:
+            if output.suffix == ".gz":
+                snapshot = create_temporary_snapshot(**options)
+                with open(partial_output, "wb") as file:
+                    for chunk in read_snapshot(snapshot, compress=True):
+                        file.write(chunk)
+            else:
+                partial_output.unlink(missing_ok=True)
+                backup(partial_output, **options)
+            partial_output.replace(output)
+        except SnapshotBusy:
+            raise CommandError(
+                "The database was written to during every attempt to copy it. "
+                "Retry later, or with more --pages and a shorter --pause."
+            ) from None
+        finally:
+            partial_output.unlink(missing_ok=True)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Snapshot written to {output} in {perf_counter() - started:.1f}s"
+            )
+        )
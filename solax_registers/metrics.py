@@ -0,0 +1,267 @@
+"""
+Prometheus-style metrics shared by all the worker processes.
+
+Every process keeps its own counters and histograms in memory and
+periodically writes a snapshot of them to `METRICS_DIR/<pid>.json`. The
+`/metrics` endpoint merges the snapshots of all the processes, so the
+result does not depend on which worker answers the scrape. The snapshots of
+the workers which exited are merged into `METRICS_DIR/exited.json`.
+"""
+
+import json
+from collections import defaultdict
+from os import getpid, replace
+from pathlib import Path
+from threading import Lock
+from time import monotonic
+from typing import Dict, List, Tuple, Union
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+METRICS = {
+    "solax_http_request_duration_seconds": (
+        "histogram",
+        "Request latency by endpoint and method.",
+        LATENCY_BUCKETS,
+    ),
+    "solax_rows_returned": (
+        "histogram",
+        "Number of records returned by GET requests.",
+        ROW_BUCKETS,
+    ),
+    "solax_db_queries_per_request": (
+        "histogram",
+        "Number of SQL queries made by a request.",
+        QUERY_BUCKETS,
+    ),
+    "solax_db_query_duration_seconds": (
+        "histogram",
+        "Time spent in SQL queries by a request.",
+        LATENCY_BUCKETS,
+    ),
+    "solax_ingested_records_total": (
+        "counter",
+        "Number of records stored.",
+        None,
+    ),
+    "solax_recent_window_queries_total": (
+        "counter",
+        "Number of range queries looked up in the recent window, by result.",
+        None,
+    ),
+    "solax_range_cache_queries_total": (
+        "counter",
+        "Number of range queries looked up in the range cache, by result.",
+        None,
+    ),
+    "solax_range_cache_evictions_total": (
+        "counter",
+        "Number of responses evicted from the range cache.",
+        None,
+    ),
+    "solax_coalesced_queries_total": (
+        "counter",
+        "Number of range queries answered by an identical running query, by scope.",
+        None,
+    ),
+    "solax_over_budget_queries_total": (
+        "counter",
+        "Number of range queries refused for selecting more than the row budget.",
+        None,
+    ),
+    "solax_throttled_requests_total": (
+        "counter",
+        "Number of requests refused because their pool had no free slot, by pool.",
+        None,
+    ),
+    "solax_sqlite_busy_errors_total": (
+        "counter",
+        "Number of SQL queries which failed because the database was locked.",
+        None,
+    ),
+    "solax_sqlite_lock_wait_seconds_total": (
+        "counter",
+        "Time spent waiting for a locked database by the queries which failed.",
+        None,
+    ),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+EXITED_FILE = "exited.json"
+
+_lock = Lock()
+_counters: Dict[Tuple[str, Labels], float] = defaultdict(float)
+_histograms: Dict[Tuple[str, Labels], List[float]] = {}
+_last_flush = 0.0
+
+
+def _get_labels(labels: dict) -> Labels:
+    return tuple(sorted(labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels):
+    """Increment a counter."""
+
+    with _lock:
+        _counters[(name, _get_labels(labels))] += value
+
+
+def observe(name: str, value: float, **labels):
+    """Add an observation to a histogram."""
+
+    buckets = METRICS[name][2]
+    key = (name, _get_labels(labels))
+
+    with _lock:
+        # one slot per bucket, then the sum and the count
+        histogram = _histograms.setdefault(key, [0.0] * (len(buckets) + 2))
+        for index, bound in enumerate(buckets):
+            if value <= bound:
+                histogram[index] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+
+def _get_metrics_dir() -> Path:
+    return Path(settings.METRICS_DIR)
+
+
+def flush(force: bool = False):
+    """Write this process' metrics to the metrics directory."""
+
+    global _last_flush
+
+    now = monotonic()
+    if not force and now - _last_flush < settings.METRICS_FLUSH_INTERVAL:
+        return
+    _last_flush = now
+
+    with _lock:
+        snapshot = {
+            "counters": [[n, labels, v] for (n, labels), v in _counters.items()],
+            "histograms": [[n, labels, h] for (n, labels), h in _histograms.items()],
+        }
+
+    metrics_dir = _get_metrics_dir()
+    metrics_dir.mkdir(parents=True, exist_ok=True)
+    _write_snapshot(metrics_dir / f"{getpid()}.json", snapshot)
+
+
+def collect() -> Tuple[dict, dict]:
+    """Merge the metrics of all the processes."""
+
+    flush(force=True)
+
+    counters = defaultdict(float)
+    histograms = {}
+    for path in _get_metrics_dir().glob("*.json"):
+        snapshot = _read_snapshot(path)
+        if snapshot is not None:
+            _merge(snapshot, counters, histograms)
+
+    return counters, histograms
+
+
+def merge_exited(metrics_dir: Path, pid: int):
+    """
+    Merge the snapshot of a worker which exited into `EXITED_FILE`, and remove
+    it, so that the snapshots do not pile up as the workers are recycled, and
+    a new worker with the same pid does not overwrite them.
+
+    Called by the gunicorn master, which is the only writer of `EXITED_FILE`.
+    """
+
+    path = Path(metrics_dir) / f"{pid}.json"
+    snapshot = _read_snapshot(path)
+    if snapshot is None:
+        return
+
+    exited_path = Path(metrics_dir) / EXITED_FILE
+    counters = defaultdict(float)
+    histograms = {}
+    for merged in (_read_snapshot(exited_path), snapshot):
+        if merged is not None:
+            _merge(merged, counters, histograms)
+
+    _write_snapshot(
+        exited_path,
+        {
+            "counters": [[n, labels, v] for (n, labels), v in counters.items()],
+            "histograms": [[n, labels, h] for (n, labels), h in histograms.items()],
+        },
+    )
+    path.unlink()
+
+
+def _read_snapshot(path: Path) -> Union[dict, None]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _write_snapshot(path: Path, snapshot: dict):
+    temporary_path = path.with_suffix(".tmp")
+    temporary_path.write_text(json.dumps(snapshot), encoding="utf-8")
+    replace(temporary_path, path)
+
+
+def _merge(snapshot: dict, counters: dict, histograms: dict):
+    for name, labels, value in snapshot["counters"]:
+        counters[(name, tuple(map(tuple, labels)))] += value
+
+    for name, labels, values in snapshot["histograms"]:
+        key = (name, tuple(map(tuple, labels)))
+        merged = histograms.setdefault(key, [0.0] * len(values))
+        for index, value in enumerate(values):
+            merged[index] += value
+
+
+def _format_value(value: float) -> str:
+    # `g` would keep 6 significant digits, and make 1234567 `1.23457e+06`.
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _format_labels(labels: Labels, **extra) -> str:
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+
+def render() -> str:
+    """Return the merged metrics in the Prometheus text format."""
+
+    counters, histograms = collect()
+
+    lines = []
+    for name, (metric_type, description, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+        if metric_type == "counter":
+            for (metric_name, labels), value in sorted(counters.items()):
+                if metric_name == name:
+                    value = _format_value(value)
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+            continue
+
+        for (metric_name, labels), values in sorted(histograms.items()):
+            if metric_name != name:
+                continue
+            count, total = _format_value(values[-1]), _format_value(values[-2])
+            for bound, value in zip(buckets, values):
+                labels_text = _format_labels(labels, le=_format_value(bound))
+                lines.append(f"{name}_bucket{labels_text} {_format_value(value)}")
+            labels_text = _format_labels(labels, le="+Inf")
+            lines.append(f"{name}_bucket{labels_text} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,88 @@
+"""The custom middleware file."""
+
+from time import perf_counter
+
+from django.contrib.auth import middleware as auth_middleware
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages import middleware as messages_middleware
+from django.contrib.sessions import middleware as sessions_middleware
+from django.db import connection
+from django.http import HttpRequest
+from django.utils.functional import SimpleLazyObject
+
+from . import metrics
+from .db import QueryCollector
+
+
+def is_token_request(request: HttpRequest) -> bool:
+    """Check if a request is authenticated with an API token."""
+
+    return request.META.get("HTTP_AUTHORIZATION", "").startswith("Token ")
+
+
+class SkipForTokenRequestsMixin:
+    """Bypasses the wrapped middleware for token-authenticated requests."""
+
+    def process_request(self, request: HttpRequest):
+        if is_token_request(request):
+            return None
+        return super().process_request(request)
+
+    def process_response(self, request: HttpRequest, response):
+        process_response = getattr(super(), "process_response", None)
+        if process_response is None or is_token_request(request):
+            return response
+        return process_response(request, response)
+
+
+class SessionMiddleware(
+    SkipForTokenRequestsMixin, sessions_middleware.SessionMiddleware
+):
+    """Loads and saves the session only for browser and password clients."""
+
+
+class AuthenticationMiddleware(
+    SkipForTokenRequestsMixin, auth_middleware.AuthenticationMiddleware
+):
+    """
+    Resolves the session user only for browser and password clients. The
+    token requests get an anonymous user, which the API views replace with the
+    user of the token, so that the other views still find a user.
+    """
+
+    def process_request(self, request: HttpRequest):
+        if is_token_request(request):
+            request.user = SimpleLazyObject(AnonymousUser)
+            return None
+        return super().process_request(request)
+
+
+class MessageMiddleware(
+    SkipForTokenRequestsMixin, messages_middleware.MessageMiddleware
+):
+    """Sets up the message storage only for browser and password clients."""
+
+
+class MetricsMiddleware:
+    """Records the latency and the SQL queries of every request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest):
+        start = perf_counter()
+        collector = QueryCollector()
+        with connection.execute_wrapper(collector):
+            response = self.get_response(request)
+
+        resolver_match = request.resolver_match
+        endpoint = resolver_match.url_name if resolver_match else None
+        labels = {"endpoint": endpoint or "unmatched", "method": request.method}
+
+        metrics.observe(
+            "solax_http_request_duration_seconds", perf_counter() - start, **labels
+        )
+        metrics.observe("solax_db_queries_per_request", collector.count, **labels)
+        metrics.observe("solax_db_query_duration_seconds", collector.duration, **labels)
+        metrics.flush()
+        return response
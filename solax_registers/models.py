@@ -1,8 +1,10 @@
 """All the models of this app."""
 
+from typing import NamedTuple, Type
+
 from django.db import models
 
-from solax_registers.utils import parse_column_info
+from solax_registers.utils import get_column_indexes, parse_column_info
 from .utils import read_columns_file
 
 
@@ -17,6 +19,9 @@ class MinuteStatsRecord(models.Model):
     for column_info in columns_config["minute_stats"]:
         locals()[column_info["column_name"]] = parse_column_info(column_info)
 
+    class Meta:
+        indexes = get_column_indexes(columns_config["minute_stats"], "upload_time")
+
     def __repr__(self):
         return str(self.upload_time)
 
@@ -27,12 +32,24 @@ class LastMinuteStatsRecord(models.Model):
     upload_time = models.DateTimeField()
 
     for column_info in columns_config["minute_stats"]:
-        locals()[column_info["column_name"]] = parse_column_info(column_info)
+        locals()[column_info["column_name"]] = parse_column_info(
+            column_info, with_index=False
+        )
 
     def __repr__(self):
         return str(self.upload_time)
 
 
+class MinuteStatsRun(models.Model):
+    """Represents a run of consecutive minutes which all have minute stats."""
+
+    first_minute = models.DateTimeField(primary_key=True)
+    last_minute = models.DateTimeField(db_index=True)
+
+    def __repr__(self):
+        return f"{self.first_minute} - {self.last_minute}"
+
+
 class DailyStatsRecord(models.Model):
     """Represents daily inverter data."""
 
@@ -41,6 +58,9 @@ class DailyStatsRecord(models.Model):
     for column_info in columns_config["daily_stats"]:
         locals()[column_info["column_name"]] = parse_column_info(column_info)
 
+    class Meta:
+        indexes = get_column_indexes(columns_config["daily_stats"], "upload_date")
+
     def __repr__(self):
         return str(self.upload_date)
 
@@ -51,7 +71,23 @@ class LastDayStatsRecord(models.Model):
     upload_date = models.DateField()
 
     for column_info in columns_config["daily_stats"]:
-        locals()[column_info["column_name"]] = parse_column_info(column_info)
+        locals()[column_info["column_name"]] = parse_column_info(
+            column_info, with_index=False
+        )
 
     def __repr__(self):
         return str(self.upload_date)
+
+
+class StatsTable(NamedTuple):
+    """A stats table, as configured under a key of the columns file."""
+
+    model: Type[models.Model]
+    last_record_model: Type[models.Model]
+    date_column: str
+
+
+STATS_TABLES = {
+    "minute_stats": StatsTable(MinuteStatsRecord, LastMinuteStatsRecord, "upload_time"),
+    "daily_stats": StatsTable(DailyStatsRecord, LastDayStatsRecord, "upload_date"),
+}
@@ -1,27 +1,71 @@
 """The custom permissions file."""
 
+from typing import Dict, Iterable, Tuple, Type
+
+from django.db.models import Model
+
 from rest_framework.permissions import BasePermission
 from rest_framework.request import Request
 
-from .utils import has_user_permission
+from .authentication import get_cached_permissions
+from .utils import get_permission_string
+
+MAPPINGS = {"GET": "view", "POST": "add", "DELETE": "delete"}
+
+
+def has_model_permissions(
+    request: Request, models: Iterable[Type[Model]], action: str
+) -> bool:
+    """Check if the user of a request may perform an action on all the models."""
+
+    user = request.user
+    if user.is_active and user.is_superuser:
+        return True
+
+    required_permissions = {
+        get_permission_string(model._meta.app_label, model, action) for model in models
+    }
+    return get_cached_permissions(user, request.auth).issuperset(required_permissions)
 
 
 class HasModelPermission(BasePermission):
-    """Checks if a user has permission for a specified action on a custom model."""
+    """
+    Checks if a user has permission for a specified action on a custom model.
+
+    A view may map some of its methods to other actions than `MAPPINGS` in a
+    `method_actions` attribute.
+    """
+
+    _required_permissions: Dict[type, Dict[str, Tuple[str, ...]]] = {}
 
     def has_permission(self, request: Request, view):
         if request.method in ("OPTIONS", "HEAD"):
             return True
 
-        MAPPINGS = {"GET": "view", "POST": "add", "DELETE": "delete"}
-        action = MAPPINGS[request.method]
-
         user = request.user
-        model1, model2 = view.model, view.last_record_model
-        app_name = self._get_app_name(model1)
-        has_access_to_model1 = has_user_permission(app_name, model1, action, user)
-        has_access_to_model2 = has_user_permission(app_name, model2, action, user)
-        return has_access_to_model1 and has_access_to_model2
+        if user.is_active and user.is_superuser:
+            return True
+
+        required_permissions = self._get_required_permissions(view)
+        permissions = get_cached_permissions(user, request.auth)
+        return permissions.issuperset(required_permissions[request.method])
+
+    def _get_required_permissions(self, view) -> Dict[str, Tuple[str, ...]]:
+        """Return the permissions each method of a view requires."""
+
+        view_class = type(view)
+        if view_class not in self._required_permissions:
+            models = (view.model, view.last_record_model)
+            app_name = self._get_app_name(view.model)
+            mappings = {**MAPPINGS, **getattr(view, "method_actions", {})}
+            self._required_permissions[view_class] = {
+                method: tuple(
+                    get_permission_string(app_name, model, action) for model in models
+                )
+                for method, action in mappings.items()
+            }
+
+        return self._required_permissions[view_class]
 
     def _get_app_name(self, model) -> str:
         """Finds the app name of a given view."""
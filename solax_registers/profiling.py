@@ -0,0 +1,130 @@
+"""
+Opt-in request profiling for staff users.
+
+A staff user can profile a request by sending the `X-Profile: 1` header or the
+`profile=1` query parameter. The response then carries a `Server-Timing`
+header that breaks the time of the view down into the `db`, `serialize` and
+`render` phases, and if `PROFILE_DIR` is set, the cProfile statistics of the
+request are dumped there for offline analysis with `pstats` or `snakeviz`.
+"""
+
+from contextlib import ExitStack, contextmanager
+from cProfile import Profile
+from datetime import datetime
+from os import getpid
+from pathlib import Path
+from time import perf_counter
+from typing import Union
+
+from django.conf import settings
+from django.db import connection
+from rest_framework.request import Request
+
+from .db import QueryCollector
+
+TRUE_VALUES = ("1", "true")
+
+
+class RequestProfile:
+    """The timings and the cProfile statistics of one request."""
+
+    def __init__(self):
+        self.phases = {"db": 0.0, "serialize": 0.0, "render": 0.0}
+        self.collector = QueryCollector()
+        self.profiler = Profile()
+        self._exit_stack = ExitStack()
+        self._start = 0.0
+        self.total = 0.0
+
+    def start(self):
+        self._exit_stack.enter_context(connection.execute_wrapper(self.collector))
+        self._start = perf_counter()
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+        self.total = perf_counter() - self._start
+        self._exit_stack.close()
+        self.phases["db"] = self.collector.duration
+
+    def get_server_timing(self) -> str:
+        timings = {**self.phases, "total": self.total}
+        return ", ".join(
+            f"{name};dur={duration * 1000:.3f}" for name, duration in timings.items()
+        )
+
+    def dump(self, name: str) -> Path:
+        profile_dir = Path(settings.PROFILE_DIR)
+        profile_dir.mkdir(parents=True, exist_ok=True)
+
+        timestamp = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+        path = profile_dir / f"{timestamp}-{name}-{getpid()}.prof"
+        self.profiler.dump_stats(path)
+        return path
+
+
+def is_profiling_requested(request: Request) -> bool:
+    """Check if a staff user asked for the request to be profiled."""
+
+    requested = (
+        request.headers.get("X-Profile", "").lower() in TRUE_VALUES
+        or request.query_params.get("profile", "").lower() in TRUE_VALUES
+    )
+    return requested and request.user.is_staff
+
+
+def get_profile(request: Request) -> Union[RequestProfile, None]:
+    return getattr(request, "profile", None)
+
+
+@contextmanager
+def phase(request: Request, name: str):
+    """
+    Add the time spent in the block to a phase of a profiled request.
+
+    The time of the SQL queries made in the block is left to the `db` phase.
+    """
+
+    profile = get_profile(request)
+    if profile is None:
+        yield
+        return
+
+    start = perf_counter()
+    db_start = profile.collector.duration
+    try:
+        yield
+    finally:
+        db_duration = profile.collector.duration - db_start
+        duration = perf_counter() - start - db_duration
+        profile.phases[name] = profile.phases.get(name, 0.0) + duration
+
+
+class ProfiledViewMixin:
+    """Profiles the handlers of a view when a staff user asks for it."""
+
+    def initial(self, request: Request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+
+        if is_profiling_requested(request):
+            request.profile = RequestProfile()
+            request.profile.start()
+
+    def finalize_response(self, request: Request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+
+        profile = get_profile(request)
+        if profile is None:
+            return response
+
+        if hasattr(response, "render"):
+            with phase(request, "render"):
+                response.render()
+        profile.stop()
+
+        response["Server-Timing"] = profile.get_server_timing()
+        if settings.PROFILE_DIR:
+            url_name = request.resolver_match.url_name
+            path = profile.dump(f"{url_name}-{request.method.lower()}")
+            response["X-Profile-File"] = path.name
+        return response
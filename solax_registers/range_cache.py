@@ -0,0 +1,293 @@
+"""
+A cache on disk of the responses to range queries of the past.
+
+The records of a table older than its `IMMUTABLE_AFTER` only change when a
+record of the past is posted, imported, overwritten or deleted, so the JSON
+bodies of the range queries whose `before` bound is that old are kept in a
+SQLite file in `CACHE_DIR`, shared by all the worker processes, with a least
+recently used eviction once they take `RANGE_CACHE_MB` megabytes.
+
+Every write of records of the past removes the entries whose range overlaps
+the changed span after its commit, and advances a counter of the table, so
+that a query which started before the commit drops its response instead of
+storing it.
+"""
+
+import logging
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from threading import local
+from time import time
+from typing import NamedTuple, Type, Union
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, models, transaction
+from django.utils import timezone
+from . import metrics
+from .models import STATS_TABLES
+from .utils import accepts_plain_json, render_json
+
+IMMUTABLE_AFTER = {
+    "minute_stats": timedelta(minutes=10),
+    "daily_stats": timedelta(days=2),
+}
+# The least recently used time of an entry is only updated this often.
+TOUCH_INTERVAL = 60
+# The largest share of the cache that a single response may take.
+MAX_ENTRY_SHARE = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    since TEXT NOT NULL,
+    before TEXT NOT NULL,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_by_range ON entries (model, before, since);
+CREATE INDEX IF NOT EXISTS entries_by_use ON entries (used);
+CREATE TABLE IF NOT EXISTS counters (
+    model TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+logger = logging.getLogger(__name__)
+
+_connections = local()
+
+
+class Lookup(NamedTuple):
+    """The cache entry of a range query, with its body if it was cached."""
+
+    key: str
+    model: str
+    since: str
+    before: str
+    counter: int
+    body: Union[bytes, None]
+
+
+def lookup(view, date_column: str, config: dict) -> Union[Lookup, None]:
+    """
+    Look up the response of a range query of a stats view, or return None if
+    the response may not be cached.
+    """
+
+    request = view.request
+    since, before = config["range"]
+    if (
+        settings.RANGE_CACHE_MB <= 0
+        or before is None
+        or not accepts_plain_json(request)
+    ):
+        return None
+
+    model = view.model
+    field = model._meta.get_field(date_column)
+    try:
+        before = _parse(field, before)
+        since = None if since is None else _parse(field, since)
+    except ValidationError:
+        return None
+    if before >= _get_immutable_bound(model, field):
+        return None
+
+    since = "" if since is None else str(field.get_db_prep_value(since, connection))
+    before = str(field.get_db_prep_value(before, connection))
+    label = model._meta.label_lower
+    key = repr(
+        (
+            label,
+            since,
+            before,
+            tuple(config["fields"]),
+            tuple(request.query_params.getlist("filter")),
+            config["last"],
+        )
+    )
+
+    try:
+        counter, body, used = (
+            _get_connection()
+            .execute(
+                "SELECT (SELECT value FROM counters WHERE model = ?), body, used "
+                "FROM (SELECT NULL) LEFT JOIN entries ON key = ?",
+                (label, key),
+            )
+            .fetchone()
+        )
+        if body is not None and used < time() - TOUCH_INTERVAL:
+            _get_connection().execute(
+                "UPDATE entries SET used = ? WHERE key = ?", (time(), key)
+            )
+    except sqlite3.Error:
+        logger.exception("Could not read the range cache")
+        return None
+
+    metrics.inc(
+        "solax_range_cache_queries_total", result="miss" if body is None else "hit"
+    )
+    return Lookup(key, label, since, before, counter or 0, body)
+
+
+def store(entry: Lookup, view, data) -> bytes:
+    """
+    Render the response of a range query, and cache it unless the table was
+    written since the entry was looked up.
+    """
+
+    body = render_json(view, data)
+    limit = settings.RANGE_CACHE_MB * 1024 * 1024
+    if len(body) > limit // MAX_ENTRY_SHARE:
+        return body
+
+    try:
+        with _writing() as cache:
+            (counter,) = cache.execute(
+                "SELECT coalesce(max(value), 0) FROM counters WHERE model = ?",
+                (entry.model,),
+            ).fetchone()
+            if counter != entry.counter:
+                return body
+
+            cache.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    entry.key,
+                    entry.model,
+                    entry.since,
+                    entry.before,
+                    body,
+                    len(body),
+                    time(),
+                ),
+            )
+            _evict(cache, limit)
+    except sqlite3.Error:
+        logger.exception("Could not write to the range cache")
+    return body
+
+
+def notify_changed(
+    model: Type[models.Model],
+    first: Union[datetime, date, str, None] = None,
+    last: Union[datetime, date, str, None] = None,
+):
+    """
+    Remove the cached responses whose range overlaps the records changed
+    between `first` and `last`, after the commit.
+    """
+
+    if settings.RANGE_CACHE_MB <= 0:
+        return
+
+    table = STATS_TABLES[_get_table_name(model)]
+    field = model._meta.get_field(table.date_column)
+    first = None if first is None else _parse(field, first)
+    last = None if last is None else _parse(field, last)
+
+    def invalidate():
+        # Only the ranges older than the immutable bound are ever cached.
+        if first is not None and first >= _get_immutable_bound(model, field):
+            return
+
+        label = model._meta.label_lower
+        conditions, params = ["model = ?"], [label]
+        if first is not None:
+            conditions.append("before >= ?")
+            params.append(str(field.get_db_prep_value(first, connection)))
+        if last is not None:
+            conditions.append("since <= ?")
+            params.append(str(field.get_db_prep_value(last, connection)))
+
+        try:
+            with _writing() as cache:
+                cache.execute(
+                    "INSERT INTO counters VALUES (?, 1) "
+                    "ON CONFLICT (model) DO UPDATE SET value = value + 1",
+                    (label,),
+                )
+                cache.execute(
+                    f"DELETE FROM entries WHERE {' AND '.join(conditions)}", params
+                )
+        except sqlite3.Error:
+            logger.exception("Could not invalidate the range cache of %s", label)
+
+    transaction.on_commit(invalidate)
+
+
+def _parse(field: models.Field, value) -> Union[datetime, date]:
+    value = field.to_python(value)
+    if value is None:
+        raise ValidationError("missing timestamp")
+    if isinstance(value, datetime) and timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def _get_immutable_bound(
+    model: Type[models.Model], field: models.Field
+) -> Union[datetime, date]:
+    """Return the moment before which the records of a model are immutable."""
+
+    bound = timezone.now() - IMMUTABLE_AFTER[_get_table_name(model)]
+    if isinstance(field, models.DateTimeField):
+        return bound
+    return timezone.localdate(bound)
+
+
+def _get_table_name(model: Type[models.Model]) -> str:
+    return next(name for name, table in STATS_TABLES.items() if table.model is model)
+
+
+def _evict(cache: sqlite3.Connection, limit: int):
+    """Remove the least recently used entries until the cache fits its limit."""
+
+    (total,) = cache.execute("SELECT coalesce(sum(size), 0) FROM entries").fetchone()
+    if total <= limit:
+        return
+
+    evicted = []
+    for key, size in cache.execute("SELECT key, size FROM entries ORDER BY used"):
+        evicted.append((key,))
+        total -= size
+        if total <= limit:
+            break
+    cache.executemany("DELETE FROM entries WHERE key = ?", evicted)
+    metrics.inc("solax_range_cache_evictions_total", len(evicted))
+
+
+@contextmanager
+def _writing():
+    """Run a block in an immediate transaction, which serializes the writers."""
+
+    cache = _get_connection()
+    cache.execute("BEGIN IMMEDIATE")
+    try:
+        yield cache
+    except BaseException:
+        cache.execute("ROLLBACK")
+        raise
+    cache.execute("COMMIT")
+
+
+def _get_connection() -> sqlite3.Connection:
+    path = Path(settings.CACHE_DIR) / "range-cache" / "responses.sqlite3"
+    key = (os.getpid(), path)
+    if getattr(_connections, "key", None) != key:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        cache = sqlite3.connect(path, timeout=10, isolation_level=None)
+        # The cache is thrown away when the application starts, so losing
+        # its last writes in a crash is harmless.
+        cache.execute("PRAGMA journal_mode = WAL")
+        cache.execute("PRAGMA synchronous = OFF")
+        cache.executescript(SCHEMA)
+        _connections.cache, _connections.key = cache, key
+    return _connections.cache
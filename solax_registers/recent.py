@@ -0,0 +1,488 @@
+"""
+Windows of the most recent minute records, shared by all the worker processes.
+
+The newest `RECENT_WINDOW_HOURS` hours of minute records and the last record
+are kept in a memory-mapped file in `CACHE_DIR`, with one typed array per
+column, and the queries that fall entirely inside the window are answered
+from it without going to the database.
+
+Writers take an exclusive `flock` on the file, and a lock of the window
+against the other threads of their process, and publish every change once,
+after its commit. Readers take no lock: a sequence number, odd while a writer
+is changing the file, lets them detect a read that raced with a write and
+retry it (a seqlock).
+
+The database stays the source of truth. Appended records are published with
+one query on the rowids inserted since the last publication, and any other
+change reloads the window.
+"""
+
+import fcntl
+import logging
+import mmap
+import os
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from threading import Lock
+from time import sleep
+from typing import Callable, Dict, List, Tuple, Type, Union
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Max
+from django.db.models.expressions import RawSQL
+from django.utils.timezone import is_naive, make_aware
+
+from .models import STATS_TABLES
+
+WINDOW_TABLES = ("minute_stats",)
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MAX_READ_ATTEMPTS = 100
+READ_RETRY_PAUSE = 0.0001
+
+# The slots of the header of a window file.
+SEQUENCE, LOADED, HEAD, SIZE, START, LAST_ROWID, HAS_LATEST = range(7)
+HEADER_SIZE = 8 * 8
+NO_START = -(2**63)
+
+logger = logging.getLogger(__name__)
+
+_windows: Dict[Type[models.Model], "RecentWindow"] = {}
+_windows_lock = Lock()
+
+Column = Tuple[str, str, bool]
+
+
+def _to_microseconds(moment: datetime) -> int:
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def _to_datetime(microseconds: int) -> datetime:
+    return EPOCH + timedelta(microseconds=microseconds)
+
+
+class _Records:
+    """One typed array per column, mapped over a region of a window file."""
+
+    def __init__(self, columns: List[Column], count: int):
+        self.columns = columns
+        self.count = count
+        nullable = sum(1 for _, _, is_nullable in columns if is_nullable)
+        self.size = (8 * (1 + len(columns)) + nullable) * count
+        self.size += -self.size % 8
+
+    def map(self, buffer: memoryview, offset: int) -> int:
+        """Map the arrays at `offset`, and return the offset of their end."""
+
+        def take(typecode: str, item_size: int) -> memoryview:
+            nonlocal offset
+            view = buffer[offset : offset + item_size * self.count].cast(typecode)
+            offset += item_size * self.count
+            return view
+
+        self.times = take("q", 8)
+        self.values = {name: take(typecode, 8) for name, typecode, _ in self.columns}
+        self.nulls = {
+            name: take("B", 1) for name, _, is_nullable in self.columns if is_nullable
+        }
+        return offset + -offset % 8
+
+    def write(self, position: int, row: tuple):
+        """Write a row of a date and column values."""
+
+        self.times[position] = _to_microseconds(row[0])
+        for (name, _, is_nullable), value in zip(self.columns, row[1:]):
+            if is_nullable:
+                self.nulls[name][position] = value is None
+            self.values[name][position] = 0 if value is None else value
+
+    def read(self, name: str, date_column: str, first: int, last: int) -> list:
+        """Read the values of a column at positions `first` to `last`."""
+
+        if name == date_column:
+            return list(map(_to_datetime, self.times[first:last].tolist()))
+
+        values = self.values[name][first:last].tolist()
+        nulls = self.nulls.get(name)
+        if nulls is not None:
+            for index, is_null in enumerate(nulls[first:last].tolist()):
+                if is_null:
+                    values[index] = None
+        return values
+
+
+class RecentWindow:
+    """
+    A ring buffer of the newest records of a stats table, and its last record.
+
+    All the records of the table with a timestamp of at least the `START`
+    slot of the header are in the ring buffer; when it is `NO_START`, the
+    buffer holds the whole table.
+    """
+
+    def __init__(self, table_name: str, capacity: int):
+        table = STATS_TABLES[table_name]
+        self.model = table.model
+        self.last_record_model = table.last_record_model
+        self.date_column = table.date_column
+        self.capacity = capacity
+        self.columns: List[Column] = [
+            (
+                field.name,
+                "d" if isinstance(field, models.FloatField) else "q",
+                field.null,
+            )
+            for field in self.model._meta.concrete_fields
+            if field.name != self.date_column
+        ]
+        self.latest = _Records(self.columns, 1)
+        self.records = _Records(self.columns, capacity)
+
+        layout = zlib.crc32(repr(self.columns).encode())
+        self.path = (
+            Path(settings.CACHE_DIR)
+            / "recent"
+            / f"{self.model._meta.model_name}-{capacity}-{layout:08x}.bin"
+        )
+        self._pid = None
+        # The `flock` of a descriptor is shared by the threads of its process,
+        # which these locks keep apart.
+        self._thread_lock = Lock()
+        self._open_lock = Lock()
+
+    def get_records(
+        self,
+        since: Union[str, None],
+        before: Union[str, None],
+        fields: List[str],
+        count: Union[int, None] = None,
+    ) -> Union[List[dict], None]:
+        """
+        Return the records between `since` and `before`, or only the newest
+        `count` of them, as the `values` of a queryset would. Return None if
+        the records are not all in the window.
+        """
+
+        try:
+            since = None if since is None else _to_microseconds(self._parse(since))
+            before = None if before is None else _to_microseconds(self._parse(before))
+        except ValidationError:
+            return None
+
+        def read() -> Union[List[list], None]:
+            header = self._header
+            head, size, start = header[HEAD], header[SIZE], header[START]
+            is_since_in_window = start == NO_START or (
+                since is not None and since >= start
+            )
+
+            last = size if before is None else self._bisect(head, size, before + 1)
+            if count is None:
+                if not is_since_in_window:
+                    return None
+                first = 0
+            else:
+                first = last - count
+                if first < 0:
+                    if not is_since_in_window:
+                        return None
+                    first = 0
+            if since is not None:
+                first = max(first, self._bisect(head, size, since))
+
+            return [self._get_column(name, head, first, last) for name in fields]
+
+        columns = self._read(read)
+        if columns is None:
+            return None
+        return [dict(zip(fields, row)) for row in zip(*columns)]
+
+    def get_latest(self, fields: List[str]) -> Union[dict, None]:
+        """
+        Return the last record, as the `values` of a queryset would, or None
+        if the window is not available.
+        """
+
+        def read() -> Union[dict, None]:
+            if not self._header[HAS_LATEST]:
+                return {}
+            return {
+                name: self.latest.read(name, self.date_column, 0, 1)[0]
+                for name in fields
+            }
+
+        return self._read(read)
+
+    def publish_append(self):
+        """Publish the records appended to the table since the last publication."""
+
+        self._open()
+        with self._locked():
+            header = self._header
+            if not header[LOADED] or header[SEQUENCE] % 2:
+                self._load()
+                return
+
+            queryset, names = self._get_queryset()
+            rows = list(
+                queryset.filter(rowid__gt=header[LAST_ROWID])
+                .order_by("rowid")
+                .values_list("rowid", *names)[: self.capacity + 1]
+            )
+            times = [self._get_newest(), *(_to_microseconds(row[1]) for row in rows)]
+            if len(rows) > self.capacity or any(
+                time <= previous for previous, time in zip(times, times[1:])
+            ):
+                # Records inserted out of order would break the sorting.
+                self._load()
+                return
+
+            latest = self._get_latest_row()
+            with self._changing():
+                for rowid, *row in rows:
+                    self._append(row)
+                    header[LAST_ROWID] = rowid
+                self._set_latest(latest)
+
+    def publish_reset(self):
+        """Reload the window from the database."""
+
+        self._open()
+        with self._locked():
+            self._load()
+
+    def fill(self):
+        """Load the window from the database, unless it is already loaded."""
+
+        self._open()
+        with self._locked():
+            if not self._header[LOADED]:
+                self._load()
+
+    def _parse(self, value: str) -> datetime:
+        moment = self.model._meta.get_field(self.date_column).to_python(value)
+        if moment is None:
+            raise ValidationError("missing timestamp")
+        if is_naive(moment):
+            moment = make_aware(moment)
+        return moment
+
+    def _bisect(self, head: int, size: int, microseconds: int) -> int:
+        # The index of the first record not older than `microseconds`, searched
+        # by hand because `bisect_left` only takes a key from Python 3.10.
+        times, capacity = self.records.times, self.capacity
+        low, high = 0, size
+        while low < high:
+            middle = (low + high) // 2
+            if times[(head + middle) % capacity] < microseconds:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _get_column(self, name: str, head: int, first: int, last: int) -> list:
+        if first >= last:
+            return []
+
+        position = (head + first) % self.capacity
+        end = position + last - first
+        if end <= self.capacity:
+            return self.records.read(name, self.date_column, position, end)
+        return self.records.read(
+            name, self.date_column, position, self.capacity
+        ) + self.records.read(name, self.date_column, 0, end - self.capacity)
+
+    def _get_newest(self) -> int:
+        header = self._header
+        if not header[SIZE]:
+            return NO_START
+        return self.records.times[(header[HEAD] + header[SIZE] - 1) % self.capacity]
+
+    def _open(self):
+        # An inherited descriptor would share its lock with the parent process.
+        if self._pid == os.getpid():
+            return
+
+        with self._open_lock:
+            if self._pid == os.getpid():
+                return
+
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            size = HEADER_SIZE + self.latest.size + self.records.size
+            with self._locked():
+                if os.fstat(self._fd).st_size < size:
+                    os.ftruncate(self._fd, size)
+
+            buffer = memoryview(mmap.mmap(self._fd, size))
+            self._header = buffer[:HEADER_SIZE].cast("q")
+            self.records.map(buffer, self.latest.map(buffer, HEADER_SIZE))
+            self._pid = os.getpid()
+
+    @contextmanager
+    def _locked(self, blocking: bool = True):
+        if not self._thread_lock.acquire(blocking):
+            raise BlockingIOError()
+        try:
+            fcntl.flock(
+                self._fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            )
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            self._thread_lock.release()
+
+    @contextmanager
+    def _changing(self):
+        header = self._header
+        if header[SEQUENCE] % 2 == 0:
+            header[SEQUENCE] += 1
+        try:
+            yield
+        except BaseException:
+            header[LOADED] = 0
+            raise
+        finally:
+            header[SEQUENCE] += 1
+
+    def _read(self, read: Callable):
+        self._open()
+        header = self._header
+        for attempt in range(MAX_READ_ATTEMPTS):
+            sequence = header[SEQUENCE]
+            if sequence % 2 == 0:
+                if not header[LOADED]:
+                    self._try_load()
+                    if not header[LOADED]:
+                        return None
+                    continue
+
+                try:
+                    result = read()
+                except Exception:
+                    if header[SEQUENCE] == sequence:
+                        raise
+                    continue
+                if header[SEQUENCE] == sequence:
+                    return result
+            # Give a preempted writer the time to finish its change.
+            sleep(0 if attempt < 10 else READ_RETRY_PAUSE)
+
+        # A writer is slow, or died while changing the file.
+        self._try_load()
+        return None
+
+    def _try_load(self):
+        try:
+            with self._locked(blocking=False):
+                if not self._header[LOADED] or self._header[SEQUENCE] % 2:
+                    self._load()
+        except BlockingIOError:
+            pass
+
+    def _get_queryset(self):
+        names = [self.date_column, *(name for name, _, _ in self.columns)]
+        rowid = RawSQL(f'"{self.model._meta.db_table}".rowid', ())
+        return self.model.objects.annotate(rowid=rowid), names
+
+    def _get_latest_row(self) -> Union[tuple, None]:
+        names = [self.date_column, *(name for name, _, _ in self.columns)]
+        return self.last_record_model.objects.values_list(*names).first()
+
+    def _load(self):
+        header = self._header
+        with self._changing():
+            header[LOADED] = 0
+
+        queryset, names = self._get_queryset()
+        with transaction.atomic():
+            last_rowid = queryset.aggregate(last=Max("rowid"))["last"] or 0
+            rows = list(
+                queryset.order_by(f"-{self.date_column}").values_list(*names)[
+                    : self.capacity
+                ]
+            )
+            latest = self._get_latest_row()
+
+        with self._changing():
+            header[HEAD] = header[SIZE] = 0
+            header[START] = NO_START
+            for row in reversed(rows):
+                self._append(row)
+            if len(rows) == self.capacity:
+                header[START] = self.records.times[0]
+            header[LAST_ROWID] = last_rowid
+            self._set_latest(latest)
+            header[LOADED] = 1
+
+    def _append(self, row: tuple):
+        header = self._header
+        position = (header[HEAD] + header[SIZE]) % self.capacity
+        if header[SIZE] == self.capacity:
+            header[START] = self.records.times[position] + 1
+            header[HEAD] = (header[HEAD] + 1) % self.capacity
+        else:
+            header[SIZE] += 1
+        self.records.write(position, row)
+
+    def _set_latest(self, row: Union[tuple, None]):
+        self._header[HAS_LATEST] = row is not None
+        if row is not None:
+            self.latest.write(0, row)
+
+
+def get_window(model: Type[models.Model]) -> Union[RecentWindow, None]:
+    """Return the window of a model, or None if it has none."""
+
+    if settings.RECENT_WINDOW_HOURS <= 0:
+        return None
+
+    with _windows_lock:
+        if model not in _windows:
+            for table_name in WINDOW_TABLES:
+                if STATS_TABLES[table_name].model is model:
+                    capacity = settings.RECENT_WINDOW_HOURS * 60
+                    _windows[model] = RecentWindow(table_name, capacity)
+        return _windows.get(model)
+
+
+def fill_windows():
+    """Load the windows that no other worker has loaded yet."""
+
+    for table_name in WINDOW_TABLES:
+        window = get_window(STATS_TABLES[table_name].model)
+        if window is not None:
+            window.fill()
+
+
+def notify_append(model: Type[models.Model]):
+    """Publish the records appended to a table, after the commit."""
+
+    _notify(model, "publish_append")
+
+
+def notify_reset(model: Type[models.Model]):
+    """Reload the window of a table changed in any other way, after the commit."""
+
+    _notify(model, "publish_reset")
+
+
+def _notify(model: Type[models.Model], method: str):
+    window = get_window(model)
+    if window is None:
+        return
+
+    def publish():
+        try:
+            getattr(window, method)()
+        except Exception:
+            # The next publication catches up with the missed records, and
+            # a window left unloaded is reloaded by the next reader.
+            logger.exception("Could not publish to the window of %s", model.__name__)
+
+    transaction.on_commit(publish)
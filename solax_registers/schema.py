@@ -0,0 +1,105 @@
+"""
+Migrate the database on start only when its schema changed.
+
+The migrations of the stats tables are made from the columns file, so every
+start used to run `makemigrations` and `migrate`, which load Django twice and
+take seconds even when nothing changed. Instead, a hash of everything the
+schema is made from (the columns file, the sources of the models, the
+settings, and the versions of the apps with migrations) is kept in the
+`user_version` header field of the SQLite database once it is migrated, and
+both commands only run when it differs. The check reads a few files and one
+header field, and only sets up Django when it has to migrate.
+
+Run `python3 -m solax_registers.schema` from the project directory, or call
+`migrate_if_changed` from the server process.
+"""
+
+import os
+import sqlite3
+from hashlib import sha256
+from importlib import import_module
+from os import environ
+from pathlib import Path
+from typing import Union
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+SOURCES = (
+    BASE_DIR / "solax_registers" / "models.py",
+    BASE_DIR / "solax_registers" / "fields.py",
+    BASE_DIR / "solax_registers" / "utils.py",
+    BASE_DIR / "my_api" / "settings.py",
+)
+# The apps outside the project which have migrations.
+PACKAGES = ("django", "rest_framework")
+
+
+def get_database_path() -> Path:
+    return Path(environ.get("DB_PATH", BASE_DIR / "db.sqlite3"))
+
+
+def get_schema_hash() -> int:
+    """Return the hash of the schema, as a positive 31-bit `user_version`."""
+
+    digest = sha256()
+    for path in (Path(environ.get("COLUMNS_FILE", "columns.json")), *SOURCES):
+        digest.update(path.read_bytes())
+    for package in PACKAGES:
+        digest.update(import_module(package).__version__.encode())
+    # 0 is the `user_version` of a database which was never migrated.
+    return int.from_bytes(digest.digest()[:4], "big") & 0x7FFFFFFF or 1
+
+
+def read_schema_hash(path: Path) -> Union[int, None]:
+    """Return the schema hash recorded in a database, or None if it has none."""
+
+    try:
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    except sqlite3.OperationalError:
+        return None
+    try:
+        ((schema_hash,),) = connection.execute("PRAGMA user_version").fetchall()
+    except sqlite3.DatabaseError:
+        return None
+    finally:
+        connection.close()
+    return schema_hash or None
+
+
+def write_schema_hash(path: Path, schema_hash: int):
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute(f"PRAGMA user_version = {int(schema_hash)}")
+    finally:
+        connection.close()
+
+
+def migrate_if_changed(stdout=None) -> bool:
+    """
+    Make and apply the migrations if the schema changed since the database
+    was last migrated, and return whether it did.
+    """
+
+    schema_hash = get_schema_hash()
+    path = get_database_path()
+    if read_schema_hash(path) == schema_hash:
+        return False
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "my_api.settings")
+    import django
+
+    django.setup()
+
+    from django.core.management import call_command
+    from django.db import connections
+
+    call_command("makemigrations", "solax_registers", stdout=stdout)
+    call_command("migrate", stdout=stdout)
+    # A server forks its workers after this, which must not share connections.
+    connections.close_all()
+    write_schema_hash(path, schema_hash)
+    return True
+
+
+if __name__ == "__main__":
+    if not migrate_if_changed():
+        print("The database schema is up to date.")
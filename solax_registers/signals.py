@@ -0,0 +1,51 @@
+"""Signal receivers that keep the app caches and indexes consistent."""
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_migrate,
+    post_save,
+)
+from rest_framework.authtoken.models import Token
+
+from . import coverage
+from .authentication import invalidate_auth_cache
+
+User = get_user_model()
+
+for model in (User, Group, Permission, Token):
+    post_save.connect(invalidate_auth_cache, sender=model)
+    post_delete.connect(invalidate_auth_cache, sender=model)
+
+for through_model in (
+    User.groups.through,
+    User.user_permissions.through,
+    Group.permissions.through,
+):
+    m2m_changed.connect(invalidate_auth_cache, sender=through_model)
+
+
+def build_coverage(sender, **kwargs):
+    """Index the minute stats of a database which had no coverage index yet."""
+
+    if sender.name == "solax_registers":
+        coverage.ensure_built()
+
+
+post_migrate.connect(build_coverage)
+
+
+def set_pragmas(sender, connection, **kwargs):
+    """Tune each new SQLite connection with the `SQLITE_PRAGMAS`."""
+
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            for pragma, value in settings.SQLITE_PRAGMAS.items():
+                cursor.execute(f"PRAGMA {pragma} = {value}")
+
+
+connection_created.connect(set_pragmas)
@@ -0,0 +1,133 @@
+"""
+Consistent copies of the database, taken with the SQLite online backup API
+while the application keeps reading and writing it.
+"""
+
+import sqlite3
+import tempfile
+import zlib
+from functools import partial
+from pathlib import Path
+from time import sleep
+from typing import BinaryIO, Callable, Iterator, Union
+
+from django.conf import settings
+from django.db import connection
+
+DEFAULT_PAGES = 256
+DEFAULT_PAUSE = 0.01
+MAX_RESTARTS = 3
+# The seconds to wait before a restarted copy, for the writes to settle.
+RESTART_PAUSE = 1
+CHUNK_SIZE = 1024 * 1024
+
+
+class SnapshotBusy(Exception):
+    """The database was written to during every attempt to copy it."""
+
+
+class _Restarted(Exception):
+    """Another connection wrote to the database, which restarted the backup."""
+
+
+def backup(
+    destination: Path,
+    pages: int = DEFAULT_PAGES,
+    pause: float = DEFAULT_PAUSE,
+    on_progress: Union[Callable[[int, int], None], None] = None,
+) -> None:
+    """
+    Copy the database to a file.
+
+    The database is copied `pages` pages at a time, with a pause of `pause`
+    seconds between two steps, so that writers are only ever blocked for the
+    duration of one step. A write from another connection restarts the copy,
+    at most `MAX_RESTARTS` times.
+
+    Parameters
+    ----------
+    destination : pathlib.Path
+        the file of the copy, which is overwritten.
+    pages : int
+        the number of pages copied in one step.
+    pause : float
+        the seconds to wait between two steps.
+    on_progress : callable, optional
+        called with the number of copied pages and the total number of pages
+        after every step.
+
+    Raises
+    ------
+    SnapshotBusy
+        if the copy was restarted more than `MAX_RESTARTS` times.
+    """
+
+    connection.ensure_connection()
+    source = connection.connection
+
+    for attempt in range(MAX_RESTARTS + 1):
+        if attempt:
+            sleep(RESTART_PAUSE)
+        try:
+            _backup(source, destination, pages, pause, on_progress)
+            return
+        except _Restarted:
+            continue
+    # Copying the rest in one step would keep the writers out for all of it.
+    raise SnapshotBusy()
+
+
+def _backup(source, destination: Path, pages: int, pause: float, on_progress):
+    previous_remaining = None
+
+    def progress(status: int, remaining: int, total: int):
+        nonlocal previous_remaining
+        if previous_remaining is not None and remaining > previous_remaining:
+            raise _Restarted()
+        previous_remaining = remaining
+
+        if on_progress is not None:
+            on_progress(total - remaining, total)
+        if remaining and pause:
+            sleep(pause)
+
+    target = sqlite3.connect(destination)
+    try:
+        source.backup(target, pages=pages, progress=progress)
+    finally:
+        target.close()
+
+
+def create_temporary_snapshot(**kwargs) -> BinaryIO:
+    """
+    Copy the database to a new file in `CACHE_DIR`, and return it open for
+    reading. The file is already removed from `CACHE_DIR`, and is deleted
+    once closed.
+    """
+
+    snapshot_dir = Path(settings.CACHE_DIR) / "snapshots"
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=snapshot_dir, suffix=".sqlite3", delete=False
+    ) as file:
+        path = Path(file.name)
+
+    try:
+        backup(path, **kwargs)
+        return open(path, "rb")
+    finally:
+        path.unlink()
+
+
+def read_snapshot(file: BinaryIO, compress: bool) -> Iterator[bytes]:
+    """
+    Read a snapshot in chunks, gzip compressing them on the fly if `compress`
+    is true, and close it once read.
+    """
+
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if compress else None
+    with file:
+        for chunk in iter(partial(file.read, CHUNK_SIZE), b""):
+            yield chunk if compressor is None else compressor.compress(chunk)
+    if compressor is not None:
+        yield compressor.flush()
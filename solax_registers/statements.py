@@ -0,0 +1,320 @@
+"""
+The SQL statements of the hot paths of the stats endpoints, compiled once.
+
+The ORM compiles a queryset to SQL again on every request. The reads and
+writes of `StatsManager` are a fixed set of statements which only differ in
+their parameters, so each is compiled once per model and set of columns and
+then executed as is. With persistent connections, the statement cache of each
+SQLite connection (`cached_statements`) then also skips parsing them again.
+"""
+
+import json
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, NamedTuple, Tuple, Type, Union
+
+from django.db import connection, models
+from django.db.models import QuerySet
+
+
+class Statement(NamedTuple):
+    """A compiled statement, with the names and converters of its columns."""
+
+    sql: str
+    names: Tuple[str, ...] = ()
+    converters: tuple = ()
+
+
+_statements: Dict[tuple, Statement] = {}
+
+
+def _get_statement(key: tuple, compile_statement: Callable[[], Statement]):
+    statement = _statements.get(key)
+    if statement is None:
+        statement = _statements[key] = compile_statement()
+    return statement
+
+
+def select_range(
+    model: Type[models.Model],
+    date_column: str,
+    fields: List[str],
+    since: Union[str, None],
+    before: Union[str, None],
+) -> List[dict]:
+    """Return the `fields` of the records between `since` and `before`, as `values`."""
+
+    bounds = _get_bounds(date_column, since, before)
+    statement = _get_statement(
+        ("range", model, tuple(fields), tuple(bounds)),
+        lambda: _compile_values(model.objects.filter(**bounds).values(*fields)),
+    )
+    return _fetch(statement, _get_bound_params(model, date_column, bounds))
+
+
+def count_range(
+    model: Type[models.Model],
+    date_column: str,
+    since: Union[str, None],
+    before: Union[str, None],
+    limit: int,
+) -> int:
+    """
+    Return the number of records between `since` and `before`, counting at
+    most `limit` of them on the index of the primary key alone.
+    """
+
+    bounds = _get_bounds(date_column, since, before)
+
+    def compile_statement() -> Statement:
+        queryset = model.objects.filter(**bounds).values(date_column)
+        sql = _compile_values(queryset).sql
+        return Statement(f"SELECT count(*) FROM ({sql} LIMIT %s)")
+
+    statement = _get_statement(("count", model, tuple(bounds)), compile_statement)
+    params = _get_bound_params(model, date_column, bounds)
+    ((count,),) = _fetch_rows(statement, [*params, limit])
+    return count
+
+
+def select_last(
+    model: Type[models.Model],
+    date_column: str,
+    fields: List[str],
+    count: int,
+    since: Union[str, None],
+    before: Union[str, None],
+) -> List[dict]:
+    """
+    Return the `fields` of the newest `count` records between `since` and
+    `before`, oldest first, seeking backwards from the end of the primary key.
+    """
+
+    bounds = _get_bounds(date_column, since, before)
+
+    def compile_statement() -> Statement:
+        queryset = model.objects.filter(**bounds).order_by(f"-{date_column}")
+        statement = _compile_values(queryset.values(*fields))
+        # The limit is a parameter, so that one statement serves every count.
+        return statement._replace(sql=f"{statement.sql} LIMIT %s")
+
+    statement = _get_statement(
+        ("last", model, tuple(fields), tuple(bounds)), compile_statement
+    )
+
+    params = _get_bound_params(model, date_column, bounds)
+    records = _fetch(statement, [*params, count])
+    records.reverse()
+    return records
+
+
+def select_as_of(
+    model: Type[models.Model],
+    date_column: str,
+    fields: List[str],
+    points: List[Tuple[datetime, Union[datetime, None]]],
+) -> List[Union[dict, None]]:
+    """
+    Return the `fields` of the newest record at or before each point in time,
+    and not before its earliest time if it has one, or None if there is no
+    such record.
+
+    The points are passed as a single JSON parameter and joined as a table,
+    and each one is answered by a backwards seek on the primary key, so the
+    statement is the same for any number of points.
+    """
+
+    fields = list(dict.fromkeys(fields))
+
+    def compile_statement() -> Statement:
+        quote_name = connection.ops.quote_name
+        table = quote_name(model._meta.db_table)
+        date = quote_name(model._meta.get_field(date_column).column)
+        columns = [
+            model._meta.get_field(name).get_col(model._meta.db_table) for name in fields
+        ]
+        converters = tuple(
+            (
+                position,
+                (
+                    connection.ops.get_db_converters(column)
+                    + column.get_db_converters(connection),
+                    column,
+                ),
+            )
+            for position, column in enumerate(columns, start=1)
+        )
+        sql = (
+            "WITH points AS ("
+            "SELECT key AS position, json_extract(value, '$[0]') AS at, "
+            "coalesce(json_extract(value, '$[1]'), '') AS earliest "
+            "FROM json_each(%s)) "
+            "SELECT {table}.{date} IS NOT NULL, {columns} FROM points "
+            "LEFT JOIN {table} ON {table}.{date} = ("
+            "SELECT previous.{date} FROM {table} AS previous "
+            "WHERE previous.{date} <= points.at AND previous.{date} >= points.earliest "
+            "ORDER BY previous.{date} DESC LIMIT 1) "
+            "ORDER BY points.position"
+        ).format(
+            table=table,
+            date=date,
+            columns=", ".join(
+                f"{table}.{quote_name(column.target.column)}" for column in columns
+            ),
+        )
+        return Statement(sql, tuple(fields), converters)
+
+    statement = _get_statement(("as_of", model, tuple(fields)), compile_statement)
+
+    date_field = model._meta.get_field(date_column)
+    points = json.dumps(
+        [
+            [
+                (
+                    None
+                    if moment is None
+                    else date_field.get_db_prep_value(moment, connection)
+                )
+                for moment in point
+            ]
+            for point in points
+        ]
+    )
+    rows = _fetch_rows(statement, [points])
+    names = statement.names
+    return [dict(zip(names, row[1:])) if row[0] else None for row in rows]
+
+
+def select_all(model: Type[models.Model], fields: List[str]) -> List[dict]:
+    """Return the `fields` of all the records of a table, as `values`."""
+
+    statement = _get_statement(
+        ("all", model, tuple(fields)),
+        lambda: _compile_values(model.objects.values(*fields)),
+    )
+    return _fetch(statement, [])
+
+
+def insert(instance: models.Model):
+    """
+    Insert a new record of a model without an automatic primary key, as
+    `save` would, without sending the model signals.
+    """
+
+    model = type(instance)
+    fields = model._meta.local_concrete_fields
+    statement = _get_statement(
+        ("insert", model), lambda: Statement(_get_insert_sql(model, fields))
+    )
+    _execute(statement, _get_insert_params(instance, fields))
+    instance._state.adding = False
+    instance._state.db = connection.alias
+
+
+def upsert(instance: models.Model, update_fields: Iterable[str]):
+    """
+    Insert a record, or update the `update_fields` of the record with the same
+    primary key, in a single statement.
+    """
+
+    model = type(instance)
+    fields = model._meta.local_concrete_fields
+    update_fields = tuple(update_fields)
+
+    def compile_statement() -> Statement:
+        quote_name = connection.ops.quote_name
+        assignments = ", ".join(
+            "{0} = excluded.{0}".format(quote_name(model._meta.get_field(name).column))
+            for name in update_fields
+        )
+        action = f"UPDATE SET {assignments}" if assignments else "NOTHING"
+        return Statement(
+            f"{_get_insert_sql(model, fields)} "
+            f"ON CONFLICT ({quote_name(model._meta.pk.column)}) DO {action}"
+        )
+
+    statement = _get_statement(("upsert", model, update_fields), compile_statement)
+    _execute(statement, _get_insert_params(instance, fields))
+
+
+def delete(model: Type[models.Model], column: str, value) -> int:
+    """Delete the records whose `column` equals `value`, and return their number."""
+
+    def compile_statement() -> Statement:
+        quote_name = connection.ops.quote_name
+        return Statement(
+            "DELETE FROM {} WHERE {} = %s".format(
+                quote_name(model._meta.db_table),
+                quote_name(model._meta.get_field(column).column),
+            )
+        )
+
+    statement = _get_statement(("delete", model, column), compile_statement)
+    field = model._meta.get_field(column)
+    return _execute(
+        statement, [field.get_db_prep_value(value, connection, prepared=False)]
+    )
+
+
+def _get_bounds(date_column: str, since, before) -> Dict[str, str]:
+    bounds = {f"{date_column}__gte": since, f"{date_column}__lte": before}
+    return {lookup: value for lookup, value in bounds.items() if value is not None}
+
+
+def _get_bound_params(model: Type[models.Model], date_column: str, bounds: dict):
+    date_field = model._meta.get_field(date_column)
+    return [
+        date_field.get_db_prep_value(value, connection, prepared=False)
+        for value in bounds.values()
+    ]
+
+
+def _compile_values(queryset: QuerySet) -> Statement:
+    query = queryset.query
+    compiler = query.get_compiler(connection=connection)
+    sql, _ = compiler.as_sql()
+    converters = compiler.get_converters([column for column, _, _ in compiler.select])
+    names = (*query.extra_select, *query.values_select, *query.annotation_select)
+    return Statement(sql, names, tuple(converters.items()))
+
+
+def _get_insert_sql(model: Type[models.Model], fields: list) -> str:
+    quote_name = connection.ops.quote_name
+    return "INSERT INTO {} ({}) VALUES ({})".format(
+        quote_name(model._meta.db_table),
+        ", ".join(quote_name(field.column) for field in fields),
+        ", ".join(["%s"] * len(fields)),
+    )
+
+
+def _get_insert_params(instance: models.Model, fields: list) -> list:
+    return [
+        field.get_db_prep_save(field.pre_save(instance, True), connection)
+        for field in fields
+    ]
+
+
+def _execute(statement: Statement, params: list) -> int:
+    with connection.cursor() as cursor:
+        cursor.execute(statement.sql, params)
+        return cursor.rowcount
+
+
+def _fetch(statement: Statement, params: list) -> List[dict]:
+    names = statement.names
+    return [dict(zip(names, row)) for row in _fetch_rows(statement, params)]
+
+
+def _fetch_rows(statement: Statement, params: list) -> list:
+    with connection.cursor() as cursor:
+        cursor.execute(statement.sql, params)
+        rows = cursor.fetchall()
+
+    if statement.converters:
+        rows = list(map(list, rows))
+        for row in rows:
+            for position, (functions, expression) in statement.converters:
+                value = row[position]
+                for function in functions:
+                    value = function(value, expression, connection)
+                row[position] = value
+    return rows
@@ -0,0 +1,283 @@
+"""Synthetic stats records shaped by the columns file."""
+
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from itertools import accumulate
+from math import cos, exp, pi, sin
+from random import Random
+from typing import Callable, Iterator, List, NamedTuple, Tuple, Union
+
+VALUE_RANGES = {
+    "positive_small_integer": (0, 1000),
+    "small_integer": (-1000, 1000),
+    "integer": (-100000, 100000),
+    "float": (0, 1000),
+}
+TYPE_LIMITS = {
+    "positive_small_integer": (0, 32767),
+    "small_integer": (-32768, 32767),
+    "integer": (-2147483648, 2147483647),
+    "float": (-1e9, 1e9),
+}
+
+
+def get_column_names(column_info: List[dict], date_column: str) -> List[str]:
+    """Return the database columns of the generated rows, in order."""
+
+    return [date_column] + [column["column_name"] for column in column_info]
+
+
+def generate_rows(
+    column_info: List[dict],
+    start: Union[date, datetime],
+    count: int,
+    step: timedelta,
+    seed: int = 0,
+) -> Iterator[tuple]:
+    """
+    Generate rows of random values, ready to be inserted in the database.
+
+    Parameters
+    ----------
+    column_info : list
+        the columns, as read from the columns file.
+    start : datetime.date or datetime.datetime
+        the timestamp of the first row. Rows of a `datetime.datetime` start
+        are timestamped with UTC datetimes, the others with dates.
+    count : int
+        the number of rows.
+    step : datetime.timedelta
+        the time between two consecutive rows.
+    seed : int
+        the seed of the random values.
+    """
+
+    randomizer = Random(seed)
+    date_format = "%Y-%m-%d %H:%M:%S" if isinstance(start, datetime) else "%Y-%m-%d"
+    value_getters = [_get_value_getter(randomizer, column) for column in column_info]
+
+    for index in range(count):
+        timestamp = (start + index * step).strftime(date_format)
+        yield (timestamp, *(get_value() for get_value in value_getters))
+
+
+def _get_value_getter(randomizer: Random, column: dict):
+    low, high = VALUE_RANGES[column["column_type"]]
+    factor = _get_scale_factor(column)
+    if factor is not None:
+        return lambda: round(randomizer.uniform(low, high) * factor)
+    if column["column_type"] == "float":
+        return lambda: round(randomizer.uniform(low, high), 1)
+    return lambda: randomizer.randint(low, high)
+
+
+def _get_scale_factor(column: dict) -> Union[int, None]:
+    """Return the factor of the database values of a scaled float column."""
+
+    scale = column.get("scale", "N/A")
+    return None if scale == "N/A" else 10**scale
+
+
+def generate_realistic_rows(
+    column_info: List[dict],
+    start: Union[date, datetime],
+    count: int,
+    step: timedelta,
+    seed: int = 0,
+    null_rate: float = 0.0,
+) -> Iterator[tuple]:
+    """
+    Generate rows that look like the readings of a solar inverter.
+
+    The shape of a column is picked from its name: PV powers follow a
+    diurnal curve with passing clouds, voltages stay around 230 V with some
+    noise, battery levels cycle through the day, and energy meters only
+    increase. Other columns get noisy values within the range of their type.
+    Nullable columns are null with a probability of `null_rate`.
+
+    The parameters are the same as those of `generate_rows`. The values are
+    generated a column at a time, in chunks of `CHUNK_SIZE` rows.
+    """
+
+    randomizer = Random(seed)
+    noise = _NoisePool(randomizer)
+    is_datetime = isinstance(start, datetime)
+    if is_datetime and start.tzinfo is not None:
+        start = start.astimezone(timezone.utc).replace(tzinfo=None)
+
+    hours_per_step = step.total_seconds() / 3600
+    column_generators = [
+        _get_column_generator(randomizer, noise, column, hours_per_step)
+        for column in column_info
+    ]
+    nullable = [column["nullable"] is True and null_rate > 0 for column in column_info]
+    clouds = 0.0
+
+    for chunk_start in range(0, count, CHUNK_SIZE):
+        moments = [
+            start + index * step
+            for index in range(chunk_start, min(count, chunk_start + CHUNK_SIZE))
+        ]
+        size = len(moments)
+
+        cloud_cover = []
+        for change in noise(size):
+            clouds = min(1.0, max(0.0, clouds + 0.05 * change))
+            cloud_cover.append(clouds)
+        conditions = _get_conditions(moments, cloud_cover, is_datetime)
+
+        columns = []
+        for generate_column, is_nullable in zip(column_generators, nullable):
+            values = generate_column(conditions, size)
+            if is_nullable:
+                random = randomizer.random
+                values = [None if random() < null_rate else value for value in values]
+            columns.append(values)
+
+        yield from zip(map(str, moments), *columns)
+
+
+CHUNK_SIZE = 1440
+
+
+class _Conditions(NamedTuple):
+    sun: List[float]
+    load: List[float]
+    hour: List[float]
+
+
+class _NoisePool:
+    """Standard normal noise, drawn from a precomputed pool for speed."""
+
+    SIZE = 65536
+
+    def __init__(self, randomizer: Random):
+        values = [randomizer.gauss(0, 1) for _ in range(self.SIZE)]
+        self.values = values + values
+        self.randomizer = randomizer
+
+    def __call__(self, size: int) -> List[float]:
+        """Return `size` (at most `SIZE`) values, starting at a random offset."""
+
+        offset = self.randomizer.randrange(self.SIZE)
+        return self.values[offset : offset + size]
+
+
+@lru_cache(maxsize=None)
+def _get_season(day_of_year: int) -> float:
+    return 0.6 + 0.4 * cos(2 * pi * (day_of_year - 172) / 365)
+
+
+@lru_cache(maxsize=None)
+def _get_time_of_day(minute_of_day: int) -> Tuple[float, float, float]:
+    hour = minute_of_day / 60
+    daylight = sin(pi * (hour - 6) / 14) if 6 <= hour <= 20 else 0.0
+    evening = exp(-((hour - 19.5) ** 2) / 4)
+    return hour, daylight, 0.15 + 0.6 * evening
+
+
+def _get_conditions(
+    moments: List[Union[date, datetime]], cloud_cover: List[float], is_datetime: bool
+) -> _Conditions:
+    seasons = [_get_season(moment.toordinal() % 365) for moment in moments]
+
+    if not is_datetime:
+        return _Conditions(
+            sun=[
+                season * (1 - clouds / 2)
+                for season, clouds in zip(seasons, cloud_cover)
+            ],
+            load=[0.5] * len(moments),
+            hour=[12.0] * len(moments),
+        )
+
+    hours, daylights, loads = zip(
+        *(_get_time_of_day(moment.hour * 60 + moment.minute) for moment in moments)
+    )
+    return _Conditions(
+        sun=[
+            daylight * season * (1 - 0.8 * clouds)
+            for daylight, season, clouds in zip(daylights, seasons, cloud_cover)
+        ],
+        load=list(loads),
+        hour=list(hours),
+    )
+
+
+def _get_column_generator(
+    randomizer: Random, noise: _NoisePool, column: dict, hours_per_step: float
+) -> Callable[[_Conditions, int], list]:
+    """Return a function generating the values of a column for some conditions."""
+
+    name, column_type = column["column_name"], column["column_type"]
+    low, high = TYPE_LIMITS[column_type]
+    factor = _get_scale_factor(column)
+
+    if factor is not None:
+
+        def clamp(values):
+            return [round(min(high, max(low, value)) * factor) for value in values]
+
+    elif column_type == "float":
+
+        def clamp(values):
+            return [round(min(high, max(low, value)), 1) for value in values]
+
+    else:
+
+        def clamp(values):
+            return [int(min(high, max(low, value))) for value in values]
+
+    if "status" in name:
+        return lambda c, size: [2] * size
+    if "volt" in name:
+        return lambda c, size: clamp(230 + 2 * n for n in noise(size))
+    if "capacity" in name:
+        return lambda c, size: clamp(
+            55 + 35 * sin(pi * (hour - 9) / 12) + n
+            for hour, n in zip(c.hour, noise(size))
+        )
+    if "count_down" in name:
+        return lambda c, size: clamp(150 + 50 * n for n in noise(size))
+    if "today" in name:
+        return lambda c, size: clamp(
+            max(0.0, 25 * sun + n) for sun, n in zip(c.sun, noise(size))
+        )
+    if "energy" in name or "yield" in name:
+        return _get_meter_generator(randomizer, name, hours_per_step, clamp)
+    if "battery" in name:
+        return lambda c, size: clamp(
+            2000 * (sun - load) + 50 * n
+            for sun, load, n in zip(c.sun, c.load, noise(size))
+        )
+    if "feed_in" in name or "grid" in name:
+        return lambda c, size: clamp(
+            4000 * sun - 3000 * load + 100 * n
+            for sun, load, n in zip(c.sun, c.load, noise(size))
+        )
+    if "power" in name or "solar" in name:
+        return lambda c, size: clamp(
+            3000 * sun * (1 + 0.03 * n) for sun, n in zip(c.sun, noise(size))
+        )
+
+    middle, spread = (low + high) / 2, (high - low) / 100
+    return lambda c, size: clamp(middle + spread * n for n in noise(size))
+
+
+def _get_meter_generator(
+    randomizer: Random, name: str, hours_per_step: float, clamp
+) -> Callable[[_Conditions, int], list]:
+    total = randomizer.uniform(0, 1000)
+    is_production = "to_grid" in name or "yield" in name
+
+    def generate(conditions, size):
+        nonlocal total
+        if is_production:
+            increments = [4 * hours_per_step * sun for sun in conditions.sun]
+        else:
+            increments = [3 * hours_per_step * load for load in conditions.load]
+        totals = list(accumulate(increments, initial=total))[1:]
+        total = totals[-1]
+        return clamp(totals)
+
+    return generate
@@ -1,15 +1,70 @@
 """File of API tests."""
 
 import logging
+import os
+import tempfile
+import tracemalloc
+import gzip
+import json
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
 import unittest
+from unittest import mock
+from contextlib import contextmanager
+from io import StringIO
+from pathlib import Path
+from datetime import date, datetime, timedelta, timezone
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission, update_last_login
+from django.core.exceptions import EmptyResultSet
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.models import Model, Q
+from django.db.models.sql.compiler import SQLCompiler
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext, isolate_apps
 from django.urls import reverse_lazy
-from rest_framework.status import HTTP_200_OK, HTTP_201_CREATED, HTTP_400_BAD_REQUEST
-from rest_framework.test import APITestCase
-
+from rest_framework.authtoken.models import Token
+from rest_framework.status import (
+    HTTP_200_OK,
+    HTTP_201_CREATED,
+    HTTP_302_FOUND,
+    HTTP_400_BAD_REQUEST,
+    HTTP_403_FORBIDDEN,
+    HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+    HTTP_429_TOO_MANY_REQUESTS,
+    HTTP_503_SERVICE_UNAVAILABLE,
+)
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from . import (
+    admission,
+    coalescing,
+    imports,
+    metrics,
+    range_cache,
+    recent,
+    schema,
+    snapshots,
+)
+from .authentication import AUTH_GENERATION
 from .constants import response_templates
-from .models import DailyStatsRecord, LastDayStatsRecord
+from .db import QueryCollector
+from .fields import ScaledFloatField
+from .generations import get_generation
+from .models import (
+    DailyStatsRecord,
+    LastDayStatsRecord,
+    LastMinuteStatsRecord,
+    MinuteStatsRecord,
+    MinuteStatsRun,
+)
+from .synthetic import generate_realistic_rows
 from .utils import (
     get_a_nonexistent_column,
     get_sample_column_values,
@@ -22,6 +77,25 @@ User = get_user_model()
 columns = read_columns_file()
 
 
+class PerformanceAssertionsMixin:
+    """Assertions that pin the cost of a block of code."""
+
+    @contextmanager
+    def assertMaxPeakMemory(self, limit: int):
+        """Fail if the block allocates more than `limit` bytes at its peak."""
+
+        tracemalloc.start()
+        try:
+            yield
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertLessEqual(
+            peak, limit, f"Peak memory of {peak} bytes exceeds {limit} bytes."
+        )
+
+
 class AddHistoryStatsTests(APITestCase):
     """Tests for adding history stats."""
 
@@ -505,6 +579,1679 @@ class TestHealthz(APITestCase):
         self.client.get(reverse_lazy("minute_stats"))
 
 
+class TokenAuthenticationTests(APITestCase):
+    """Tests for the token-authenticated API path."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Set up test data."""
+
+        cls.testuser = User.objects.create(username="collector", is_active=True)
+        cls.token = Token.objects.create(user=cls.testuser)
+        cls.testuser.user_permissions.add(
+            Permission.objects.get(codename="view_dailystatsrecord"),
+            Permission.objects.get(codename="view_lastdaystatsrecord"),
+        )
+
+    def test_get_with_token(self):
+        """Try to get the last record using a token."""
+
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token.key)
+
+        response = self.client.get(reverse_lazy("daily_stats"))
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertNotIn("sessionid", response.cookies)
+        self.assertNotIn("Cookie", response.get("Vary", ""))
+
+    def test_admin_with_token(self):
+        """Open the admin, which does not take tokens, with a token."""
+
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token.key)
+
+        response = self.client.get(reverse_lazy("admin:index"))
+        self.assertEqual(response.status_code, HTTP_302_FOUND)
+
+    def test_get_with_invalid_token(self):
+        """Try to get the last record using an invalid token."""
+
+        self.client.credentials(HTTP_AUTHORIZATION="Token invalid")
+
+        response = self.client.get(reverse_lazy("daily_stats"))
+        self.assertEqual(response.status_code, HTTP_403_FORBIDDEN)
+
+    def test_post_without_permission(self):
+        """Try to add a record without the `add` permissions."""
+
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token.key)
+
+        response = self.client.post(
+            reverse_lazy("daily_stats"), data={"upload_date": "2022-01-01"}
+        )
+        self.assertEqual(response.status_code, HTTP_403_FORBIDDEN)
+        self.assertEqual(DailyStatsRecord.objects.count(), 0)
+
+    def test_revoked_permission(self):
+        """Try to get the last record after the `view` permission was revoked."""
+
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token.key)
+        self.client.get(reverse_lazy("daily_stats"))
+        generation = get_generation(AUTH_GENERATION)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.testuser.user_permissions.remove(
+                Permission.objects.get(codename="view_dailystatsrecord")
+            )
+            # The cache is only invalidated once the change is committed.
+            self.assertEqual(get_generation(AUTH_GENERATION), generation)
+
+        response = self.client.get(reverse_lazy("daily_stats"))
+        self.assertEqual(response.status_code, HTTP_403_FORBIDDEN)
+
+    def test_login_keeps_the_cache(self):
+        """The `last_login` update of a login does not invalidate the cache."""
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            update_last_login(None, self.testuser)
+        self.assertEqual(callbacks, [])
+
+
+class ProfilingTests(APITestCase):
+    """Tests for profiling the stats views."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Set up test data."""
+
+        cls.testuser = User.objects.create(
+            username="testuser", is_staff=True, is_superuser=True
+        )
+        DailyStatsRecord.objects.create(upload_date="2020-01-01")
+
+    def test_profile_header(self):
+        """Try to profile a request using the `X-Profile` header."""
+
+        self.client.force_login(self.testuser)
+
+        response = self.client.get(
+            reverse_lazy("daily_stats"),
+            QUERY_STRING="since=0001-01-01",
+            HTTP_X_PROFILE="1",
+        )
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertRegex(
+            response["Server-Timing"],
+            r"^db;dur=[0-9.]+, serialize;dur=[0-9.]+, render;dur=[0-9.]+, "
+            r"total;dur=[0-9.]+$",
+        )
+
+    def test_profile_dump(self):
+        """Try to dump the profile of a request using the `profile` parameter."""
+
+        self.client.force_login(self.testuser)
+        profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(profile_dir.cleanup)
+
+        with override_settings(PROFILE_DIR=profile_dir.name):
+            response = self.client.get(
+                reverse_lazy("daily_stats"), QUERY_STRING="profile=1"
+            )
+
+        self.assertIn("Server-Timing", response)
+        self.assertListEqual(os.listdir(profile_dir.name), [response["X-Profile-File"]])
+
+    def test_profile_without_staff_user(self):
+        """Try to profile a request as a user that is not staff."""
+
+        user = User.objects.create(username="nonstaff", is_superuser=True)
+        self.client.force_login(user)
+
+        response = self.client.get(reverse_lazy("daily_stats"), HTTP_X_PROFILE="1")
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertNotIn("Server-Timing", response)
+
+
+class PerformanceRegressionTests(PerformanceAssertionsMixin, APITestCase):
+    """Tests that pin the SQL queries and the memory used by the stats views."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Set up test data."""
+
+        cls.testuser = User.objects.create(
+            username="testuser", is_staff=True, is_superuser=True
+        )
+
+        start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+        MinuteStatsRecord.objects.bulk_create(
+            MinuteStatsRecord(upload_time=start + timedelta(minutes=minute))
+            for minute in range(1000)
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.testuser)
+
+    def test_last_record_queries(self):
+        """Getting the last record makes a single query."""
+
+        with self.assertNumQueries(1):
+            self.client.get(reverse_lazy("minute_stats"))
+
+    def test_range_queries(self):
+        """Getting a range of records makes a single query."""
+
+        with self.assertNumQueries(1):
+            self.client.get(
+                reverse_lazy("minute_stats"),
+                QUERY_STRING="since=2022-01-01T00:00Z&before=2022-01-02T00:00Z",
+            )
+
+    def test_post_queries(self):
+        """Adding a record makes a fixed number of queries."""
+
+        data = get_sample_column_values(
+            columns["minute_stats"], column_values={"upload_time": "2023-01-01T00:00Z"}
+        )
+
+        # The transaction of the request is a savepoint in the tests, and the
+        # coverage index is read and updated in it.
+        with self.assertNumQueries(7):
+            self.client.post(reverse_lazy("minute_stats"), data=data, format="json")
+
+        # The minute is already covered, so the index is only read.
+        with self.assertNumQueries(7):
+            self.client.post(
+                reverse_lazy("minute_stats"),
+                data=data,
+                format="json",
+                QUERY_STRING="overwrite=true",
+            )
+
+    def test_delete_queries(self):
+        """Deleting records makes a fixed number of queries."""
+
+        with self.assertNumQueries(5):
+            self.client.delete(
+                reverse_lazy("minute_stats"),
+                QUERY_STRING="action=delete_older_than&args=2022-01-01T01:00Z",
+            )
+
+        with self.assertNumQueries(5):
+            self.client.delete(
+                reverse_lazy("minute_stats"), QUERY_STRING="action=truncate"
+            )
+
+    def test_statements_are_compiled_once(self):
+        """The statements of the hot paths are only compiled by the first request."""
+
+        range_query = "since=2022-01-01T00:00Z&before=2022-01-01T01:00Z"
+        self.client.get(reverse_lazy("minute_stats"), QUERY_STRING=range_query)
+        self.client.get(reverse_lazy("minute_stats"))
+
+        with mock.patch.object(SQLCompiler, "as_sql", side_effect=AssertionError):
+            response = self.client.get(
+                reverse_lazy("minute_stats"), QUERY_STRING=range_query
+            )
+            self.client.get(reverse_lazy("minute_stats"))
+
+        self.assertEqual(len(response.json()), 61)
+        self.assertEqual(response.json()[0]["upload_time"], "2022-01-01T00:00:00Z")
+
+    def test_connection_pragmas(self):
+        """The connections are tuned with the `SQLITE_PRAGMAS` once opened."""
+
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA cache_size")
+            self.assertEqual(cursor.fetchone()[0], -16384)
+            cursor.execute("PRAGMA temp_store")
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+    def test_range_peak_memory(self):
+        """Getting 1000 records stays within a fixed memory budget."""
+
+        with self.assertMaxPeakMemory(5 * 1024 * 1024):
+            response = self.client.get(
+                reverse_lazy("minute_stats"),
+                QUERY_STRING="since=2022-01-01T00:00Z&before=2022-01-02T00:00Z",
+            )
+
+        self.assertEqual(len(response.json()), 1000)
+
+
+class LastRecordsTests(APITestCase):
+    """Tests for getting the newest records with the `last` parameter."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Set up test data."""
+
+        cls.testuser = User.objects.create(
+            username="testuser", is_staff=True, is_superuser=True
+        )
+        start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+        MinuteStatsRecord.objects.bulk_create(
+            MinuteStatsRecord(upload_time=start + timedelta(minutes=minute))
+            for minute in range(100)
+        )
+        DailyStatsRecord.objects.bulk_create(
+            DailyStatsRecord(upload_date=date(2022, 1, day)) for day in range(1, 11)
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.testuser)
+
+    def _get_times(self, url_name, query_string):
+        response = self.client.get(reverse_lazy(url_name), QUERY_STRING=query_string)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        return [record[list(record)[0]] for record in response.json()]
+
+    def test_last_records(self):
+        with self.assertNumQueries(1):
+            times = self._get_times("minute_stats", "last=3&fields=upload_time")
+
+        self.assertEqual(
+            times,
+            ["2022-01-01T01:37:00Z", "2022-01-01T01:38:00Z", "2022-01-01T01:39:00Z"],
+        )
+        self.assertEqual(
+            self._get_times("daily_stats", "last=2&fields=upload_date"),
+            ["2022-01-09", "2022-01-10"],
+        )
+
+    def test_last_records_in_range(self):
+        self.assertEqual(
+            self._get_times(
+                "minute_stats", "last=2&before=2022-01-01T00:10Z&fields=upload_time"
+            ),
+            ["2022-01-01T00:09:00Z", "2022-01-01T00:10:00Z"],
+        )
+        self.assertEqual(
+            self._get_times(
+                "minute_stats", "last=50&since=2022-01-01T01:38Z&fields=upload_time"
+            ),
+            ["2022-01-01T01:38:00Z", "2022-01-01T01:39:00Z"],
+        )
+
+    def test_invalid_last(self):
+        for query_string in ("last=0", "last=-1", "last=x", "last=10001", "last=²"):
+            with self.subTest(query_string=query_string):
+                response = self.client.get(
+                    reverse_lazy("minute_stats"), QUERY_STRING=query_string
+                )
+                self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(
+            reverse_lazy("minute_stats"),
+            QUERY_STRING="last=5&filter=inverter_status:0",
+        )
+        self.assertEqual(response.json(), response_templates.LAST_WITH_FILTER.data)
+
+
+@override_settings(ROW_BUDGET=50, USER_ROW_BUDGETS={"collector": 0})
+class RowBudgetTests(APITestCase):
+    """Tests for the row budget of the range queries, and for streaming them."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Set up test data."""
+
+        cls.testuser = User.objects.create(
+            username="testuser", is_staff=True, is_superuser=True
+        )
+        cls.collector = User.objects.create(
+            username="collector", is_staff=True, is_superuser=True
+        )
+        start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+        MinuteStatsRecord.objects.bulk_create(
+            MinuteStatsRecord(
+                upload_time=start + timedelta(minutes=minute),
+                inverter_status=minute % 2,
+            )
+            for minute in range(100)
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.testuser)
+
+    def _get(self, query_string):
+        return self.client.get(reverse_lazy("minute_stats"), QUERY_STRING=query_string)
+
+    def test_queries_over_the_budget_are_refused(self):
+        for query_string in (
+            "since=2022-01-01",
+            "since=2022-01-01&filter=inverter_status__gte:0",
+            "last=51",
+        ):
+            with self.subTest(query_string=query_string):
+                response = self._get(query_string)
+                self.assertEqual(
+                    response.json(), response_templates.row_budget_exceeded(50).data
+                )
+
+    def test_queries_within_the_budget(self):
+        for query_string, no_rows in (
+            ("since=2022-01-01T00:50Z", 50),
+            ("since=2022-01-01&filter=inverter_status:1", 50),
+            ("last=50", 50),
+        ):
+            with self.subTest(query_string=query_string):
+                response = self._get(query_string)
+                self.assertEqual(response.status_code, HTTP_200_OK)
+                self.assertEqual(len(response.json()), no_rows)
+
+    def test_budget_of_a_user(self):
+        self.client.force_authenticate(self.collector)
+        response = self._get("since=2022-01-01")
+        self.assertEqual(len(response.json()), 100)
+
+    @mock.patch("solax_registers.create_views.STREAM_CHUNK_SIZE", 7)
+    def test_stream(self):
+        for query_string in (
+            "since=2022-01-01&fields=upload_time&fields=inverter_status",
+            "since=2022-01-01&fields=inverter_status",
+            "since=2022-01-01&filter=inverter_status:1",
+            "before=2021-01-01",
+        ):
+            with self.subTest(query_string=query_string):
+                with override_settings(ROW_BUDGET=0):
+                    expected = self._get(query_string).json()
+                response = self._get(f"{query_string}&stream=true")
+                self.assertEqual(response.status_code, HTTP_200_OK)
+                self.assertEqual(response["Content-Type"], "application/json")
+                self.assertEqual(
+                    json.loads(b"".join(response.streaming_content)), expected
+                )
+
+    def test_invalid_stream(self):
+        response = self._get("since=2022-01-01&stream=yes")
+        self.assertEqual(response.json(), response_templates.INVALID_STREAM_PARAM.data)
+        response = self._get("last=5&stream=true")
+        self.assertEqual(response.json(), response_templates.LAST_WITH_STREAM.data)
+
+
+class AsOfTests(APITestCase):
+    """Tests for the batched as-of lookups of minute records."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Set up test data."""
+
+        cls.testuser = User.objects.create(
+            username="testuser", is_staff=True, is_superuser=True
+        )
+        start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+        MinuteStatsRecord.objects.bulk_create(
+            MinuteStatsRecord(
+                upload_time=start + timedelta(minutes=minute), dc_solar_power=minute
+            )
+            for minute in range(0, 100, 10)
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.testuser)
+
+    def _post(self, data):
+        return self.client.post(
+            reverse_lazy("minute_stats_as_of"), data=data, format="json"
+        )
+
+    def test_as_of(self):
+        with self.assertNumQueries(1):
+            response = self._post(
+                {
+                    "timestamps": [
+                        "2022-01-01T00:25Z",
+                        "2022-01-01T00:10Z",
+                        "2021-12-31T23:59Z",
+                        "2022-01-01T05:00Z",
+                    ],
+                    "fields": ["upload_time", "dc_solar_power"],
+                }
+            )
+
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(
+            response.json()["results"],
+            [
+                {"upload_time": "2022-01-01T00:20:00Z", "dc_solar_power": 20},
+                {"upload_time": "2022-01-01T00:10:00Z", "dc_solar_power": 10},
+                None,
+                {"upload_time": "2022-01-01T01:30:00Z", "dc_solar_power": 90},
+            ],
+        )
+
+    def test_tolerance(self):
+        response = self._post(
+            {
+                "timestamps": ["2022-01-01T00:25Z", "2022-01-01T00:35Z"],
+                "tolerance": 300,
+                "fields": ["dc_solar_power"],
+            }
+        )
+
+        self.assertEqual(
+            response.json()["results"], [{"dc_solar_power": 20}, {"dc_solar_power": 30}]
+        )
+
+        response = self._post({"timestamps": ["2022-01-01T00:25Z"], "tolerance": 299})
+        self.assertEqual(response.json()["results"], [None])
+
+    def test_invalid_as_of(self):
+        for data in (
+            {},
+            {"timestamps": []},
+            {"timestamps": "2022-01-01T00:00Z"},
+            {"timestamps": [1]},
+            {"timestamps": ["yesterday"]},
+            {"timestamps": ["2022-01-01T00:00Z"] * 1001},
+            {"timestamps": ["2022-01-01T00:00Z"], "tolerance": -1},
+            {"timestamps": ["2022-01-01T00:00Z"], "tolerance": True},
+            {"timestamps": ["2022-01-01T00:00Z"], "fields": ["unknown"]},
+        ):
+            with self.subTest(data=data):
+                self.assertEqual(self._post(data).status_code, HTTP_400_BAD_REQUEST)
+
+    def test_as_of_needs_view_permission(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create(username="collector")
+            user.user_permissions.add(
+                *Permission.objects.filter(
+                    codename__in=("add_minutestatsrecord", "add_lastminutestatsrecord")
+                )
+            )
+        self.client.force_authenticate(user)
+
+        response = self._post({"timestamps": ["2022-01-01T00:00Z"]})
+        self.assertEqual(response.status_code, HTTP_403_FORBIDDEN)
+
+
+class CoverageTests(APITestCase):
+    """Tests for the coverage index of the minute stats."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Set up test data."""
+
+        cls.testuser = User.objects.create(
+            username="testuser", is_staff=True, is_superuser=True
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.testuser)
+
+    def _post_minutes(self, *times):
+        for time in times:
+            data = get_sample_column_values(
+                columns["minute_stats"],
+                column_values={"upload_time": f"2022-01-01T00:{time}Z"},
+            )
+            self.client.post(reverse_lazy("minute_stats"), data=data, format="json")
+
+    def _get_runs(self):
+        return [
+            (str(run.first_minute.time()), str(run.last_minute.time()))
+            for run in MinuteStatsRun.objects.order_by("first_minute")
+        ]
+
+    def _get_coverage(self, query_string=""):
+        return self.client.get(
+            reverse_lazy("minute_stats_coverage"), QUERY_STRING=query_string
+        )
+
+    def test_coverage(self):
+        self._post_minutes("06", "01", "00", "05", "06:30", "02")
+        self.assertEqual(
+            self._get_runs(), [("00:00:00", "00:02:00"), ("00:05:00", "00:06:00")]
+        )
+
+        with self.assertNumQueries(1):
+            response = self._get_coverage(
+                "since=2022-01-01T00:00:30Z&before=2022-01-01T00:09:59Z"
+            )
+
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(
+            response.json(),
+            {
+                "since": "2022-01-01T00:01:00Z",
+                "before": "2022-01-01T00:09:00Z",
+                "expected_minutes": 9,
+                "covered_minutes": 4,
+                "missing_minutes": 5,
+                "completeness": 44.44,
+                "gaps": [
+                    {
+                        "since": "2022-01-01T00:03:00Z",
+                        "before": "2022-01-01T00:04:00Z",
+                        "minutes": 2,
+                    },
+                    {
+                        "since": "2022-01-01T00:07:00Z",
+                        "before": "2022-01-01T00:09:00Z",
+                        "minutes": 3,
+                    },
+                ],
+            },
+        )
+
+        self._post_minutes("03", "04")
+        self.assertEqual(self._get_runs(), [("00:00:00", "00:06:00")])
+        response = self._get_coverage()
+        self.assertEqual(response.json()["completeness"], 100)
+        self.assertEqual(response.json()["since"], "2022-01-01T00:00:00Z")
+
+    def test_coverage_after_delete(self):
+        self._post_minutes("00", "01", "02", "02:30", "05")
+
+        self.client.delete(
+            reverse_lazy("minute_stats"),
+            QUERY_STRING="action=delete_older_than&args=2022-01-01T00:02:10Z",
+        )
+        self.assertEqual(
+            self._get_runs(), [("00:02:00", "00:02:00"), ("00:05:00", "00:05:00")]
+        )
+
+        self.client.delete(reverse_lazy("minute_stats"), QUERY_STRING="action=truncate")
+        self.assertEqual(self._get_runs(), [])
+        self.assertEqual(
+            self._get_coverage().json(),
+            {
+                "since": None,
+                "before": None,
+                "expected_minutes": 0,
+                "covered_minutes": 0,
+                "missing_minutes": 0,
+                "completeness": None,
+                "gaps": [],
+            },
+        )
+
+    def test_rebuild_coverage(self):
+        self._post_minutes("10")
+        start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+        MinuteStatsRecord.objects.bulk_create(
+            MinuteStatsRecord(upload_time=start + timedelta(minutes=minute))
+            for minute in (0, 1, 3)
+        )
+        self.assertEqual(self._get_runs(), [("00:10:00", "00:10:00")])
+
+        call_command("rebuild_coverage", stdout=StringIO())
+
+        self.assertEqual(
+            self._get_runs(),
+            [
+                ("00:00:00", "00:01:00"),
+                ("00:03:00", "00:03:00"),
+                ("00:10:00", "00:10:00"),
+            ],
+        )
+
+    def test_invalid_coverage(self):
+        response = self._get_coverage("since=yesterday")
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.json(), response_templates.invalid_timestamp_param("since").data
+        )
+
+
+class RangeCacheTests(APITestCase):
+    """Tests for the cache on disk of the range queries of the past."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Set up test data."""
+
+        cls.testuser = User.objects.create(
+            username="testuser", is_staff=True, is_superuser=True
+        )
+        cls.start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+        MinuteStatsRecord.objects.bulk_create(
+            MinuteStatsRecord(
+                upload_time=cls.start + timedelta(minutes=minute), grid_voltage_r=200
+            )
+            for minute in range(60)
+        )
+
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+
+        settings_override = override_settings(
+            CACHE_DIR=cache_dir.name, RANGE_CACHE_MB=1
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client.force_authenticate(self.testuser)
+
+    def _get(self, since="2022-01-01T00:10Z", before="2022-01-01T00:20Z"):
+        return self.client.get(
+            reverse_lazy("minute_stats"),
+            QUERY_STRING=f"since={since}&before={before}&fields=grid_voltage_r",
+        )
+
+    def _post(self, minute, overwrite=True):
+        data = get_sample_column_values(
+            columns["minute_stats"],
+            column_values={
+                "upload_time": (self.start + timedelta(minutes=minute)).isoformat(),
+                "grid_voltage_r": 230,
+            },
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse_lazy("minute_stats"),
+                data=data,
+                format="json",
+                QUERY_STRING=f"overwrite={str(overwrite).lower()}",
+            )
+
+    def test_cached_range(self):
+        with override_settings(RANGE_CACHE_MB=0):
+            expected = self._get()
+        response = self._get()
+
+        with self.assertNumQueries(0):
+            cached_response = self._get()
+
+        self.assertEqual(cached_response.status_code, HTTP_200_OK)
+        self.assertEqual(cached_response["Content-Type"], expected["Content-Type"])
+        self.assertEqual(cached_response.content, expected.content)
+        self.assertEqual(response.content, expected.content)
+
+    def test_recent_range_is_not_cached(self):
+        before = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%MZ")
+        self._get(before=before)
+
+        with CaptureQueriesContext(connection) as queries:
+            self._get(before=before)
+        self.assertTrue(queries.captured_queries)
+
+    def test_overwrite_invalidates_overlapping_ranges(self):
+        self._get()
+        self._get(since="2022-01-01T00:30Z", before="2022-01-01T00:40Z")
+
+        self._post(15)
+
+        self.assertIn(230, [record["grid_voltage_r"] for record in self._get().json()])
+        with self.assertNumQueries(0):
+            self._get(since="2022-01-01T00:30Z", before="2022-01-01T00:40Z")
+
+    def test_delete_invalidates_ranges(self):
+        self._get()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(
+                reverse_lazy("minute_stats"),
+                QUERY_STRING="action=delete_older_than&args=2022-01-01T00:14Z",
+            )
+
+        self.assertEqual(len(self._get().json()), 6)
+
+    def test_response_of_an_invalidated_query_is_not_stored(self):
+        self._get()
+        view = self._get().renderer_context["view"]
+        config = {
+            "range": ("2022-01-01T00:10Z", "2022-01-01T00:30Z"),
+            "fields": ["grid_voltage_r"],
+            "last": None,
+        }
+        entry = range_cache.lookup(view, "upload_time", config)
+        self.assertIsNone(entry.body)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            range_cache.notify_changed(MinuteStatsRecord, self.start)
+        range_cache.store(entry, view, [])
+
+        self.assertIsNone(range_cache.lookup(view, "upload_time", config).body)
+
+    def test_eviction(self):
+        cache = range_cache._get_connection()
+        cache.executemany(
+            "INSERT INTO entries VALUES (?, 'm', '', '', x'00', 400, ?)",
+            [(f"key{index}", index) for index in range(5)],
+        )
+
+        range_cache._evict(cache, 1000)
+
+        self.assertEqual(
+            [key for (key,) in cache.execute("SELECT key FROM entries ORDER BY key")],
+            ["key3", "key4"],
+        )
+
+
+class CoalescingTests(unittest.TestCase):
+    """Tests for the single-flight execution of identical range queries."""
+
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+
+        settings_override = override_settings(CACHE_DIR=cache_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.started, self.release = threading.Event(), threading.Event()
+        self.calls = []
+
+    def _compute_slowly(self) -> bytes:
+        self.calls.append("leader")
+        self.started.set()
+        self.release.wait(5)
+        return b"[1]"
+
+    def _compute(self) -> bytes:
+        self.calls.append("follower")
+        return b"[2]"
+
+    def _run_with_leader(self, run_follower):
+        results = []
+
+        def lead():
+            try:
+                results.append(coalescing.run("query", self._compute_slowly))
+            except ValueError as exc:
+                results.append(exc)
+
+        leader = threading.Thread(target=lead)
+        leader.start()
+        self.started.wait(5)
+
+        follower = threading.Thread(target=lambda: results.append(run_follower()))
+        follower.start()
+        # Let the follower start waiting before the leader ends.
+        follower.join(0.1)
+        self.release.set()
+        leader.join(5)
+        follower.join(5)
+        return results
+
+    def test_threads_share_a_flight(self):
+        results = self._run_with_leader(lambda: coalescing.run("query", self._compute))
+
+        self.assertEqual(results, [b"[1]", b"[1]"])
+        self.assertEqual(self.calls, ["leader"])
+
+    def test_workers_share_a_flight(self):
+        # The flight of another worker is only visible through the lock files.
+        results = self._run_with_leader(
+            lambda: coalescing._run_across_workers("query", self._compute)
+        )
+
+        self.assertEqual(results, [b"[1]", b"[1]"])
+        self.assertEqual(self.calls, ["leader"])
+
+        # A query arriving after the flight runs on its own.
+        self.assertEqual(coalescing._run_across_workers("query", self._compute), b"[2]")
+
+    def test_failed_flight(self):
+        def fail():
+            self.started.set()
+            self.release.wait(5)
+            raise ValueError
+
+        self._compute_slowly = fail
+        results = self._run_with_leader(lambda: coalescing.run("query", self._compute))
+
+        self.assertIn(b"[2]", results)
+        self.assertTrue(any(isinstance(result, ValueError) for result in results))
+
+
+@override_settings(READ_SLOTS=1, READ_SLOT_TIMEOUT=0)
+class AdmissionTests(APITestCase):
+    """Tests for the admission control of the writes and the reads."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Set up test data."""
+
+        cls.testuser = User.objects.create(
+            username="testuser", is_staff=True, is_superuser=True
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.testuser)
+
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        settings_override = override_settings(CACHE_DIR=cache_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _import(self):
+        return self.client.generic(
+            "POST",
+            reverse_lazy("daily_stats_import"),
+            b"upload_date\n2022-01-01\n",
+            "text/csv",
+        )
+
+    def test_imports_without_a_free_slot(self):
+        with admission.slot("import", 1):
+            response = self._import()
+        self.assertEqual(response.status_code, HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response["Retry-After"], "30")
+        self.assertFalse(DailyStatsRecord.objects.exists())
+
+        self.assertEqual(self._import().status_code, HTTP_200_OK)
+
+    def test_reads_without_a_free_slot(self):
+        url = reverse_lazy("minute_stats")
+        with admission.slot("read", 1):
+            for query_string in ("since=2022-01-01", "since=2022-01-01&stream=true"):
+                with self.subTest(query_string=query_string):
+                    response = self.client.get(url, QUERY_STRING=query_string)
+                    self.assertEqual(response.status_code, HTTP_429_TOO_MANY_REQUESTS)
+                    self.assertEqual(response["Retry-After"], "1")
+
+            response = self.client.post(
+                reverse_lazy("batch_query"),
+                {"queries": [{"table": "daily_stats", "since": "2022-01-01"}]},
+                format="json",
+            )
+            self.assertEqual(response.status_code, HTTP_429_TOO_MANY_REQUESTS)
+            # The last record is not read from the history.
+            self.assertEqual(self.client.get(url).status_code, HTTP_200_OK)
+
+        response = self.client.get(url, QUERY_STRING="since=2022-01-01")
+        self.assertEqual(response.status_code, HTTP_200_OK)
+
+    def test_bulk_writes_yield_to_live_writes(self):
+        writing, done = threading.Event(), threading.Event()
+
+        def write():
+            with admission.live_write():
+                writing.set()
+                done.wait(5)
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        writing.wait(5)
+        threading.Timer(0.2, done.set).start()
+
+        start = time.monotonic()
+        admission.yield_to_live_writes()
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+        writer.join()
+
+
+# The default columns file has no index, which the filters without a range need.
+@mock.patch(
+    "solax_registers.filters.get_indexed_columns", lambda model: ("inverter_status",)
+)
+class ValueFilterTests(APITestCase):
+    """Tests for the value filters of the GET endpoints."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Set up test data."""
+
+        cls.testuser = User.objects.create(
+            username="testuser", is_staff=True, is_superuser=True
+        )
+
+        start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+        MinuteStatsRecord.objects.bulk_create(
+            MinuteStatsRecord(
+                upload_time=start + timedelta(minutes=minute),
+                inverter_status=[2, 1, 3][minute % 3],
+                grid_voltage_r=None if minute == 8 else 230 + minute * 5,
+            )
+            for minute in range(9)
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.testuser)
+
+    def _get_minutes(self, *filters, query_string="fields=upload_time"):
+        query = "&".join([query_string] + [f"filter={f}" for f in filters])
+        response = self.client.get(reverse_lazy("minute_stats"), QUERY_STRING=query)
+        self.assertEqual(response.status_code, HTTP_200_OK, response.content)
+        return [int(record["upload_time"][14:16]) for record in response.json()]
+
+    def test_eq_filter(self):
+        with self.assertNumQueries(1):
+            minutes = self._get_minutes("inverter_status:1")
+
+        self.assertEqual(minutes, [1, 4, 7])
+        self.assertEqual(self._get_minutes("inverter_status__eq:1"), [1, 4, 7])
+
+    def test_ne_filter(self):
+        self.assertEqual(
+            self._get_minutes(
+                "inverter_status__ne:2",
+                query_string="since=2022-01-01T00:02Z&fields=upload_time",
+            ),
+            [2, 4, 5, 7, 8],
+        )
+
+    def test_comparison_filters(self):
+        range_query = "since=2022-01-01T00:00Z&fields=upload_time"
+
+        self.assertEqual(
+            self._get_minutes("grid_voltage_r__gt:250", query_string=range_query),
+            [5, 6, 7],
+        )
+        self.assertEqual(
+            self._get_minutes(
+                "grid_voltage_r__gte:240",
+                "grid_voltage_r__lt:250",
+                query_string=range_query,
+            ),
+            [2, 3],
+        )
+        self.assertEqual(
+            self._get_minutes("inverter_status__lte:1", query_string=range_query),
+            [1, 4, 7],
+        )
+
+    def test_in_and_isnull_filters(self):
+        range_query = "since=2022-01-01T00:00Z&fields=upload_time"
+
+        self.assertEqual(
+            self._get_minutes("inverter_status__in:1,3"), [1, 2, 4, 5, 7, 8]
+        )
+        self.assertEqual(
+            self._get_minutes("grid_voltage_r__isnull:true", query_string=range_query),
+            [8],
+        )
+
+    def test_filter_on_column_without_index(self):
+        response = self.client.get(
+            reverse_lazy("minute_stats"), QUERY_STRING="filter=grid_voltage_r__gt:250"
+        )
+
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+        self.assertIn("since", response.json()["detail"])
+
+    def test_invalid_filters(self):
+        for expression in (
+            "inverter_status",
+            "unknown:1",
+            "inverter_status__like:1",
+            "inverter_status:x",
+            "inverter_status:1.5",
+            "inverter_status__isnull:true",
+            "inverter_status__in:1,x",
+        ):
+            with self.subTest(expression=expression):
+                response = self.client.get(
+                    reverse_lazy("minute_stats"), QUERY_STRING=f"filter={expression}"
+                )
+                self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+
+
+class RecentWindowTests(APITestCase):
+    """Tests for the window of recent minute records shared by the workers."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Set up test data."""
+
+        cls.testuser = User.objects.create(
+            username="testuser", is_staff=True, is_superuser=True
+        )
+        cls.start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+        MinuteStatsRecord.objects.bulk_create(
+            MinuteStatsRecord(
+                upload_time=cls.start + timedelta(minutes=minute),
+                grid_voltage_r=None if minute % 7 == 0 else 200 + minute,
+                energy_from_grid_meter=minute / 4,
+            )
+            for minute in range(90)
+        )
+
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+
+        settings_override = override_settings(
+            CACHE_DIR=cache_dir.name, RECENT_WINDOW_HOURS=1
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(recent._windows.clear)
+
+        self.client.force_authenticate(self.testuser)
+
+    def _get(self, since, before=None):
+        params = {"since": since.isoformat()}
+        if before is not None:
+            params["before"] = before.isoformat()
+        return self.client.get(reverse_lazy("minute_stats"), params).json()
+
+    def _get_from_database(self, since, before=None):
+        with override_settings(RECENT_WINDOW_HOURS=0):
+            return self._get(since, before)
+
+    def test_range_in_window(self):
+        since = self.start + timedelta(minutes=40)
+        before = self.start + timedelta(minutes=75)
+        self._get(since)
+
+        with self.assertNumQueries(0):
+            records = self._get(since, before)
+
+        self.assertEqual(len(records), 36)
+        self.assertEqual(records, self._get_from_database(since, before))
+        self.assertIsNone(records[2]["grid_voltage_r"])
+        self.assertEqual(records[-1]["energy_from_grid_meter"], 18.75)
+
+    def test_range_outside_window(self):
+        since = self.start + timedelta(minutes=29)
+
+        records = self._get(since)
+
+        self.assertEqual(len(records), 61)
+        self.assertEqual(records, self._get_from_database(since))
+
+    def test_posted_records_are_appended(self):
+        since = self.start + timedelta(minutes=85)
+        self._get(since)
+
+        for minute in (90, 91):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(
+                    reverse_lazy("minute_stats"),
+                    data={
+                        "upload_time": self.start + timedelta(minutes=minute),
+                        "grid_voltage_r": 100,
+                    },
+                    format="json",
+                )
+
+        with self.assertNumQueries(0):
+            records = self._get(since)
+            last_record = self.client.get(reverse_lazy("minute_stats")).json()
+        self.assertEqual(len(records), 7)
+        self.assertEqual(records, self._get_from_database(since))
+        self.assertEqual(last_record, records[-1])
+        window = recent.get_window(MinuteStatsRecord)
+        for minute, is_in_window in ((31, False), (32, True)):
+            since = str(self.start + timedelta(minutes=minute))
+            records = window.get_records(since, None, ["upload_time"])
+            self.assertEqual(records is not None, is_in_window)
+
+    def test_concurrent_appends(self):
+        """Two threads of a worker publishing the same append add it once."""
+
+        window = recent.get_window(MinuteStatsRecord)
+        window.fill()
+        header = window._header
+        # The window is full, so each append moves its head by one record.
+        head, sequence = header[recent.HEAD], header[recent.SEQUENCE]
+
+        MinuteStatsRecord.objects.create(upload_time=self.start + timedelta(minutes=90))
+        queryset, names = window._get_queryset()
+        rows = list(
+            queryset.filter(rowid__gt=header[recent.LAST_ROWID])
+            .order_by("rowid")
+            .values_list("rowid", *names)
+        )
+        latest = window._get_latest_row()
+
+        # The threads have no database connection of their own in the test
+        # transaction, so they read the rows queried above.
+        def filter_rows(rowid__gt):
+            new_rows = mock.MagicMock()
+            values = new_rows.order_by.return_value.values_list.return_value
+            values.__getitem__.return_value = [r for r in rows if r[0] > rowid__gt]
+            return new_rows
+
+        fake_queryset = mock.Mock(filter=filter_rows)
+        started = threading.Barrier(2)
+
+        def get_latest_row():
+            time.sleep(0.05)
+            return latest
+
+        def publish():
+            started.wait(5)
+            window.publish_append()
+
+        with mock.patch.object(
+            window, "_get_queryset", return_value=(fake_queryset, names)
+        ), mock.patch.object(window, "_get_latest_row", side_effect=get_latest_row):
+            threads = [threading.Thread(target=publish) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(5)
+
+        self.assertEqual(header[recent.HEAD], (head + 1) % window.capacity)
+        self.assertEqual(header[recent.SEQUENCE], sequence + 4)
+
+    def test_changed_records_reload_the_window(self):
+        since = self.start + timedelta(minutes=80)
+        self._get(since)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse_lazy("minute_stats") + "?overwrite=true",
+                data={"upload_time": self.start + timedelta(minutes=85)},
+                format="json",
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(
+                reverse_lazy("minute_stats"),
+                QUERY_STRING="action=delete_older_than&args=2022-01-01T01:22Z",
+            )
+
+        records = self._get(since)
+        self.assertEqual(len(records), 7)
+        self.assertEqual(records, self._get_from_database(since))
+        self.assertIsNone(records[2]["grid_voltage_r"])
+
+    def test_last_records(self):
+        since = self.start + timedelta(minutes=80)
+        self._get(since)
+
+        for query_string, in_window in (
+            ("last=5", True),
+            ("last=60", True),
+            ("last=61", False),
+            ("last=61&since=2022-01-01T01:00Z", True),
+            ("last=5&before=2022-01-01T00:40Z", True),
+            ("last=5&before=2022-01-01T00:32Z", False),
+        ):
+            with self.subTest(query_string=query_string):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(
+                        reverse_lazy("minute_stats"), QUERY_STRING=query_string
+                    )
+                self.assertEqual(len(queries) == 0, in_window)
+                with override_settings(RECENT_WINDOW_HOURS=0):
+                    expected = self.client.get(
+                        reverse_lazy("minute_stats"), QUERY_STRING=query_string
+                    )
+                self.assertEqual(response.json(), expected.json())
+
+    def test_window_is_shared(self):
+        since = str(self.start + timedelta(minutes=80))
+        window = recent.get_window(MinuteStatsRecord)
+        other_window = recent.RecentWindow("minute_stats", window.capacity)
+        self.assertEqual(
+            len(other_window.get_records(since, None, ["upload_time"])), 10
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse_lazy("minute_stats"),
+                data={"upload_time": self.start + timedelta(minutes=90)},
+                format="json",
+            )
+
+        with self.assertNumQueries(0):
+            records = other_window.get_records(since, None, ["upload_time"])
+            last_record = other_window.get_latest(["upload_time", "grid_voltage_r"])
+        self.assertEqual(len(records), 11)
+        self.assertEqual(
+            last_record,
+            {"upload_time": self.start + timedelta(minutes=90), "grid_voltage_r": None},
+        )
+
+    def test_interrupted_write(self):
+        since = self.start + timedelta(minutes=80)
+        self._get(since)
+        window = recent.get_window(MinuteStatsRecord)
+        window._header[recent.SEQUENCE] += 1
+
+        records = self._get(since)
+
+        self.assertEqual(records, self._get_from_database(since))
+        self.assertEqual(window._header[recent.SEQUENCE] % 2, 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(self._get(since), records)
+
+
+class BatchQueryTests(APITestCase):
+    """Tests for the batch query endpoint."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Set up test data."""
+
+        cls.testuser = User.objects.create(
+            username="testuser", is_staff=True, is_superuser=True
+        )
+
+        start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+        MinuteStatsRecord.objects.bulk_create(
+            MinuteStatsRecord(
+                upload_time=start + timedelta(minutes=minute),
+                grid_voltage_r=230 + minute,
+            )
+            for minute in range(10)
+        )
+        LastDayStatsRecord.objects.create(upload_date="2022-01-01", total_yield=5)
+
+    def _post(self, queries):
+        return self.client.post(
+            reverse_lazy("batch_query"), data={"queries": queries}, format="json"
+        )
+
+    def test_batch_query(self):
+        self.client.force_authenticate(self.testuser)
+
+        response = self._post(
+            [
+                {
+                    "table": "minute_stats",
+                    "since": "2022-01-01T00:00",
+                    "before": "2022-01-01T00:01",
+                    "fields": ["upload_time", "grid_voltage_r"],
+                },
+                {
+                    "table": "minute_stats",
+                    "since": "2022-01-01T00:05Z",
+                    "filter": ["grid_voltage_r__lt:238"],
+                    "aggregate": {"max": ["grid_voltage_r"], "count": ["upload_time"]},
+                },
+                {"table": "daily_stats", "fields": ["upload_date", "total_yield"]},
+            ]
+        )
+
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(
+            response.json()["results"],
+            [
+                [
+                    {"upload_time": "2022-01-01T00:00:00Z", "grid_voltage_r": 230},
+                    {"upload_time": "2022-01-01T00:01:00Z", "grid_voltage_r": 231},
+                ],
+                {"grid_voltage_r__max": 237, "upload_time__count": 3},
+                {"upload_date": "2022-01-01", "total_yield": 5.0},
+            ],
+        )
+
+    def test_invalid_batch_query(self):
+        self.client.force_authenticate(self.testuser)
+
+        for queries in (
+            [],
+            [{"table": "minute_stats"}, {"table": "unknown"}],
+            [{"table": "minute_stats", "fields": ["unknown"]}],
+            [{"table": "minute_stats", "aggregate": {"max": ["grid_voltage_r"]}}],
+            [{"table": "minute_stats", "since": "x"}],
+            [
+                {
+                    "table": "minute_stats",
+                    "since": "2022-01-01",
+                    "aggregate": {"median": []},
+                }
+            ],
+        ):
+            with self.subTest(queries=queries):
+                response = self._post(queries)
+                self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+
+        response = self._post([{"table": "minute_stats"}, {"table": "unknown"}])
+        self.assertIn("position 1", response.json()["detail"])
+
+    @override_settings(ROW_BUDGET=5)
+    def test_batch_query_row_budget(self):
+        self.client.force_authenticate(self.testuser)
+
+        response = self._post(
+            [
+                {"table": "minute_stats", "since": "2022-01-01T00:05Z"},
+                {
+                    "table": "minute_stats",
+                    "since": "2022-01-01",
+                    "aggregate": {"count": ["upload_time"]},
+                },
+            ]
+        )
+        self.assertEqual(response.status_code, HTTP_200_OK)
+
+        response = self._post(
+            [
+                {"table": "minute_stats", "since": "2022-01-01T00:05Z"},
+                {"table": "minute_stats", "since": "2022-01-01T00:04Z"},
+            ]
+        )
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+        self.assertIn("position 1", response.json()["detail"])
+
+    def test_batch_query_permissions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create(username="dailyviewer")
+            user.user_permissions.set(
+                Permission.objects.filter(
+                    codename__in=["view_dailystatsrecord", "view_lastdaystatsrecord"]
+                )
+            )
+        self.client.force_authenticate(user)
+
+        response = self._post([{"table": "daily_stats"}])
+        self.assertEqual(response.status_code, HTTP_200_OK)
+
+        response = self._post([{"table": "daily_stats"}, {"table": "minute_stats"}])
+        self.assertEqual(response.status_code, HTTP_403_FORBIDDEN)
+
+
+class GenerateStatsTests(APITestCase):
+    """Tests for the `generate_stats` command."""
+
+    def test_generate_stats(self):
+        call_command("generate_stats", "2", "--end=2024-06-03", stdout=StringIO())
+
+        self.assertEqual(MinuteStatsRecord.objects.count(), 2 * 1440)
+        self.assertEqual(DailyStatsRecord.objects.count(), 2)
+        self.assertEqual(
+            LastMinuteStatsRecord.objects.get().upload_time,
+            datetime(2024, 6, 2, 23, 59, tzinfo=timezone.utc),
+        )
+        self.assertEqual(
+            str(LastDayStatsRecord.objects.get().upload_date), "2024-06-02"
+        )
+
+    def test_generate_stats_keeps_existing_records(self):
+        call_command("generate_stats", "1", "--end=2024-06-02", stdout=StringIO())
+        first = MinuteStatsRecord.objects.values().first()
+
+        call_command(
+            "generate_stats", "1", "--end=2024-06-02", "--seed=1", stdout=StringIO()
+        )
+        self.assertEqual(MinuteStatsRecord.objects.values().first(), first)
+
+        call_command(
+            "generate_stats",
+            "1",
+            "--end=2024-06-02",
+            "--seed=1",
+            "--overwrite",
+            stdout=StringIO(),
+        )
+        self.assertNotEqual(MinuteStatsRecord.objects.values().first(), first)
+
+
+class ImportStatsTests(APITestCase):
+    """Tests for the import endpoints and the `import_stats` command."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Set up test data."""
+
+        cls.testuser = User.objects.create(
+            username="testuser", is_staff=True, is_superuser=True
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.testuser)
+
+    def _post(self, content: bytes, content_type: str, **kwargs):
+        return self.client.generic(
+            "POST",
+            reverse_lazy("daily_stats_import"),
+            content,
+            content_type,
+            **kwargs,
+        )
+
+    def test_import_csv(self):
+        content = (
+            "UPLOAD_DATE,feed_in_energy_today_meter,total_yield\n"
+            "2022-01-01,1.5,100\n"
+            "2022-01-02,,101\n"
+            "2022-01-03,x,102\n"
+            "2022-01-04\n"
+        ).encode()
+
+        response = self._post(content, "text/csv")
+
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.json()["inserted"], 2)
+        self.assertEqual(response.json()["rejected"], 2)
+        self.assertEqual(
+            [rejection["line"] for rejection in response.json()["rejections"]], [4, 5]
+        )
+        self.assertEqual(DailyStatsRecord.objects.count(), 2)
+        self.assertEqual(
+            str(LastDayStatsRecord.objects.get().upload_date), "2022-01-02"
+        )
+
+    def test_import_gzipped_ndjson(self):
+        lines = [
+            '{"upload_date": "2022-01-01", "feed_in_energy_today_meter": 1.5}',
+            '{"upload_date": "2022-01-02", "total_yield": "x"}',
+        ]
+        content = gzip.compress("\n".join(lines).encode())
+
+        response = self._post(
+            content, "application/x-ndjson", HTTP_CONTENT_ENCODING="gzip"
+        )
+
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.json()["inserted"], 1)
+        self.assertEqual(response.json()["rejections"][0]["line"], 2)
+
+    def test_import_non_integral_values(self):
+        lines = [
+            '{"upload_time": "2022-01-01T00:00Z", "inverter_status": 1.5}',
+            '{"upload_time": "2022-01-01T00:01Z", "inverter_status": 2.0}',
+        ]
+
+        response = self.client.generic(
+            "POST",
+            reverse_lazy("minute_stats_import"),
+            "\n".join(lines).encode(),
+            "application/x-ndjson",
+        )
+
+        self.assertEqual(response.json()["inserted"], 1)
+        self.assertEqual(response.json()["rejections"][0]["line"], 1)
+        self.assertEqual(MinuteStatsRecord.objects.get().inverter_status, 2)
+
+    def test_import_overwrite(self):
+        self._post(
+            b"upload_date,feed_in_energy_today_meter\n2022-01-01,1.5\n", "text/csv"
+        )
+
+        response = self._post(
+            b"upload_date,feed_in_energy_today_meter\n2022-01-01,2.5\n", "text/csv"
+        )
+        self.assertEqual(response.json()["skipped"], 1)
+        self.assertEqual(DailyStatsRecord.objects.get().feed_in_energy_today_meter, 1.5)
+
+        self._post(
+            b"upload_date,feed_in_energy_today_meter\n2022-01-01,2.5\n",
+            "text/csv",
+            QUERY_STRING="overwrite=true",
+        )
+        self.assertEqual(DailyStatsRecord.objects.get().feed_in_energy_today_meter, 2.5)
+
+    def test_import_unknown_header(self):
+        for content, content_type in (
+            (b"upload_date,unknown\n2022-01-01,1\n", "text/csv"),
+            (b'{"upload_date": "2022-01-01", "unknown": 1}\n', "application/x-ndjson"),
+        ):
+            with self.subTest(content_type=content_type):
+                response = self._post(content, content_type)
+
+                self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+                self.assertIn("unknown", response.json()["detail"])
+                self.assertEqual(DailyStatsRecord.objects.count(), 0)
+
+    def test_import_unsupported_content_type(self):
+        response = self._post(b"{}", "application/json")
+
+        self.assertEqual(response.status_code, HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    def test_import_without_permission(self):
+        self.client.force_authenticate(User.objects.create(username="nonstaff"))
+
+        response = self._post(b"upload_date\n2022-01-01\n", "text/csv")
+
+        self.assertEqual(response.status_code, HTTP_403_FORBIDDEN)
+
+    def test_import_stats_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "stats.csv")
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(
+                    "date,feed_in_energy_today_meter\n2022-01-01,1.5\n2022-01-02,x\n"
+                )
+
+            stdout, stderr = StringIO(), StringIO()
+            call_command(
+                "import_stats",
+                "daily_stats",
+                path,
+                "--map",
+                "date=upload_date",
+                stdout=stdout,
+                stderr=stderr,
+            )
+
+        self.assertEqual(DailyStatsRecord.objects.count(), 1)
+        self.assertIn("1 records inserted", stdout.getvalue())
+        self.assertIn("line 3: feed_in_energy_today_meter", stderr.getvalue())
+
+
+class SnapshotTests(APITransactionTestCase):
+    """
+    Tests for the snapshot endpoint and command, outside of a transaction,
+    which would lock the tables of the in-memory test database.
+    """
+
+    def setUp(self):
+        self.testuser = User.objects.create(
+            username="testuser", is_staff=True, is_superuser=True
+        )
+        DailyStatsRecord.objects.create(upload_date="2022-01-01")
+
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache_dir = cache_dir.name
+
+        settings_override = override_settings(CACHE_DIR=cache_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _count_records(self, path: str) -> int:
+        with sqlite3.connect(path) as snapshot:
+            table = DailyStatsRecord._meta.db_table
+            return snapshot.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def test_snapshot_command(self):
+        for name in ("snapshot.sqlite3", "snapshot.sqlite3.gz"):
+            output = os.path.join(self.cache_dir, name)
+            call_command(
+                "snapshot", output, "--pages=1", "--pause=0", stdout=StringIO()
+            )
+
+            if name.endswith(".gz"):
+                with gzip.open(output) as file, open(output[:-3], "wb") as copy:
+                    copy.write(file.read())
+                output = output[:-3]
+            self.assertEqual(self._count_records(output), 1)
+
+    def test_snapshot_endpoint(self):
+        self.client.force_login(self.testuser)
+
+        response = self.client.get(reverse_lazy("snapshot"))
+
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        output = os.path.join(self.cache_dir, "snapshot.sqlite3")
+        with open(output, "wb") as file:
+            file.write(gzip.decompress(b"".join(response.streaming_content)))
+        self.assertEqual(self._count_records(output), 1)
+        self.assertEqual(os.listdir(os.path.join(self.cache_dir, "snapshots")), [])
+
+    @mock.patch("solax_registers.snapshots.RESTART_PAUSE", 0)
+    def test_snapshot_of_a_busy_database(self):
+        self.client.force_login(self.testuser)
+
+        with mock.patch(
+            "solax_registers.snapshots._backup",
+            side_effect=snapshots._Restarted,
+        ) as backup:
+            response = self.client.get(reverse_lazy("snapshot"))
+
+        self.assertEqual(response.status_code, HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(backup.call_count, snapshots.MAX_RESTARTS + 1)
+        self.assertEqual(os.listdir(os.path.join(self.cache_dir, "snapshots")), [])
+
+    def test_snapshot_without_staff_user(self):
+        self.client.force_login(User.objects.create(username="nonstaff"))
+
+        response = self.client.get(reverse_lazy("snapshot"))
+
+        self.assertEqual(response.status_code, HTTP_403_FORBIDDEN)
+
+
+class SchemaTests(unittest.TestCase):
+    """Tests for skipping the migrations when the schema is unchanged."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.db_path = os.path.join(directory.name, "db.sqlite3")
+        self.columns_file = os.path.join(directory.name, "columns.json")
+        with open(self.columns_file, "w") as file:
+            file.write("{}")
+        self.real_columns_file = os.path.abspath(
+            os.environ.get("COLUMNS_FILE", "columns.json")
+        )
+
+        environ_patch = mock.patch.dict(
+            os.environ, DB_PATH=self.db_path, COLUMNS_FILE=self.columns_file
+        )
+        environ_patch.start()
+        self.addCleanup(environ_patch.stop)
+
+        call_command_patch = mock.patch("django.core.management.call_command")
+        self.call_command = call_command_patch.start()
+        self.addCleanup(call_command_patch.stop)
+
+    def test_migrate_once(self):
+        self.assertTrue(schema.migrate_if_changed())
+        self.assertEqual(
+            [call.args for call in self.call_command.call_args_list],
+            [("makemigrations", "solax_registers"), ("migrate",)],
+        )
+        self.assertEqual(
+            schema.read_schema_hash(self.db_path), schema.get_schema_hash()
+        )
+
+        self.call_command.reset_mock()
+        self.assertFalse(schema.migrate_if_changed())
+        self.call_command.assert_not_called()
+
+    def test_migrate_after_columns_change(self):
+        schema.migrate_if_changed()
+        with open(self.columns_file, "w") as file:
+            file.write('{"minute": {}}')
+
+        self.call_command.reset_mock()
+        self.assertTrue(schema.migrate_if_changed())
+        self.assertEqual(self.call_command.call_count, 2)
+
+    def test_migrate_a_new_database(self):
+        """The check migrates a new database for real, once."""
+
+        environ = dict(os.environ, COLUMNS_FILE=self.real_columns_file)
+        for expected_output in ("Applying solax_registers", "up to date"):
+            result = subprocess.run(
+                [sys.executable, "-m", "solax_registers.schema"],
+                cwd=schema.BASE_DIR,
+                env=environ,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            self.assertIn(expected_output, result.stdout)
+
+        with sqlite3.connect(self.db_path) as database:
+            table = MinuteStatsRecord._meta.db_table
+            database.execute(f"SELECT COUNT(*) FROM {table}")
+        with mock.patch.dict(os.environ, COLUMNS_FILE=self.real_columns_file):
+            self.assertEqual(
+                schema.read_schema_hash(self.db_path), schema.get_schema_hash()
+            )
+
+
 class TestParseColumnInfo(unittest.TestCase):
     @unittest.expectedFailure
     def test_parse_with_invalid_type(self):
@@ -573,6 +2320,36 @@ class TestParseColumnInfo(unittest.TestCase):
             }
         )
 
+    def test_parse_with_index(self):
+        "Try parsing column info with a plain index."
+
+        field = parse_column_info(
+            {
+                "column_name": "inverter_status",
+                "column_type": "integer",
+                "nullable": "N/A",
+                "default": 0,
+                "length": "N/A",
+                "index": "plain",
+            }
+        )
+        self.assertTrue(field.db_index)
+
+    @unittest.expectedFailure
+    def test_parse_with_invalid_index(self):
+        "Try parsing column info with an invalid index."
+
+        parse_column_info(
+            {
+                "column_name": "inverter_status",
+                "column_type": "integer",
+                "nullable": "N/A",
+                "default": 0,
+                "length": "N/A",
+                "index": "covering",
+            }
+        )
+
     @unittest.expectedFailure
     def test_parse_with_string_length(self):
         "Try parsing column info with an invalid column length."
@@ -640,3 +2417,206 @@ class TestParseColumnInfo(unittest.TestCase):
                 "length": 1,
             }
         )
+
+    def test_parse_with_scale(self):
+        "Try parsing column info of a float column with a scale."
+
+        field = parse_column_info(
+            {
+                "column_name": "grid_voltage_r",
+                "column_type": "float",
+                "nullable": True,
+                "default": "N/A",
+                "length": "N/A",
+                "scale": 1,
+            }
+        )
+        self.assertIsInstance(field, ScaledFloatField)
+        self.assertEqual(field.scale, 1)
+
+    @unittest.expectedFailure
+    def test_parse_with_scale_of_integer(self):
+        "Try parsing column info of an integer column with a scale."
+
+        parse_column_info(
+            {
+                "column_name": "inverter_status",
+                "column_type": "integer",
+                "nullable": "N/A",
+                "default": 0,
+                "length": "N/A",
+                "scale": 1,
+            }
+        )
+
+
+class ScaledFloatTests(APITestCase):
+    """Tests for the float columns stored as scaled integers."""
+
+    def test_round_trip(self):
+        field = ScaledFloatField(scale=1)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT %s", [field.get_db_prep_save(230.5, connection)])
+            ((value,),) = cursor.fetchall()
+
+        self.assertEqual(value, 2305)
+        self.assertEqual(field.from_db_value(value, None, connection), 230.5)
+        self.assertIsNone(field.get_db_prep_save(None, connection))
+
+    @isolate_apps("solax_registers")
+    def test_comparisons_between_units(self):
+        class Reading(Model):
+            voltage = ScaledFloatField(scale=1)
+
+        for lookup, bound, expected in (
+            ("gt", 230.05, 2300),
+            ("gte", 230.05, 2301),
+            ("lt", 230.05, 2301),
+            ("lte", 230.05, 2300),
+            ("gte", 230.1, 2301),
+            ("exact", 230.1, 2301),
+        ):
+            with self.subTest(lookup=lookup, bound=bound):
+                queryset = Reading.objects.filter(**{f"voltage__{lookup}": bound})
+                _, params = queryset.query.sql_with_params()
+                self.assertEqual(params, (expected,))
+
+        # No stored value equals a value between two units.
+        with self.assertRaises(EmptyResultSet):
+            Reading.objects.filter(voltage=230.05).query.sql_with_params()
+        queryset = Reading.objects.filter(voltage__in=[230.05, 230.1])
+        self.assertEqual(queryset.query.sql_with_params()[1], (2301,))
+        with self.assertRaises(EmptyResultSet):
+            Reading.objects.filter(voltage__in=[230.05]).query.sql_with_params()
+        # So every value differs from it.
+        queryset = Reading.objects.filter(Q(voltage__lt=230.05) | Q(voltage__gt=230.05))
+        self.assertEqual(queryset.query.sql_with_params()[1], (2301, 2300))
+
+    def test_writes_of_raw_values(self):
+        convert = imports._get_converter(ScaledFloatField(scale=2, default=1.5))
+        self.assertEqual(convert("230.25"), 23025)
+        self.assertEqual(convert(""), 150)
+
+        column = {"column_name": "grid_voltage_r", "column_type": "float", "scale": 1}
+        rows = generate_realistic_rows(
+            [{**column, "nullable": False}], datetime(2022, 1, 1), 10, timedelta(1)
+        )
+        self.assertTrue(all(isinstance(value, int) for _, value in rows))
+
+    def test_rescale_column(self):
+        # Values stored with one more decimal than the current scale.
+        field = DailyStatsRecord._meta.get_field("total_yield")
+        from_scale = getattr(field, "scale", 0) + 1
+        DailyStatsRecord.objects.create(upload_date=date(2022, 1, 1), total_yield=1005)
+        LastDayStatsRecord.objects.create(
+            upload_date=date(2022, 1, 1), total_yield=1005
+        )
+
+        call_command(
+            "rescale_column",
+            "daily_stats",
+            "total_yield",
+            f"--from-scale={from_scale}",
+            stdout=StringIO(),
+        )
+
+        self.assertEqual(DailyStatsRecord.objects.get().total_yield, 100.5)
+        self.assertEqual(LastDayStatsRecord.objects.get().total_yield, 100.5)
+
+
+class TestMetrics(APITestCase):
+    "Tests for the metrics endpoint"
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Set up test data."""
+
+        cls.testuser = User.objects.create(
+            username="testuser", is_staff=True, is_superuser=True
+        )
+
+    def setUp(self):
+        metrics_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(metrics_dir.cleanup)
+
+        settings_override = override_settings(METRICS_DIR=metrics_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_metrics(self):
+        self.client.force_login(self.testuser)
+        self.client.get(reverse_lazy("daily_stats"))
+
+        response = self.client.get(reverse_lazy("metrics"))
+        self.assertEqual(response.status_code, 200)
+
+        content = response.content.decode()
+        self.assertIn(
+            'solax_http_request_duration_seconds_count{endpoint="daily_stats",'
+            'method="GET"}',
+            content,
+        )
+        self.assertIn(
+            'solax_rows_returned_bucket{model="dailystatsrecord",le="0"}', content
+        )
+
+    def test_large_values_keep_their_precision(self):
+        self.client.force_login(self.testuser)
+        metrics.inc("solax_ingested_records_total", 1234567, model="precision")
+        metrics.inc("solax_ingested_records_total", 0.5, model="fraction")
+
+        content = self.client.get(reverse_lazy("metrics")).content.decode()
+
+        self.assertIn(
+            'solax_ingested_records_total{model="precision"} 1234567\n', content
+        )
+        self.assertIn('solax_ingested_records_total{model="fraction"} 0.5\n', content)
+        self.assertIn('le="1000000"', content)
+
+    def test_metrics_of_exited_workers(self):
+        metrics_dir = Path(settings.METRICS_DIR)
+        metrics_dir.mkdir(parents=True, exist_ok=True)
+        snapshot = {
+            "counters": [["solax_ingested_records_total", [["model", "exited"]], 2]],
+            "histograms": [],
+        }
+        for pid in (1, 2):
+            (metrics_dir / f"{pid}.json").write_text(json.dumps(snapshot))
+            metrics.merge_exited(metrics_dir, pid)
+
+        self.assertEqual(os.listdir(metrics_dir), [metrics.EXITED_FILE])
+        counters, _ = metrics.collect()
+        key = ("solax_ingested_records_total", (("model", "exited"),))
+        self.assertEqual(counters[key], 4)
+
+    def test_locked_database(self):
+        def locked(execute, sql, params, many, context):
+            time.sleep(0.01)
+            raise OperationalError("database is locked")
+
+        counters, _ = metrics.collect()
+        errors = counters[("solax_sqlite_busy_errors_total", ())]
+        wait = counters[("solax_sqlite_lock_wait_seconds_total", ())]
+
+        collector = QueryCollector()
+        with connection.execute_wrapper(collector), connection.execute_wrapper(locked):
+            with self.assertRaises(OperationalError):
+                User.objects.count()
+
+        self.assertEqual(collector.count, 1)
+        counters, _ = metrics.collect()
+        self.assertEqual(counters[("solax_sqlite_busy_errors_total", ())], errors + 1)
+        self.assertGreaterEqual(
+            counters[("solax_sqlite_lock_wait_seconds_total", ())], wait + 0.01
+        )
+
+        self.client.force_login(self.testuser)
+        content = self.client.get(reverse_lazy("metrics")).content.decode()
+        self.assertIn("solax_sqlite_busy_errors_total ", content)
+        self.assertIn("solax_sqlite_lock_wait_seconds_total ", content)
+
+    def test_metrics_without_staff_user(self):
+        self.client.force_login(User.objects.create(username="nonstaff"))
+
+        response = self.client.get(reverse_lazy("metrics"))
+        self.assertEqual(response.status_code, HTTP_403_FORBIDDEN)
@@ -1,8 +1,29 @@
 from django.urls import path
 
-from .views import DailyStats, MinuteStats
+from .views import (
+    BatchQuery,
+    DailyStats,
+    DailyStatsImport,
+    MinuteStats,
+    MinuteStatsAsOf,
+    MinuteStatsCoverage,
+    MinuteStatsImport,
+)
 
 urlpatterns = [
     path("minute-stats/", MinuteStats.as_view(), name="minute_stats"),
     path("daily-stats/", DailyStats.as_view(), name="daily_stats"),
+    path(
+        "minute-stats/import/",
+        MinuteStatsImport.as_view(),
+        name="minute_stats_import",
+    ),
+    path("minute-stats/as-of/", MinuteStatsAsOf.as_view(), name="minute_stats_as_of"),
+    path(
+        "minute-stats/coverage/",
+        MinuteStatsCoverage.as_view(),
+        name="minute_stats_coverage",
+    ),
+    path("daily-stats/import/", DailyStatsImport.as_view(), name="daily_stats_import"),
+    path("batch-query/", BatchQuery.as_view(), name="batch_query"),
 ]
@@ -5,26 +5,64 @@ from os import environ
 from string import ascii_lowercase
 from typing import Any, Literal
 
-from django.contrib.auth.models import User
+from django.conf import settings
 from django.db import models
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .fields import ScaledFloatField
 
 
 class ResponseException(Exception):
     pass
 
 
-def has_user_permission(
+class RenderedResponse(Response):
+    """A response whose JSON body was rendered before."""
+
+    def __init__(self, body: bytes, status: int):
+        super().__init__(status=status)
+        self.body = body
+
+    @property
+    def rendered_content(self) -> bytes:
+        self["Content-Type"] = JSONRenderer.media_type
+        return self.body
+
+
+def accepts_plain_json(request) -> bool:
+    """Return whether the response to a request is rendered as compact JSON."""
+
+    return (
+        type(request.accepted_renderer) is JSONRenderer
+        and request.accepted_media_type == JSONRenderer.media_type
+    )
+
+
+def get_row_budget(user) -> int:
+    """Return the most records one response to a user may hold, or 0 for no limit."""
+
+    return settings.USER_ROW_BUDGETS.get(user.get_username(), settings.ROW_BUDGET)
+
+
+def render_json(view, data) -> bytes:
+    """Render the data of a response of a view, as its JSON renderer would."""
+
+    request = view.request
+    return request.accepted_renderer.render(
+        data, request.accepted_media_type, view.get_renderer_context()
+    )
+
+
+def get_permission_string(
     appname: str,
     model: models.Model,
     action: Literal["view", "add", "change", "delete"],
-    user: User,
-):
-    """Check if a user has permission to perform a specified action."""
+) -> str:
+    """Return the permission string for an action on a model."""
 
     model_name = model.__name__
-
-    permission_string = appname + "." + action + "_" + model_name.lower()
-    return user.has_perm(permission_string)
+    return appname + "." + action + "_" + model_name.lower()
 
 
 def set_subtract(a: list, b: list) -> list:
@@ -33,7 +71,7 @@ def set_subtract(a: list, b: list) -> list:
     return list(diff)
 
 
-def parse_column_info(column_info: dict):
+def parse_column_info(column_info: dict, with_index: bool = True):
     """
     Return the appropriate Django field class for a column.
 
@@ -41,6 +79,8 @@ def parse_column_info(column_info: dict):
     ----------
     column_info : dict
         The information for a column.
+    with_index : bool
+        Whether to index the column if its information asks for a plain index.
 
     Raises
     ------
@@ -51,6 +91,8 @@ def parse_column_info(column_info: dict):
     COLTYPE = "column_type"
     IS_NULL = "nullable"
     LENGTH = "length"
+    INDEX = "index"
+    SCALE = "scale"
     COLUMN_CLASSES = {
         "positive_small_integer": models.PositiveSmallIntegerField,
         "small_integer": models.SmallIntegerField,
@@ -61,16 +103,36 @@ def parse_column_info(column_info: dict):
     _validate_column_type(column_info[COLTYPE], COLUMN_CLASSES)
     _validate_column_nullable(column_info[IS_NULL])
     _validate_column_length(column_info[LENGTH])
+    _validate_column_index(column_info.get(INDEX, "N/A"))
+    _validate_column_scale(column_info.get(SCALE, "N/A"), column_info[COLTYPE])
 
     column_class = COLUMN_CLASSES[column_info[COLTYPE]]
     kwargs = {**column_info}
     kwargs["null"] = kwargs.pop("nullable")
     kwargs["max_length"] = kwargs.pop("length")
     kwargs = _filter_args(kwargs, ["null", "default", "max_length"])
+    if with_index and column_info.get(INDEX) == "plain":
+        kwargs["db_index"] = True
+    if column_info.get(SCALE, "N/A") != "N/A":
+        column_class = ScaledFloatField
+        kwargs["scale"] = column_info[SCALE]
 
     return column_class(**kwargs)
 
 
+def get_column_indexes(columns: list, date_column: str) -> list:
+    """
+    Return the composite indexes of the columns asking for one, each on the
+    column and then on the time key.
+    """
+
+    return [
+        models.Index(fields=[column["column_name"], date_column])
+        for column in columns
+        if column.get("index") == "composite"
+    ]
+
+
 def _validate_column_type(column_type: Any, column_classes: dict):
     if column_type not in column_classes:
         error_msg = f"Invalid column type; must be {'or'.join(column_classes.keys())}"
@@ -89,6 +151,20 @@ def _validate_column_length(length: Any):
         raise ValueError("Invalid column length; must be a positive number")
 
 
+def _validate_column_index(index: Any):
+    if index not in ("N/A", "plain", "composite"):
+        raise ValueError("Invalid column index; must be 'plain', 'composite', or 'N/A'")
+
+
+def _validate_column_scale(scale: Any, column_type: str):
+    if scale == "N/A":
+        return
+    if column_type != "float":
+        raise ValueError("Only float columns can have a scale")
+    if isinstance(scale, bool) or not isinstance(scale, int) or not 0 <= scale <= 6:
+        raise ValueError("Invalid column scale; must be an integer from 0 to 6")
+
+
 def _filter_args(column_info: dict, args: list):
     result = {}
     for arg in args:
@@ -1,19 +1,31 @@
+from datetime import datetime
+
 from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import OpenApiExample, extend_schema
 from rest_framework.generics import ListAPIView
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.status import HTTP_200_OK
+from rest_framework.views import APIView
 
-from .create_views import create_views
+from . import batch, metrics, profiling, snapshots
+from .constants import documentation, response_templates
+from .create_views import (
+    create_as_of_view,
+    create_coverage_view,
+    create_import_view,
+    create_views,
+)
 from .serializers import (
     DailyStatsSerializer,
     LastDayStatsSerializer,
     LastMinuteStatsSerializer,
     MinuteStatsSerializer,
 )
+from .utils import catch400
 
 DailyStats = create_views(
     upload_date_column="upload_date",
@@ -39,6 +51,65 @@ MinuteStats = create_views(
     use_datetime=True,
 )
 
+DailyStatsImport = create_import_view(
+    "daily_stats", summary="Import daily stats from a CSV or NDJSON file."
+)
+
+MinuteStatsImport = create_import_view(
+    "minute_stats", summary="Import minute stats from a CSV or NDJSON file."
+)
+
+MinuteStatsAsOf = create_as_of_view(
+    "minute_stats", summary="Get the minute stats as of a list of timestamps."
+)
+
+MinuteStatsCoverage = create_coverage_view(
+    "minute_stats", summary="Get the gaps and the completeness of the minute stats."
+)
+
+
+class BatchQuery(profiling.ProfiledViewMixin, APIView):
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        request=OpenApiTypes.OBJECT,
+        responses={
+            200: OpenApiTypes.OBJECT,
+            400: OpenApiTypes.OBJECT,
+            403: OpenApiTypes.OBJECT,
+            429: OpenApiTypes.OBJECT,
+        },
+        examples=[
+            OpenApiExample(
+                name="Today and the same day last week",
+                request_only=True,
+                value={
+                    "queries": [
+                        {
+                            "table": "minute_stats",
+                            "since": "2024-06-08T00:00Z",
+                            "before": "2024-06-09T00:00Z",
+                            "fields": ["upload_time", "dc_solar_power"],
+                        },
+                        {
+                            "table": "minute_stats",
+                            "since": "2024-06-01T00:00Z",
+                            "before": "2024-06-02T00:00Z",
+                            "aggregate": {"max": ["dc_solar_power"]},
+                        },
+                        {"table": "daily_stats"},
+                    ]
+                },
+            )
+        ],
+        summary="Run several stats queries on one snapshot of the database",
+    )
+    @catch400
+    def post(self, request):
+        data = request.data if isinstance(request.data, dict) else {}
+        results = batch.run_batch(request, data.get("queries"))
+        return Response({"results": results}, HTTP_200_OK)
+
 
 class Healthz(ListAPIView):
     permission_classes = [AllowAny]
@@ -52,6 +123,56 @@ class Healthz(ListAPIView):
         return Response("healthy", HTTP_200_OK)
 
 
+class Metrics(APIView):
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        responses={(200, "text/plain"): OpenApiTypes.STR},
+        summary="Prometheus metrics of all the workers",
+    )
+    def get(self, _):
+        return HttpResponse(
+            metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
+
+
+class Snapshot(APIView):
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        parameters=documentation.SNAPSHOT_PARAMETERS,
+        responses={
+            (200, "application/vnd.sqlite3"): OpenApiTypes.BINARY,
+            (200, "application/gzip"): OpenApiTypes.BINARY,
+            400: OpenApiTypes.OBJECT,
+            503: OpenApiTypes.OBJECT,
+        },
+        summary="A consistent copy of the database",
+    )
+    def get(self, request):
+        compress = request.query_params.get("compress") or "true"
+        if compress not in ("true", "false"):
+            return response_templates.INVALID_COMPRESS_PARAM
+        compress = compress == "true"
+
+        try:
+            snapshot = snapshots.create_temporary_snapshot()
+        except snapshots.SnapshotBusy:
+            return response_templates.SNAPSHOT_BUSY
+        filename = datetime.now().strftime("solax-%Y%m%dT%H%M%S.sqlite3")
+        content_type = "application/vnd.sqlite3"
+        if compress:
+            filename += ".gz"
+            content_type = "application/gzip"
+
+        response = StreamingHttpResponse(
+            snapshots.read_snapshot(snapshot, compress),
+            content_type=content_type,
+        )
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
 def index(request):
     version = settings.SPECTACULAR_SETTINGS["VERSION"]
     return render(request, "solax_registers/home.html", {"version": version})
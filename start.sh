@@ -73,9 +73,12 @@ host=${1:-"localhost"}
 port=${2:-"8000"}
 
 
-echo "Setting up database..."
-python3 manage.py makemigrations solax_registers || exit 1
-python3 manage.py migrate || exit 1
+# The gunicorn on_starting hook migrates the database if its schema changed. A
+# new user or a prestart command needs it migrated before gunicorn starts.
+if [ $create_user = 1 ] || [ -n "$prestart" ]; then
+  echo "Setting up database..."
+  ${PYTHON} -m solax_registers.schema || exit 1
+fi
 
 # Create superuser credentials if needed
 if [ $create_user = 1 ]; then